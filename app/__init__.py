@@ -22,7 +22,8 @@ celery = Celery(
 )
 db = SQLAlchemy()
 login_manager = LoginManager()
-cache = Cache(config={"CACHE_TYPE": "simple"})
+# Configured by CACHE_* settings in config.py
+cache = Cache()
 
 
 def create_app(config_name="default"):
@@ -39,6 +40,12 @@ def create_app(config_name="default"):
     login_manager.login_view = "auth.login"
     migrate = Migrate(app, db)
     celery.conf.update(app.config)
+    celery.conf.beat_schedule = {
+        "warm-caches": {
+            "task": "app.checker.views.warm_caches",
+            "schedule": app.config["CACHE_WARM_INTERVAL"],
+        },
+    }
     cache.init_app(app)
 
     from app import models
@@ -64,6 +71,12 @@ def create_app(config_name="default"):
     from .cli.dataset import datasetbp
 
     app.register_blueprint(datasetbp)
+    from .cli.atlas_snapshot import snapshotbp
+
+    app.register_blueprint(snapshotbp)
+    from .cli.standardizer import standardizerbp
+
+    app.register_blueprint(standardizerbp)
 
     @app.before_first_request
     def setup_logging():
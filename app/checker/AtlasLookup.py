@@ -0,0 +1,92 @@
+import logging
+from typing import Dict, Hashable, Set
+
+from app.utils import atlas_api
+
+# atlas_api functions the checker relies on
+ENDPOINTS = ("search_inchikey", "search_name", "get_compound", "search_taxa")
+# Lookups a local AtlasSnapshot can answer instead of the API
+SNAPSHOT_ENDPOINTS = ("search_inchikey", "search_name", "search_taxa")
+
+
+class AtlasLookup:
+    """Atlas API lookups for a checker run
+
+    Lookups are queued while the checker builds its compounds, then
+    resolved together over a bounded thread pool by `prefetch`.
+    Anything that was not prefetched falls back to a live API call,
+    so the checker rules behave the same either way.
+
+    If given an AtlasSnapshot, structure, name and taxon searches are
+    answered from it locally and never touch the API.
+    """
+
+    def __init__(
+        self, max_workers: int = atlas_api.MAX_WORKERS, logger=None, snapshot=None
+    ):
+        self.max_workers = max_workers
+        self.snapshot = snapshot
+        self.logger = logger or logging.getLogger(__name__)
+        self._queued: Dict[str, Set[Hashable]] = {x: set() for x in ENDPOINTS}
+        self._results: Dict[str, Dict] = {x: {} for x in ENDPOINTS}
+
+    def _from_snapshot(self, endpoint: str) -> bool:
+        return self.snapshot is not None and endpoint in SNAPSHOT_ENDPOINTS
+
+    def version(self) -> str:
+        """Identifies the Atlas data lookups are answered from. Checker
+        results are only reusable while this stays the same.
+        """
+        if self.snapshot is not None:
+            meta = self.snapshot.meta
+            # Snapshot covers searches, get_compound still goes to the API
+            return "snapshot:{}:{}".format(
+                meta.get("built_at"), atlas_api.cache_generation()
+            )
+        return "api:{}".format(atlas_api.cache_generation())
+
+    def queue(self, endpoint: str, key: Hashable):
+        if self._from_snapshot(endpoint):
+            return
+        if key is not None and key not in self._results[endpoint]:
+            self._queued[endpoint].add(key)
+
+    def prefetch(self):
+        """Resolve every queued lookup concurrently"""
+        for endpoint, keys in self._queued.items():
+            if not keys:
+                continue
+            self.logger.info("Prefetching %d %s lookups", len(keys), endpoint)
+            if endpoint == "search_inchikey":
+                res = atlas_api.search_inchikeys_bulk(
+                    keys, max_workers=self.max_workers, return_exceptions=True
+                )
+            else:
+                fn = getattr(atlas_api, endpoint)
+                res = atlas_api.map_concurrent(fn, keys, max_workers=self.max_workers)
+            self._results[endpoint].update(res)
+            keys.clear()
+
+    def _lookup(self, endpoint: str, key: Hashable):
+        if self._from_snapshot(endpoint):
+            return getattr(self.snapshot, endpoint)(key)
+        results = self._results[endpoint]
+        if key not in results:
+            results[key] = getattr(atlas_api, endpoint)(key)
+        res = results[key]
+        # Failed lookups re-raise at the point the checker would have called
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def search_inchikey(self, structure: str):
+        return self._lookup("search_inchikey", structure)
+
+    def search_name(self, name: str):
+        return self._lookup("search_name", name)
+
+    def get_compound(self, npaid: int):
+        return self._lookup("get_compound", npaid)
+
+    def search_taxa(self, taxon: str):
+        return self._lookup("search_taxa", taxon)
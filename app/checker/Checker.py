@@ -1,110 +1,460 @@
+import hashlib
+import json
 import logging
 import re
 
-from app import db
+from app import config, db
+from app.checker.AtlasLookup import AtlasLookup
+from app.checker.JournalResolver import get_resolver
 from app.checker.NameString import NameString, decapitalize_first
 from app.checker.ResolveEnum import ResolveEnum
 from app.models import (
+    Article,
     CheckerArticle,
     CheckerCompound,
+    CheckerDataset,
     Dataset,
-    Journal,
     Problem,
     Retraction,
     Taxon,
+    TaxonAlternative,
+    keep_loaded,
 )
-from app.utils import atlas_api
-from app.utils.Compound import Compound, inchikey_from_smiles
+from app.utils import atlas_api, progress, structure_processing
+from app.utils.Compound import inchikey_from_smiles
+from app.utils.structure_processing import process_structure, process_structures
 
 
 class Checker:
+    # Progress counts each article once when it's prepared and once when
+    # it's checked
+    STAGES = 2
+
     def __init__(self, dataset_id, *args, **kwargs):
         self.dataset_id = dataset_id
 
         self.task = kwargs.get("celery_task", None)
         self.logger = kwargs.get("logger") or self.default_logger()
+        self.progress = kwargs.get("progress") or progress.ProgressReporter(
+            progress.channel_name("checker", dataset_id),
+            task=self.task,
+            logger=self.logger,
+        )
 
         self.review_list = []
+        # Problems are written in chunks, as they are found if streaming
+        self.stream_problems = kwargs.get("stream_problems", False)
+        self.problem_chunk_size = kwargs.get(
+            "problem_chunk_size", config.CHECKER_PROBLEM_CHUNK_SIZE
+        )
+        self._saved_problems = 0
+        # Articles handled per transaction
+        self.batch_size = kwargs.get("batch_size", config.CHECKER_BATCH_SIZE)
+        self.structure_workers = kwargs.get(
+            "structure_workers", structure_processing.MAX_WORKERS
+        )
         self.checked_compound_inchikeys = dict()
-        self._journals = []
+        self._journals = None
+        self._retractions = None
+        self._taxon_alternatives = None
+        # Incremental re-runs: content fingerprints of this run's rows,
+        # rows that needn't be re-checked and their still open problems
+        self.atlas_version = None
+        self._fingerprints = dict()
+        self._unchanged = set()
+        self._open_problems = dict()
+        # Compound id -> article id, saves a lazy load per problem
+        self._compound_articles = dict()
+        # When checking one chunk of a dataset, internal duplicates are
+        # found afterwards across every chunk (see finish_chunks)
+        self.defer_duplicates = False
+        # Compound id -> article id, a dict as batches may be retried
+        self._duplicate_candidates = dict()
+        self.atlas = AtlasLookup(
+            max_workers=kwargs.get("max_workers", atlas_api.MAX_WORKERS),
+            logger=self.logger,
+            snapshot=kwargs.get("snapshot"),
+        )
+
+    @property
+    def retractions(self):
+        """Retractions table, loaded once per run"""
+        if self._retractions is None:
+            self._retractions = RetractionIndex.load()
+        return self._retractions
+
+    @property
+    def taxon_alternatives(self):
+        """Alternative taxon names, loaded once per run"""
+        if self._taxon_alternatives is None:
+            self._taxon_alternatives = TaxonAlternativeIndex.load()
+        return self._taxon_alternatives
 
     @property
-    def atlas_journals(self):
-        """Memoized copy of Journal titles in Atlas"""
-        if not self._journals:
-            self._journals = atlas_api.get_journals()
+    def journals(self):
+        """Journal tables and Atlas journal titles, loaded once per run"""
+        if self._journals is None:
+            self._journals = get_resolver()
         return self._journals
 
     def update_status(self, current, total, status):
-        if self.task:
-            self.task.update_state(
-                state="PROGRESS",
-                meta={"current": current, "total": total, "status": status},
-            )
-        self.logger.info("PROGRESS: {}/{}\nStatus: {}".format(current, total, status))
-
-    def run(self, standardize_compounds=False, restart=False):
-        self.logger.info("Setting up dataset")
-        dataset = Dataset.query.get_or_404(self.dataset_id)
-        total = len(dataset.articles)
+        # Throttled, see ProgressReporter
+        self.progress.update(current, total, status)
 
-        for i, article in enumerate(dataset.get_articles()):
+    def run(self, standardize_compounds=False, restart=False, prefetch=True):
+        """Check every curated article and compound in the dataset
 
-            # Safely skip over previously retracted articles
-            if self.check_reject_article(article):
-                article.is_nparticle = False
-                commit()
+        Checker rows are built first, then (if prefetch) every Atlas API
+        lookup the dataset needs is resolved concurrently before the
+        checker rules run against the results. Database writes are
+        committed once per batch of articles.
 
-            # Skip over articles which are not properly curated
-            if not article.completed or article.needs_work or not article.is_nparticle:
-                self.logger.warning("Skipping article {}".format(article.id))
-                continue
+        On restart, articles and compounds whose curated data and Atlas
+        version match their last check are not checked again; their
+        unresolved problems are carried over instead.
+        """
+        self.logger.info("Setting up dataset")
+        with keep_loaded():
+            self._run(standardize_compounds, restart, prefetch)
+
+    def _run(self, standardize_compounds, restart, prefetch):
+        dataset = Dataset.load_full(self.dataset_id)
+        if restart:
+            self._open_problems = self.load_open_problems(dataset.problems)
+        if self.stream_problems:
+            self.clear_problems()
+
+        self.check_articles(
+            list(dataset.articles), standardize_compounds, restart, prefetch
+        )
 
-            check_art = self.create_checker_article(article, restart=restart)
+        self.logger.info("Done checking!")
+        self.logger.info("There are %d problems to review", len(self.review_list))
+        self.save_review_list()
+        dataset.checker_dataset.completed = True
+        dataset.checker_dataset.running = False
+        commit()
+        self.progress.finish("Done checking")
 
-            self.update_status(i, total, check_art.doi)
-            self.check_article(check_art)
+    def run_chunk(
+        self, article_ids, standardize_compounds=False, restart=False, prefetch=True
+    ):
+        """Check some of the dataset's articles, as one of several
+        workers checking a dataset in parallel
 
-            for compound in article.compounds:
-                check_compound = self.create_checker_compound(
-                    compound, standardize=standardize_compounds, restart=restart
-                )
-                if (
-                    check_compound.inchikey
-                    not in self.checked_compound_inchikeys.keys()
-                ):
-                    self.checked_compound_inchikeys[check_compound.inchikey] = [
-                        check_compound.id
-                    ]
-                else:
-                    self.checked_compound_inchikeys[check_compound.inchikey].append(
-                        check_compound.id
+        Nothing is written to the problems table and internal duplicates
+        aren't looked for, as both need every chunk; instead the chunk's
+        results are returned (as plain data) for finish_chunks.
+        """
+        self.defer_duplicates = True
+        self.stream_problems = False
+        with keep_loaded():
+            articles = Article.load_many(article_ids)
+            if restart:
+                self._open_problems = self.load_open_problems(
+                    Problem.query.filter(
+                        Problem.dataset_id == self.dataset_id,
+                        Problem.article_id.in_(article_ids),
                     )
-                self.check_compound(check_compound)
-                # Add the checked list after checking complete
+                )
+            self.check_articles(articles, standardize_compounds, restart, prefetch)
+        # Only the last step, in finish_chunks, finishes the run
+        total = self.progress.total
+        self.progress.update(total, total, "Done checking part", force=True)
+        return {
+            "articles": len(articles),
+            "problems": [
+                (p.article_id, p.problem, p.compound_id) for p in self.review_list
+            ],
+            "compounds": [
+                (compound_id, inchikey)
+                for inchikey, ids in self.checked_compound_inchikeys.items()
+                for compound_id in ids
+            ],
+            "duplicate_candidates": list(self._duplicate_candidates.items()),
+        }
+
+    def finish_chunks(self, results):
+        """Combine the results of run_chunk for every chunk of the
+        dataset, in dataset order: flag internal duplicates across the
+        chunks and save the problems"""
+        total = self.STAGES * sum(result["articles"] for result in results)
+        self.update_status(total, total, "Saving problems")
+        compounds = []
+        candidates = []
+        for result in results:
+            self.review_list.extend(Correction(*p) for p in result["problems"])
+            compounds.extend(result["compounds"])
+            candidates.extend(result["duplicate_candidates"])
+        for compound_id, article_id in find_internal_duplicates(compounds, candidates):
+            self.add_problem(article_id, "internal_duplicate", comp_id=compound_id)
 
-        self.logger.info("Done checking!")
         self.logger.info("There are %d problems to review", len(self.review_list))
         self.save_review_list()
-        dataset.checker_dataset.completed = True
-        dataset.checker_dataset.running = False
+        checker_dataset = CheckerDataset.query.filter_by(
+            dataset_id=self.dataset_id
+        ).first()
+        checker_dataset.completed = True
+        checker_dataset.running = False
         commit()
+        self.progress.finish("Done checking")
+
+    def check_articles(self, articles, standardize_compounds, restart, prefetch):
+        """Create and check the checker rows for articles and their
+        compounds, adding any problems found to the review list"""
+        total = len(articles)
+        # One counter through both stages, so progress never goes back
+        steps = self.STAGES * total
+        self.atlas_version = self.atlas.version()
+
+        self.update_status(0, steps, "Processing structures")
+        structures = self.process_structures(
+            articles, standardize=standardize_compounds, restart=restart
+        )
 
-    def save_review_list(self):
+        def prepare(item):
+            i, article = item
+            return self.prepare_article(
+                article,
+                i,
+                steps,
+                standardize=standardize_compounds,
+                restart=restart,
+                structures=structures,
+            )
+
+        checker_articles = [
+            x for x in self._run_batched(list(enumerate(articles)), prepare) if x
+        ]
+        for _, check_compounds in checker_articles:
+            for check_compound in check_compounds:
+                self.checked_compound_inchikeys.setdefault(
+                    check_compound.inchikey, []
+                ).append(check_compound.id)
+        for _, check_compounds in checker_articles:
+            for check_compound in check_compounds:
+                if not self.can_skip_compound(check_compound):
+                    self.queue_lookups(check_compound)
+        self.logger.info(
+            "%d articles and compounds unchanged since last check",
+            len(self._unchanged),
+        )
+
+        if prefetch:
+            self.update_status(total, steps, "Querying NP Atlas")
+            self.atlas.prefetch()
+
+        # Skipped articles have nothing left to check
+        checked_before = steps - len(checker_articles)
+
+        def check(item):
+            i, (check_art, check_compounds) = item
+            self.update_status(checked_before + i, steps, check_art.doi)
+            self.progress.add("compounds", len(check_compounds))
+            if ("article", check_art.id) in self._unchanged:
+                self.carry_over_problems("article", check_art.id)
+            else:
+                self.check_article(check_art)
+                self.mark_checked(check_art, "article")
+            for check_compound in check_compounds:
+                if self.can_skip_compound(
+                    check_compound
+                ) and not self.check_reject_compound(check_compound):
+                    self.carry_over_problems("compound", check_compound.id)
+                    if self.defer_duplicates and not check_compound.resolve:
+                        self.defer_duplicate_check(check_compound)
+                else:
+                    self.check_compound(check_compound)
+                    self.mark_checked(check_compound, "compound")
+
+        self._run_batched(list(enumerate(checker_articles)), check)
+
+    def process_structures(self, articles, standardize=False, restart=False):
+        """Run the RDKit work for every compound that needs a new checker row
+        in worker processes. Returns a dict of compound id -> StructureRecord.
+        """
+        compounds = [
+            compound
+            for article in articles
+            if article.completed and not article.needs_work and article.is_nparticle
+            for compound in article.compounds
+            if not (restart and compound.checker_compound)
+        ]
+        records = process_structures(
+            [(c.smiles, regularize_name(c.name)) for c in compounds],
+            standardize=standardize,
+            max_workers=self.structure_workers,
+        )
+        return {c.id: record for c, record in zip(compounds, records)}
+
+    def prepare_article(
+        self, article, i, total, standardize=False, restart=False, structures=None
+    ):
+        """Create checker rows for an article and its compounds.
+        Returns (checker_article, [checker_compounds]), or None if skipped.
+        """
+        structures = structures or {}
+        # Safely skip over previously retracted articles
+        if self.check_reject_article(article):
+            article.is_nparticle = False
+
+        # Skip over articles which are not properly curated
+        if not article.completed or article.needs_work or not article.is_nparticle:
+            self.logger.warning("Skipping article {}".format(article.id))
+            return None
+
+        fingerprint = article_fingerprint(article)
+        self._fingerprints[("article", article.id)] = fingerprint
+        previous = article.checker_article
+        # Rows from before fingerprinting are reused as they are
+        reuse = (
+            restart
+            and previous is not None
+            and previous.fingerprint in (None, fingerprint)
+        )
+        if reuse and self.is_unchanged(previous, fingerprint):
+            self._unchanged.add(("article", article.id))
+        check_art = self.create_checker_article(article, restart=reuse)
+        self.update_status(i, total, "Preparing {}".format(check_art.doi))
+
+        for compound in article.compounds:
+            self._compound_articles[compound.id] = article.id
+        check_compounds = [
+            self.create_checker_compound(
+                compound,
+                standardize=standardize,
+                restart=restart,
+                structure=structures.get(compound.id),
+            )
+            for compound in article.compounds
+        ]
+        return check_art, check_compounds
+
+    def article_id(self, checker_compound):
+        article_id = self._compound_articles.get(checker_compound.id)
+        return article_id or checker_compound.get_article_id()
+
+    def is_unchanged(self, checker_row, fingerprint):
+        """A row needs no re-check if neither its curated data nor the
+        Atlas data it was checked against have changed since"""
+        return (
+            checker_row.fingerprint == fingerprint
+            and checker_row.checked_against == self.atlas_version
+        )
+
+    def can_skip_compound(self, checker_compound):
+        # Internal duplicates depend on the rest of the dataset, so are
+        # either checked again or left to finish_chunks
+        if ("compound", checker_compound.id) not in self._unchanged:
+            return False
+        ids = self.checked_compound_inchikeys.get(checker_compound.inchikey, [])
+        return self.defer_duplicates or len(ids) == 1
+
+    def mark_checked(self, checker_row, kind):
+        checker_row.fingerprint = self._fingerprints.get((kind, checker_row.id))
+        checker_row.checked_against = self.atlas_version
+
+    @staticmethod
+    def load_open_problems(problems):
+        """Unresolved problems from the last run, keyed by the
+        ("article"|"compound", id) they belong to"""
+        open_problems = dict()
+        for p in problems:
+            if p.resolved:
+                continue
+            if p.compound_id:
+                key = ("compound", p.compound_id)
+            else:
+                key = ("article", p.article_id)
+            open_problems.setdefault(key, []).append(
+                Correction(p.article_id, p.problem, p.compound_id)
+            )
+        return open_problems
+
+    def carry_over_problems(self, kind, row_id):
+        problems = self._open_problems.get((kind, row_id), [])
+        if self.defer_duplicates:
+            # Flagged again by finish_chunks if still duplicated
+            problems = [p for p in problems if p.problem != "internal_duplicate"]
+        self.review_list.extend(problems)
+
+    def defer_duplicate_check(self, checker_compound):
+        self._duplicate_candidates[checker_compound.id] = self.article_id(
+            checker_compound
+        )
+
+    def _run_batched(self, items, fn):
+        """Call fn on each item, committing once per batch of items.
+        A batch that fails is rolled back and retried one item at a time,
+        so a bad item can't take its neighbours down with it.
+        Returns the results of fn in order.
+        """
+        results = []
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start : start + self.batch_size]
+            mark = len(self.review_list)
+            try:
+                results.extend(self._commit_batch(batch, fn))
+            except Exception as e:
+                self.logger.warning("Batch failed (%s), retrying one by one", e)
+                self._rollback_to(mark)
+                for item in batch:
+                    mark = len(self.review_list)
+                    try:
+                        results.extend(self._commit_batch([item], fn))
+                    except Exception:
+                        self._rollback_to(mark)
+                        raise
+        return results
+
+    def _commit_batch(self, batch, fn):
+        results = [fn(item) for item in batch]
+        unsaved = len(self.review_list) - self._saved_problems
+        if self.stream_problems and unsaved >= self.problem_chunk_size:
+            # Save problems in the same transaction as the rows they refer to
+            self._insert_problems(self.review_list[self._saved_problems :])
+            commit()
+            self._saved_problems = len(self.review_list)
+        else:
+            commit()
+        return results
+
+    def _rollback_to(self, mark):
+        db.session.rollback()
+        del self.review_list[mark:]
+
+    def clear_problems(self):
         Problem.query.filter_by(dataset_id=self.dataset_id).delete()
         commit()
-        for corr in self.review_list:
-            prob = Problem(
-                dataset_id=self.dataset_id,
-                problem=corr.problem,
-                article_id=corr.article_id,
-                compound_id=corr.compound_id,
-            )
 
-            db_add_commit(prob)
+    def save_review_list(self):
+        """Replace the dataset's problems with the review list
+        (or write the remainder, if problems were streamed)"""
+        if self.stream_problems:
+            self._insert_problems(self.review_list[self._saved_problems :])
+        else:
+            Problem.query.filter_by(dataset_id=self.dataset_id).delete()
+            self._insert_problems(self.review_list)
+        commit()
+        self._saved_problems = len(self.review_list)
 
         self.logger.info("Saved %d problems to DB", len(self.review_list))
 
+    def _insert_problems(self, corrections):
+        for i in range(0, len(corrections), self.problem_chunk_size):
+            db.session.bulk_insert_mappings(
+                Problem,
+                [
+                    dict(
+                        dataset_id=self.dataset_id,
+                        problem=corr.problem,
+                        article_id=corr.article_id,
+                        compound_id=corr.compound_id,
+                    )
+                    for corr in corrections[i : i + self.problem_chunk_size]
+                ],
+            )
+
     def check_article(self, checker_article):
         if not checker_article.resolved:
             self.check_doi(checker_article)
@@ -117,14 +467,9 @@ class Checker:
             self.check_authors(checker_article)
             self.check_title(checker_article)
             self.check_abstract(checker_article)
-            commit()
 
     def check_reject_article(self, article):
-        return (
-            bool(Retraction.query.filter_by(article_doi=article.doi).first())
-            if article.doi
-            else None
-        )
+        return self.retractions.has_doi(article.doi) if article.doi else None
 
     def check_compound(self, checker_compound):
         """
@@ -136,16 +481,18 @@ class Checker:
         """
         if self.check_reject_compound(checker_compound):
             checker_compound.resolve = ResolveEnum.REJECT.value
-            commit()
 
         # If this compound has been checked and resolve don't worry about it's structure
         if not checker_compound.resolve:
             # Check internally if compound has been seen before
+            # Only the first compound with a given InChIKey is not a duplicate
             id_list = self.checked_compound_inchikeys.get(checker_compound.inchikey)
-            if len(id_list) != 1:
+            if self.defer_duplicates:
+                self.defer_duplicate_check(checker_compound)
+            elif id_list[0] != checker_compound.id:
                 self.logger.error("Internal redundancy of compounds!")
                 self.add_problem(
-                    checker_compound.get_article_id(),
+                    self.article_id(checker_compound),
                     "internal_duplicate",
                     comp_id=checker_compound.id,
                 )
@@ -158,7 +505,7 @@ class Checker:
                 if self.compound_flat_match(checker_compound):
                     if self.compound_full_match(checker_compound):
                         self.add_problem(
-                            checker_compound.get_article_id(),
+                            self.article_id(checker_compound),
                             "duplicate",
                             comp_id=checker_compound.id,
                         )
@@ -167,7 +514,7 @@ class Checker:
                     # Only if there is a longest substring match
                     elif self.longest_substring_name_match(checker_compound):
                         self.add_problem(
-                            checker_compound.get_article_id(),
+                            self.article_id(checker_compound),
                             "flat_match",
                             comp_id=checker_compound.id,
                         )
@@ -176,7 +523,7 @@ class Checker:
                 # Check for name match (ignores "Not named")
                 if self.compound_name_match(checker_compound) and not problem_here:
                     self.add_problem(
-                        checker_compound.get_article_id(),
+                        self.article_id(checker_compound),
                         "name_match",
                         comp_id=checker_compound.id,
                     )
@@ -187,14 +534,14 @@ class Checker:
                 if self.npaid_changed(checker_compound):
                     if self.compound_full_match(checker_compound):
                         self.add_problem(
-                            checker_compound.get_article_id(),
+                            self.article_id(checker_compound),
                             "duplicate",
                             comp_id=checker_compound.id,
                         )
                     # Impose strict verification for flat matches
                     else:
                         self.add_problem(
-                            checker_compound.get_article_id(),
+                            self.article_id(checker_compound),
                             "flat_match",
                             comp_id=checker_compound.id,
                         )
@@ -202,17 +549,23 @@ class Checker:
                     checker_compound.resolve = ResolveEnum.UPDATE.value
 
         self.check_source_organism(checker_compound)
-        commit()
+
+    def queue_lookups(self, checker_compound):
+        """Queue every Atlas lookup check_compound could need for prefetching"""
+        atlas = self.atlas
+        if not checker_compound.resolve:
+            atlas.queue("search_inchikey", checker_compound.inchikey)
+            if checker_compound.npaid:
+                atlas.queue("get_compound", checker_compound.npaid)
+            else:
+                atlas.queue("search_inchikey", checker_compound.inchikey.split("-")[0])
+                if checker_compound.name != "Not named":
+                    atlas.queue("search_name", checker_compound.name)
+                    atlas.queue("search_name", longest_substring(checker_compound.name))
+        atlas.queue("search_taxa", checker_compound.source_genus)
 
     def check_reject_compound(self, compound):
-        res = Retraction.query.filter(
-            Retraction.compound_inchikey == compound.inchikey
-        ).all()
-        if not res:
-            res = Retraction.query.filter(
-                Retraction.compound_name == compound.name
-            ).all()
-        return bool(res)
+        return self.retractions.has_compound(compound.inchikey, compound.name)
 
     @staticmethod
     def create_checker_article(article, standardize=False, restart=False):
@@ -220,7 +573,7 @@ class Checker:
         if not restart:
             if article.checker_article:
                 db.session.delete(article.checker_article)
-                commit()
+                db.session.flush()
             check_art = CheckerArticle(
                 id=article.id,
                 pmid=article.pmid,
@@ -236,20 +589,30 @@ class Checker:
                 abstract=clean_whitespace(article.abstract),
             )
 
-            db_add_commit(check_art)
+            db.session.add(check_art)
         else:
             check_art = article.checker_article
 
         return check_art
 
-    def create_checker_compound(self, db_compound, standardize=False, restart=False):
+    def create_checker_compound(
+        self, db_compound, standardize=False, restart=False, structure=None
+    ):
+        """Create (or when restarting, reuse) the checker row for a compound.
+        structure is a precomputed StructureRecord, or it's computed here.
+        """
         # If restarting check if anything was changed in the dataset
         restart_changed = False
-        if (
-            restart
-            and db_compound.checker_compound
-            and not db_compound.checker_compound.resolve
-        ):
+        previous = db_compound.checker_compound
+        fingerprint = compound_fingerprint(db_compound)
+        self._fingerprints[("compound", db_compound.id)] = fingerprint
+        if restart and previous and previous.fingerprint is not None:
+            if previous.fingerprint != fingerprint:
+                self.logger.warning("Re-creating compound because it changed!")
+                restart_changed = True
+            elif self.is_unchanged(previous, fingerprint):
+                self._unchanged.add(("compound", db_compound.id))
+        elif restart and previous and not previous.resolve:
             if (
                 inchikey_from_smiles(db_compound.smiles)
                 != db_compound.checker_compound.inchikey
@@ -260,38 +623,39 @@ class Checker:
         # Start fresh if not restarting
         if (db_compound.checker_compound and not restart) or restart_changed:
             db.session.delete(db_compound.checker_compound)
-            commit()
+            db.session.flush()
+
+        if restart and db_compound.checker_compound and not restart_changed:
+            return db_compound.checker_compound
 
         # Regularize the name
         # Especially important for "not named" or similar
-        reg_name = NameString(db_compound.name)
-        reg_name.regularize_name()
+        name = regularize_name(db_compound.name)
 
-        # Currently not standardizing because it takes ~10x longer
+        # Only standardizing when asked, through PubChem it takes ~10x
+        # longer (SMILES_STANDARDIZER=rdkit does it locally instead)
         # compounds are pre-standardized
-        reg_compound = Compound(
-            db_compound.smiles, name=reg_name.get_name(), standardize=standardize
-        )
-        reg_compound.cleanStructure()
-
-        genus, species = split_source_organism(db_compound.source_organism)
-        if not restart or restart_changed:
-            check_compound = CheckerCompound(
-                id=db_compound.id,
-                name=clean_whitespace(reg_name.get_name()),
-                formula=reg_compound.formula,
-                smiles=reg_compound.smiles,
-                inchi=reg_compound.inchi,
-                inchikey=reg_compound.inchikey,
-                molblock=reg_compound.molblock,
-                source_genus=genus,
-                source_species=species,
-                npaid=db_compound.npaid,
+        if structure is None:
+            structure = process_structure(
+                db_compound.smiles, name=name, standardize=standardize
             )
+        elif isinstance(structure, Exception):
+            raise structure
 
-            db_add_commit(check_compound)
-        else:
-            check_compound = db_compound.checker_compound
+        genus, species = split_source_organism(db_compound.source_organism)
+        check_compound = CheckerCompound(
+            id=db_compound.id,
+            name=clean_whitespace(name),
+            formula=structure.formula,
+            smiles=structure.smiles,
+            inchi=structure.inchi,
+            inchikey=structure.inchikey,
+            molblock=structure.molblock,
+            source_genus=genus,
+            source_species=species,
+            npaid=db_compound.npaid,
+        )
+        db.session.add(check_compound)
 
         return check_compound
 
@@ -331,11 +695,11 @@ class Checker:
         pass
 
     def check_journal(self, checker_article):
-        journal = Journal.check_journal_match(checker_article.journal)
+        journal = self.journals.match(checker_article.journal)
         if journal:
             checker_article.journal = journal.journal
             checker_article.journal_abbrev = journal.abbrev
-            if journal.journal not in self.atlas_journals:
+            if not self.journals.in_atlas(journal.journal):
                 self.add_problem(checker_article.id, "missing_journal")
         else:
             self.add_problem(checker_article.id, "journal")
@@ -401,22 +765,22 @@ class Checker:
                 self.add_problem(checker_article.id, "abstract")
 
     def check_source_organism(self, checker_compound):
-        taxa = atlas_api.search_taxa(checker_compound.source_genus)
+        taxa = self.atlas.search_taxa(checker_compound.source_genus)
         if len(taxa) == 1:
             checker_compound.atlas_taxon_id = taxa[0]["id"]
         elif len(taxa) > 1:
             self.add_problem(
-                checker_compound.get_article_id(),
+                self.article_id(checker_compound),
                 "mutliple_taxa",
                 comp_id=checker_compound.id,
             )
         else:
-            tax = Taxon.search_alternatives(checker_compound.source_genus)
-            if tax:
-                checker_compound.atlas_taxon_id = tax.atlas_taxon_id
+            atlas_taxon_id = self.taxon_alternatives.get(checker_compound.source_genus)
+            if atlas_taxon_id:
+                checker_compound.atlas_taxon_id = atlas_taxon_id
             else:
                 self.add_problem(
-                    checker_compound.get_article_id(),
+                    self.article_id(checker_compound),
                     "genus",
                     comp_id=checker_compound.id,
                 )
@@ -426,7 +790,7 @@ class Checker:
         Query NP Atlas API to see if there is a flat match
         Return boolean match
         """
-        res = atlas_api.search_inchikey(compound.inchikey.split("-")[0])
+        res = self.atlas.search_inchikey(compound.inchikey.split("-")[0])
         return bool(res)
 
     def compound_full_match(self, compound):
@@ -434,7 +798,7 @@ class Checker:
         Query NP Atlas API to see if there is a full match
         Return boolean match
         """
-        res = atlas_api.search_inchikey(compound.inchikey)
+        res = self.atlas.search_inchikey(compound.inchikey)
         return bool(res)
 
     def compound_name_match(self, compound):
@@ -444,17 +808,14 @@ class Checker:
         """
         res = None
         if compound.name != "Not named":
-            res = atlas_api.search_name(compound.name)
+            res = self.atlas.search_name(compound.name)
         return bool(res)
 
     def longest_substring_name_match(self, compound):
         res = None
         struct_inchi = compound.inchikey.split("-")[0]
         if compound.name != "Not named":
-            longest_substring = next(
-                iter(sorted((compound.name.split()), key=len, reverse=True))
-            )
-            comps = atlas_api.search_name(longest_substring)
+            comps = self.atlas.search_name(longest_substring(compound.name))
             res = any(struct_inchi in c.get("inchikey", "") for c in comps)
         return bool(res)
 
@@ -466,7 +827,7 @@ class Checker:
         """
         changed = True
         if compound.npaid:
-            res = atlas_api.get_compound(compound.npaid)
+            res = self.atlas.get_compound(compound.npaid)
             changed = compound.inchikey != res.get("inchikey")
         return changed
 
@@ -511,14 +872,81 @@ class Correction(object):
         # fmt: on
 
 
+class RetractionIndex(object):
+    """
+    Sets of retracted DOIs, compound InChIKeys and compound names
+
+    Values are matched ignoring case and trailing whitespace, the same
+    as the database's default (PAD SPACE) collation compares them
+    """
+
+    def __init__(self, dois=(), inchikeys=(), names=()):
+        self.dois = {normalize_key(x) for x in dois if x}
+        self.inchikeys = {normalize_key(x) for x in inchikeys if x}
+        self.names = {normalize_key(x) for x in names if x}
+
+    @classmethod
+    def load(cls):
+        rows = db.session.query(
+            Retraction.article_doi,
+            Retraction.compound_inchikey,
+            Retraction.compound_name,
+        ).all()
+        return cls(*zip(*rows)) if rows else cls()
+
+    def has_doi(self, doi):
+        return bool(doi) and normalize_key(doi) in self.dois
+
+    def has_compound(self, inchikey, name):
+        return (bool(inchikey) and normalize_key(inchikey) in self.inchikeys) or (
+            bool(name) and normalize_key(name) in self.names
+        )
+
+
+class TaxonAlternativeIndex(object):
+    """
+    Atlas taxon ids by alternative taxon name, matched ignoring case
+    """
+
+    def __init__(self, alternatives=()):
+        self.taxa = dict()
+        # Keep the first taxon for a name, like Taxon.search_alternatives
+        for name, atlas_taxon_id in alternatives:
+            if name:
+                self.taxa.setdefault(normalize_key(name), atlas_taxon_id)
+
+    @classmethod
+    def load(cls):
+        rows = (
+            db.session.query(TaxonAlternative.name, Taxon.atlas_taxon_id)
+            .join(Taxon)
+            .order_by(Taxon.id)
+            .all()
+        )
+        return cls(rows)
+
+    def get(self, name):
+        return self.taxa.get(normalize_key(name)) if name else None
+
+
 # =============================================================================
 # ==========                Helper functions                      =============
 # =============================================================================
 
 
-def db_add_commit(db_object):
-    db.session.add(db_object)
-    commit()
+def find_internal_duplicates(compounds, candidates):
+    """(compound id, article id) of each candidate that isn't the first
+    compound with its InChIKey, from (compound id, inchikey) pairs in
+    dataset order and (compound id, article id) candidates"""
+    first_ids = dict()
+    for compound_id, inchikey in compounds:
+        first_ids.setdefault(inchikey, compound_id)
+    inchikeys = dict(compounds)
+    return [
+        (compound_id, article_id)
+        for compound_id, article_id in candidates
+        if first_ids[inchikeys[compound_id]] != compound_id
+    ]
 
 
 def commit():
@@ -580,7 +1008,50 @@ def clean_species(species_string):
     )
 
 
+def regularize_name(name):
+    reg_name = NameString(name)
+    reg_name.regularize_name()
+    return reg_name.get_name()
+
+
+def longest_substring(name):
+    return next(iter(sorted(name.split(), key=len, reverse=True)))
+
+
+def normalize_key(string):
+    # PAD SPACE collations ignore trailing spaces only
+    return string.rstrip().lower()
+
+
 def clean_whitespace(string):
     if string is None or not isinstance(string, str):
         return string
     return " ".join(string.split())
+
+
+def hash_fields(*fields):
+    """Stable hash of a row's curated fields"""
+    data = json.dumps([str(f) if f is not None else None for f in fields])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def article_fingerprint(article):
+    return hash_fields(
+        article.pmid,
+        article.doi,
+        article.npa_artid,
+        article.journal,
+        article.year,
+        article.volume,
+        article.issue,
+        article.pages,
+        article.authors,
+        article.title,
+        article.abstract,
+    )
+
+
+def compound_fingerprint(compound):
+    return hash_fields(
+        compound.name, compound.smiles, compound.source_organism, compound.npaid
+    )
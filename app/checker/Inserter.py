@@ -1,17 +1,24 @@
+import hashlib
 import logging
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, asdict
+from datetime import datetime
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote
 
-from requests.exceptions import HTTPError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
 
 from app import config, db, models
 from app.checker import schemas
+from app.checker.JournalResolver import get_resolver
 from app.checker.ResolveEnum import ResolveEnum
-from app.models import Dataset
-from app.utils import atlas_api, oauth_session
+from app.models import AppliedWrite, Dataset, keep_loaded
+from app.utils import atlas_api, oauth_session, progress
+from app.utils.http_client import HttpClient
 
 
 class Action(str, Enum):
@@ -31,26 +38,86 @@ class ApiError:
     api_response: str
 
 
+@dataclass
+class CompoundWrite:
+    """
+    What's needed to insert or update a compound, read from the checker
+    tables up front so the API calls can run off the main thread
+    """
+
+    compound_id: int
+    resolve: ResolveEnum
+    name: str
+    smiles: str
+    npaid: Optional[int]
+    atlas_taxon_id: Optional[int]
+    origin_species: str
+    origin_doi: str
+
+    @classmethod
+    def from_checker(
+        cls, compound: models.CheckerCompound, reference: models.CheckerArticle
+    ):
+        return cls(
+            compound_id=compound.id,
+            # Assume new if no resolve enum value in DB
+            resolve=ResolveEnum(compound.resolve or 1),
+            name=compound.name,
+            smiles=compound.smiles,
+            npaid=compound.npaid,
+            atlas_taxon_id=compound.atlas_taxon_id,
+            origin_species=compound.source_species,
+            origin_doi=reference.doi,
+        )
+
+
 class Inserter:
-    """Inserter class interface"""
+    """Inserter class interface
+
+    References are pushed to the Atlas first, then compounds, each over a
+    pool of `workers` threads sharing one authenticated session. Only the
+    API calls run in the pool; the database is read and written on the
+    calling thread.
+
+    Every write has a key naming the entity written (e.g. a compound) and
+    how, and the keys of those that succeed are saved. Re-running a failed
+    insertion skips what already went through. Updates whose data has
+    changed since are made again, inserts aren't. Inserts are never sent
+    twice in one run unless the first attempt can't have reached the
+    Atlas: one that got no answer is reported as an error instead.
+    """
+
+    # Applied writes saved every this many compounds
+    SAVE_EVERY = 100
 
     def __init__(self, dataset_id: int, *args, **kwargs):
         self.dataset_id = dataset_id
+        self.workers = kwargs.get("workers", config.INSERTER_WORKERS)
         self.task = kwargs.get("celery_task", None)
         self.logger = kwargs.get("logger", self.default_logger())
+        self.progress = progress.ProgressReporter(
+            progress.channel_name("inserter", dataset_id),
+            task=self.task,
+            logger=self.logger,
+        )
         self.errors: List[ApiError] = []
+        self._lock = threading.Lock()
+        # Payload hash by write key
+        self._applied: Dict[str, str] = {}
+        self._newly_applied: Dict[str, Tuple[Action, str, str]] = {}
+        # Counted by the workers, reported from the calling thread
+        self._api_writes = 0
         # Setup session with auth for insertion VIA API
         self._init_api_client()
-        self._atlas_journals: List[str] = []
+        self._journals = None
+        self._atlas_written = False
+        self._atlas_matches: Dict[str, List[Dict]] = {}
 
     @property
-    def atlas_journals(self):
-        if not self._atlas_journals:
-            self._get_atlas_journals()
-        return self._atlas_journals
-
-    def _get_atlas_journals(self):
-        self._atlas_journals = atlas_api.get_journals()
+    def journals(self):
+        if self._journals is None:
+            self._journals = get_resolver()
+        return self._journals
 
     def _init_api_client(self):
         self.client = oauth_session.get_oauth_session(client_id=None)
@@ -61,51 +128,170 @@ class Inserter:
             client_id=config.API_CLIENT_ID,
             client_secret=config.SECRET_KEY,
         )
+        # Enough connections for every worker
+        adapter = HTTPAdapter(pool_maxsize=max(10, self.workers))
+        self.client.mount("http://", adapter)
+        self.client.mount("https://", adapter)
+        # Timeouts and retries as for other Atlas API calls, see _api_call
+        # for when writes are retried
+        self.http = HttpClient(
+            connect_timeout=atlas_api.CONNECT_TIMEOUT,
+            read_timeout=atlas_api.READ_TIMEOUT,
+            max_retries=atlas_api.MAX_RETRIES,
+            session=self.client,
+        )
+
+    def write_key(self, entity: str, endpoint: str, action: Action) -> str:
+        """The same write to the same entity (e.g. "compound:12") of the
+        dataset always gets the same key, whatever data is written"""
+        payload = json.dumps([self.dataset_id, action.value, entity, endpoint])
+        return hashlib.sha256(payload.encode()).hexdigest()
 
     def _api_call(
-        self, endpoint: str, post_data: Dict, get_data: Dict, action: Action
+        self,
+        endpoint: str,
+        post_data: Dict,
+        get_data: Dict,
+        action: Action,
+        entity: str,
     ) -> bool:
         """POST/PUT request to API admin with auth depending on action.
-        Requires endpoint URL without BASE_URL and data as dict.
+        Requires endpoint URL without BASE_URL and data as dict, and the
+        entity written for its write key.
         Returns boolean of success status of API call.
+        Writes already applied in an earlier run are skipped as successful.
+        Updates (setting a value) are retried like any other call, inserts
+        only if they never reached the Atlas, so they can't be made twice.
+        Safe to call from the worker threads.
         """
-        if action == Action.INSERT:
-            r = self.client.post(f"{config.API_BASE_URL}/{endpoint}", json=post_data)
-        if action == Action.UPDATE:
-            r = self.client.put(f"{config.API_BASE_URL}/{endpoint}", json=post_data)
-
-        if not r.status_code == 200:
-            self.logger.error(r.text)
-            self.errors.append(
-                ApiError(
-                    action=action,
-                    original_data=get_data,
-                    new_data=post_data,
-                    api_response=r.text,
+        key = self.write_key(entity, endpoint, action)
+        payload_hash = hash_payload(post_data)
+        with self._lock:
+            applied = self._applied.get(key)
+        if applied == payload_hash or (applied and action == Action.INSERT):
+            self.logger.debug("Skipping %s %s - already applied", action, entity)
+            if applied != payload_hash:
+                self.logger.warning(
+                    "%s changed since it was inserted - not inserting again", entity
                 )
+                self._add_error(
+                    ApiError(
+                        action=action,
+                        original_data={},
+                        new_data=post_data,
+                        api_response="Changed since inserted by an earlier run",
+                    )
+                )
+            return True
+
+        method = "POST" if action == Action.INSERT else "PUT"
+        try:
+            r = self.http.request(
+                method,
+                f"{config.API_BASE_URL}/{endpoint}",
+                f"inserter_{action.value}",
+                idempotent=action == Action.UPDATE,
+                json=post_data,
             )
-            return False
+            response = None
+        except HTTPError as e:
+            # Still failing after retries
+            r = e.response
+            response = None
+        except RequestException as e:
+            # No answer, an insert may or may not have been made
+            r = None
+            response = f"No response, check the Atlas before retrying: {e}"
+
+        with self._lock:
+            # Anything the Atlas returns from here on may have changed
+            self._atlas_written = True
+            self._api_writes += 1
+            if r is None or not r.status_code == 200:
+                response = response or r.text
+                self.logger.error(response)
+                self.errors.append(
+                    ApiError(
+                        action=action,
+                        original_data=get_data,
+                        new_data=post_data,
+                        api_response=response,
+                    )
+                )
+                return False
+            self._applied[key] = payload_hash
+            self._newly_applied[key] = (action, endpoint, payload_hash)
         return True
 
-    def update_status(self, current: int, total: int, status: str):
-        if self.task:
-            self.task.update_state(
-                state="PROGRESS",
-                meta={"current": current, "total": total, "status": status},
+    def _add_error(self, error: ApiError):
+        with self._lock:
+            self.errors.append(error)
+
+    def load_applied(self):
+        """Keys of the writes made by earlier runs on this dataset"""
+        rows = AppliedWrite.query.with_entities(
+            AppliedWrite.key, AppliedWrite.payload_hash
+        ).filter_by(dataset_id=self.dataset_id)
+        self._applied = {key: payload_hash for key, payload_hash in rows}
+        if self._applied:
+            self.logger.info(
+                "Resuming insertion - %d writes already applied", len(self._applied)
             )
-        self.logger.info("PROGRESS: {}/{}\nStatus: {}".format(current, total, status))
+
+    def save_applied(self):
+        """Record the writes made since the last save"""
+        with self._lock:
+            applied, self._newly_applied = self._newly_applied, {}
+        if not applied:
+            return
+        # Updates made again replace the earlier run's record
+        rows = {
+            row.key: row
+            for row in AppliedWrite.query.filter(AppliedWrite.key.in_(applied))
+        }
+        now = datetime.utcnow()
+        for key, (action, endpoint, payload_hash) in applied.items():
+            row = rows.get(key) or AppliedWrite(key=key, dataset_id=self.dataset_id)
+            row.action = action.value
+            row.endpoint = endpoint[:255]
+            row.payload_hash = payload_hash
+            row.applied = now
+            db.session.add(row)
+        with keep_loaded():
+            commit()
+
+    def update_status(self, current: int, total: int, status: str):
+        self._count_api_writes()
+        # Throttled, see ProgressReporter
+        self.progress.update(current, total, status)
+
+    def _count_api_writes(self):
+        # Only the counter is read under the lock, the workers mustn't
+        # wait while progress is published
+        with self._lock:
+            api_writes = self._api_writes
+        if api_writes:
+            self.progress.counts["api_writes"] = api_writes
 
     def run(self):
-        dataset = Dataset.query.get(self.dataset_id)
+        try:
+            return self._run()
+        finally:
+            if self._atlas_written:
+                self.logger.info("Clearing cached Atlas API responses")
+                atlas_api.invalidate_cache()
+
+    def _run(self):
+        dataset = Dataset.load_full(self.dataset_id)
 
         self.dataset_sanity_check(dataset)
-        total = len(dataset.articles)
-        self.update_status(0, total, "FIRING UP")
+        self.update_status(0, len(dataset.articles), "FIRING UP")
+        self.load_applied()
+        self.prefetch_atlas_matches(dataset)
 
-        # Iterate over checker_articles, double check the article is good
-        # Add/update the data
-        for idx, ds_article in enumerate(dataset.articles):
-            # Skip over articles which are not completely curated/checked
+        # Skip over articles which are not completely curated/checked
+        articles = []
+        for ds_article in dataset.articles:
             if (
                 not ds_article.completed
                 or ds_article.needs_work
@@ -113,79 +299,15 @@ class Inserter:
             ):
                 self.logger.warning("Skipping article %d!", ds_article.id)
                 continue
+            articles.append(ds_article)
 
-            self.update_status(idx, total, "RUNNING")
-
-            c_article = ds_article.checker_article
-            # Check if article is in Atlas
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="inserter") as pool:
             try:
-                atlas_ref = atlas_api.get_reference(doi=c_article.doi)
-            except HTTPError:
-                atlas_ref = None
-
-            if not atlas_ref:
-                self.logger.info("Adding Reference - %s", c_article.doi)
-                success = self.new_reference(c_article)
-            else:
-                self.logger.info("Updating Reference %s", c_article.doi)
-                success = self.update_reference(c_article, atlas_ref)
+                articles = self.push_references(pool, articles)
+                self.push_compounds(pool, articles)
+            finally:
+                self.save_applied()
 
-            # If Reference insertion success fails need to skip adding compounds
-            if not success:
-                self.logger.error(
-                    "Reference %d failed to insert/update - skipping %d compounds.",
-                    c_article.id,
-                    len(ds_article.compounds),
-                )
-                continue
-
-            # Iterate over compounds and add/update them
-            # These functions also do association with origin + reference
-            for ds_compound in ds_article.compounds:
-                c_compound = ds_compound.checker_compound
-
-                # Double check compound doesn't match Atlas without being handled
-                if (
-                    self.check_atlas_match(c_compound.inchikey)
-                    and not c_compound.resolve
-                ):
-                    self.logger.error("Found an uncaught match for a compound!")
-                    self.logger.error("%s - %s", c_compound.name, c_compound.inchikey)
-                    self.reject_dataset()
-
-                # Assume new if no resolve enum value in DB
-                resolve_id = c_compound.resolve or 1
-                resolve = ResolveEnum(resolve_id)
-                self.logger.debug("Resolving %s by %s-ing", c_compound.id, resolve.name)
-
-                if resolve == ResolveEnum.NEW:
-                    self.logger.info("Adding new compound: %s", c_compound.name)
-                    self.new_compound(c_compound, c_article)
-
-                elif resolve == ResolveEnum.KEEP:
-                    self.logger.info("Keeping NP Atlas Compound %s", c_compound.name)
-                    continue
-
-                elif resolve == ResolveEnum.REPLACE or resolve == ResolveEnum.UPDATE:
-                    self.logger.info("Replacing NPAID: %s", c_compound.npaid)
-                    self.update_compound(c_compound, c_article)
-
-                elif resolve == ResolveEnum.SYNONYM:
-                    if not c_compound.npaid:
-                        self.logger.error("Missing NPAID for synonym")
-                        continue
-                    self.logger.info(
-                        "Adding synonym %s for %s", c_compound.name, c_compound.npaid
-                    )
-                    # TODO: Add implementation
-                    # self._api_call("")
-
-                else:  # Only possible if mis-handled reject during checking
-                    self.logger.error(
-                        "Dataset contains rejected compounds - "
-                        + "There was an error in checker handling..."
-                    )
-                    self.reject_dataset()
         e_string = "No errors"
         if self.errors:
             e_string = json.dumps([asdict(e) for e in self.errors])
@@ -193,26 +315,138 @@ class Inserter:
             dataset.checker_dataset.errors = e_string
         dataset.checker_dataset.inserted = True
         commit()
+        self._count_api_writes()
+        self.progress.finish("Inserted", result=e_string)
         return e_string
 
-    def new_compound(
-        self, compound: models.CheckerCompound, reference: models.CheckerArticle
-    ):
+    def push_references(self, pool: ThreadPoolExecutor, articles: List) -> List:
+        """Insert or update the articles' references all at once.
+        Returns the articles whose reference made it into the Atlas.
+        """
+        futures = {}
+        for ds_article in articles:
+            c_article = ds_article.checker_article
+            self.verify_journal(journal_title=c_article.journal)
+            future = pool.submit(
+                self.push_reference,
+                c_article.id,
+                c_article.doi,
+                self.reference_in(c_article),
+                self.reference_update(c_article),
+            )
+            futures[future] = ds_article
+
+        pushed = []
+        for done, future in enumerate(as_completed(futures), 1):
+            ds_article = futures[future]
+            self.update_status(done, len(futures), "Inserting references")
+            if future.result():
+                pushed.append(ds_article)
+            else:
+                # If Reference insertion fails need to skip adding compounds
+                self.logger.error(
+                    "Reference %d failed to insert/update - skipping %d compounds.",
+                    ds_article.checker_article.id,
+                    len(ds_article.compounds),
+                )
+        self.save_applied()
+        # Keep dataset order for the compounds
+        pushed_ids = {a.id for a in pushed}
+        return [a for a in articles if a.id in pushed_ids]
+
+    def push_compounds(self, pool: ThreadPoolExecutor, articles: List):
+        """Insert or update the articles' compounds. Every compound is
+        checked before any is written, so a dataset that has to be
+        rejected leaves the Atlas as it was.
+        """
+        writes = []
+        for ds_article in articles:
+            c_article = ds_article.checker_article
+            self.progress.add("compounds", len(ds_article.compounds))
+            for ds_compound in ds_article.compounds:
+                write = self.compound_write(ds_compound.checker_compound, c_article)
+                if write:
+                    writes.append(write)
+
+        futures = []
+        for write in writes:
+            if write.resolve == ResolveEnum.NEW:
+                self.logger.info("Adding new compound: %s", write.name)
+                futures.append(pool.submit(self.new_compound, write))
+            else:
+                self.logger.info("Replacing NPAID: %s", write.npaid)
+                futures.append(pool.submit(self.update_compound, write))
+
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            self.update_status(done, len(futures), "Inserting compounds")
+            if done % self.SAVE_EVERY == 0:
+                self.save_applied()
+
+    def compound_write(
+        self, c_compound: models.CheckerCompound, c_article: models.CheckerArticle
+    ) -> Optional[CompoundWrite]:
+        """The write a compound needs, None if it doesn't need one.
+        Rejects the dataset if the compound can't be inserted.
+        """
+        # Double check compound doesn't match Atlas without being handled
+        if self.check_atlas_match(c_compound.inchikey) and not c_compound.resolve:
+            self.logger.error("Found an uncaught match for a compound!")
+            self.logger.error("%s - %s", c_compound.name, c_compound.inchikey)
+            self.reject_dataset()
+
+        write = CompoundWrite.from_checker(c_compound, c_article)
+        resolve = write.resolve
+        self.logger.debug("Resolving %s by %s-ing", c_compound.id, resolve.name)
+
+        if resolve == ResolveEnum.NEW:
+            return write
+
+        elif resolve == ResolveEnum.KEEP:
+            self.logger.info("Keeping NP Atlas Compound %s", c_compound.name)
+            return None
+
+        elif resolve == ResolveEnum.REPLACE or resolve == ResolveEnum.UPDATE:
+            return write
+
+        elif resolve == ResolveEnum.SYNONYM:
+            if not c_compound.npaid:
+                self.logger.error("Missing NPAID for synonym")
+                return None
+            self.logger.info(
+                "Adding synonym %s for %s", c_compound.name, c_compound.npaid
+            )
+            # TODO: Add implementation
+            # self._api_call("")
+            return None
+
+        else:  # Only possible if mis-handled reject during checking
+            self.logger.error(
+                "Dataset contains rejected compounds - "
+                + "There was an error in checker handling..."
+            )
+            self.reject_dataset()
+
+    def new_compound(self, compound: CompoundWrite):
         """
         Add a new compound to the NP Atlas and associate origin with reference
         """
         data = schemas.CompoundIn(
-            origin_doi=reference.doi,
+            origin_doi=compound.origin_doi,
             origin_taxon_id=compound.atlas_taxon_id,
-            origin_species=compound.source_species,
+            origin_species=compound.origin_species,
             smiles=compound.smiles,
             name=compound.name,
         ).dict()
-        self._api_call("compound/", post_data=data, get_data={}, action=Action.INSERT)
+        self._api_call(
+            "compound/",
+            post_data=data,
+            get_data={},
+            action=Action.INSERT,
+            entity=f"compound:{compound.compound_id}",
+        )
 
-    def update_compound(
-        self, compound: models.CheckerCompound, reference: models.CheckerArticle
-    ):
+    def update_compound(self, compound: CompoundWrite):
         """
         Update compound in NP Atlas and associate origin with reference
         """
@@ -231,6 +465,7 @@ class Inserter:
                 post_data={"smiles": compound.smiles},
                 get_data=atlas_compound,
                 action=Action.UPDATE,
+                entity=f"compound:{compound.compound_id}",
             )
 
         if atlas_compound.get("original_name") != compound.name:
@@ -239,6 +474,7 @@ class Inserter:
                 post_data={"name": compound.name},
                 get_data=atlas_compound,
                 action=Action.UPDATE,
+                entity=f"compound:{compound.compound_id}",
             )
 
         # TODO: Fix Origin update logic
@@ -246,7 +482,7 @@ class Inserter:
             atlas_compound.get("origin_organism", {}).get("taxon", {}).get("id")
             != compound.atlas_taxon_id
         ):
-            self.errors.append(
+            self._add_error(
                 ApiError(
                     action=Action.UPDATE,
                     original_data=atlas_compound.get("origin_organism", {}).get(
@@ -257,17 +493,41 @@ class Inserter:
                 )
             )
 
+    def prefetch_atlas_matches(self, dataset: models.Dataset):
+        """Structure search every checked compound in the dataset up front"""
+        inchikeys = [
+            c.checker_compound.inchikey
+            for c in dataset.get_compounds()
+            if c.checker_compound
+        ]
+        self._atlas_matches = atlas_api.search_inchikeys_bulk(inchikeys)
+
     def check_atlas_match(self, inchikey):
-        return any(atlas_api.search_inchikey(inchikey))
+        if inchikey not in self._atlas_matches:
+            self._atlas_matches[inchikey] = atlas_api.search_inchikey(inchikey)
+        return any(self._atlas_matches[inchikey])
 
-    def new_reference(self, article: models.CheckerArticle) -> bool:
+    def push_reference(
+        self, article_id: int, doi: str, ref_in: Dict, ref_update: Dict
+    ) -> bool:
         """
-        Add a new article
+        Add the reference if it's not in the Atlas, otherwise update it
         Returns boolean of success status
         """
-        self.verify_journal(journal_title=article.journal)
-
-        ref_in = schemas.ReferenceIn(
+        # Check if article is in Atlas
+        try:
+            atlas_ref = atlas_api.get_reference(doi=doi)
+        except HTTPError:
+            atlas_ref = None
+
+        if not atlas_ref:
+            self.logger.info("Adding Reference - %s", doi)
+            return self.new_reference(article_id, ref_in)
+        self.logger.info("Updating Reference %s", doi)
+        return self.update_reference(article_id, doi, ref_update, atlas_ref)
+
+    def reference_in(self, article: models.CheckerArticle) -> Dict:
+        return schemas.ReferenceIn(
             doi=article.doi,
             abstract=article.abstract,
             pmid=article.pmid,
@@ -278,18 +538,10 @@ class Inserter:
             volume=article.volume,
             issue=article.issue,
             pages=article.pages,
-        )
-        return self._api_call(
-            "reference/", post_data=ref_in.dict(), get_data={}, action=Action.INSERT
-        )
+        ).dict()
 
-    def update_reference(self, article: models.CheckerArticle, atlas_ref: Dict) -> bool:
-        """
-        Update the articles data
-        Returns boolean of success status
-        """
-        self.verify_journal(journal_title=article.journal)
-        ref_in = schemas.ReferenceUpdate(
+    def reference_update(self, article: models.CheckerArticle) -> Dict:
+        return schemas.ReferenceUpdate(
             pmid=article.pmid,
             authors=article.authors,
             title=article.title,
@@ -299,23 +551,45 @@ class Inserter:
             issue=article.issue,
             pages=article.pages,
         ).dict()
+
+    def new_reference(self, article_id: int, ref_in: Dict) -> bool:
+        """
+        Add a new article
+        Returns boolean of success status
+        """
+        return self._api_call(
+            "reference/",
+            post_data=ref_in,
+            get_data={},
+            action=Action.INSERT,
+            entity=f"reference:{article_id}",
+        )
+
+    def update_reference(
+        self, article_id: int, doi: str, ref_in: Dict, atlas_ref: Dict
+    ) -> bool:
+        """
+        Update the articles data
+        Returns boolean of success status
+        """
         # Check if there are any real changes and skip if not
         if ref_in.items() <= atlas_ref.items():
             self.logger.debug("No changes detected - not updating article")
             return True
         else:
             self.logger.debug("Updating article")
-            url_doi = quote(article.doi)
+            url_doi = quote(doi)
             return self._api_call(
                 f"reference/{url_doi}",
                 post_data=ref_in,
                 get_data=atlas_ref,
                 action=Action.UPDATE,
+                entity=f"reference:{article_id}",
             )
 
     def verify_journal(self, journal_title: str):
         # Make sure journal is actually in Atlas DB
-        if journal_title not in self.atlas_journals:
+        if not self.journals.in_atlas(journal_title):
             self.logger.info(
                 "Journal %s not in NP Atlas - adding the journal", journal_title
             )
@@ -324,9 +598,10 @@ class Inserter:
                 post_data={"title": journal_title},
                 get_data={},
                 action=Action.INSERT,
+                entity=f"journal:{journal_title}",
             )
             # Refresh journal list after adding one
-            self._get_atlas_journals()
+            self.journals.refresh_atlas()
 
     def dataset_sanity_check(self, dataset: models.Dataset):
         """
@@ -377,6 +652,11 @@ class Inserter:
 # =============================================================================
 
 
+def hash_payload(data: Dict) -> str:
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
 def db_add_commit(db_object):
     db.session.add(db_object)
     commit()
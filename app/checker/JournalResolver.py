@@ -0,0 +1,164 @@
+import threading
+import uuid
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app import cache, db
+from app.models import AltJournal, Journal
+from app.utils import atlas_api
+from app.utils.cache_store import MISSING, CacheStore
+from app.utils.prefix_index import PrefixIndex
+
+JournalMatch = namedtuple("JournalMatch", ["id", "journal", "abbrev"])
+
+# Token that changes whenever the journal tables do, shared between processes
+_generation = CacheStore("journal_resolver:generation", 86400, 1)
+
+
+class JournalResolver:
+    """In-memory copy of the journal and alternative journal tables
+
+    Matches journal names the same way as Journal.check_journal_match,
+    by full name, then abbreviation, then known alternative, without a
+    query per lookup. Atlas journal titles are loaded on first use.
+
+    Use `get_resolver` for a copy shared by the whole process, which is
+    reloaded after `invalidate_journals` is called from any process.
+    """
+
+    def __init__(
+        self,
+        journals: Iterable[Tuple[int, str, str]],
+        alternatives: Iterable[Tuple[str, int]] = (),
+        generation: str = None,
+    ):
+        self.generation = generation
+        self.journals: List[JournalMatch] = [JournalMatch(*x) for x in journals]
+        by_id = {j.id: j for j in self.journals}
+        self._by_name: Dict[str, JournalMatch] = {}
+        self._by_abbrev: Dict[str, JournalMatch] = {}
+        # Keep the first of any duplicates, like .first() would
+        for journal in self.journals:
+            self._by_name.setdefault(normalize_journal(journal.journal), journal)
+            self._by_abbrev.setdefault(normalize_journal(journal.abbrev), journal)
+        self._by_alt: Dict[str, JournalMatch] = {}
+        for alt, journal_id in alternatives:
+            if alt and journal_id in by_id:
+                self._by_alt.setdefault(normalize_alt(alt), by_id[journal_id])
+        self._alternatives = [
+            (alt, by_id[journal_id].journal)
+            for alt, journal_id in alternatives
+            if alt and journal_id in by_id
+        ]
+        self._index: Optional[PrefixIndex] = None
+        self._atlas_titles: Optional[Set[str]] = None
+        self.atlas_generation = None
+
+    @classmethod
+    def load(cls, generation: str = None) -> "JournalResolver":
+        """Build from the journal tables, via the shared cache if a copy
+        of this generation of the tables is there"""
+        key = f"journal_table:{generation}"
+        tables = cache.get(key) if generation else None
+        if tables is None:
+            tables = load_journal_tables()
+            if generation:
+                cache.set(key, tables)
+        journals, alternatives = tables
+        return cls(journals, alternatives, generation=generation)
+
+    def match(self, journal_name: str) -> Optional[JournalMatch]:
+        if not journal_name:
+            return None
+        key = normalize_journal(journal_name)
+        return (
+            self._by_name.get(key)
+            or self._by_abbrev.get(key)
+            or self._by_alt.get(normalize_alt(journal_name))
+        )
+
+    @property
+    def index(self) -> PrefixIndex:
+        """Prefix index of journal names, preferring full names, then
+        abbreviations, then known alternative spellings"""
+        if self._index is None:
+            rows = [(j.journal, j.journal, 0) for j in self.journals]
+            rows.extend((j.abbrev, j.journal, 1) for j in self.journals)
+            rows.extend((alt, journal, 2) for alt, journal in self._alternatives)
+            self._index = PrefixIndex.from_keys(rows)
+        return self._index
+
+    def search(self, prefix: str, limit: int = 20) -> List[str]:
+        """Journal names where the name, abbreviation or a known
+        alternative starts with prefix, best matches first"""
+        return self.index.search(prefix.strip(), limit=limit)
+
+    @property
+    def atlas_titles(self) -> Set[str]:
+        """Titles of every journal in the Atlas"""
+        if self._atlas_titles is None:
+            self._atlas_titles = set(atlas_api.get_journals())
+        return self._atlas_titles
+
+    def in_atlas(self, title: str) -> bool:
+        return title in self.atlas_titles
+
+    def refresh_atlas(self):
+        """Reload Atlas titles, e.g. after adding a journal to the Atlas"""
+        atlas_api.invalidate_cache("get_journals")
+        self._atlas_titles = None
+
+
+_resolver: Optional[JournalResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def load_journal_tables() -> Tuple[List[Tuple], List[Tuple]]:
+    journals = db.session.query(Journal.id, Journal.journal, Journal.abbrev)
+    alternatives = db.session.query(AltJournal.altjournal, AltJournal.journal_id)
+    return (
+        [tuple(x) for x in journals.order_by(Journal.id)],
+        [tuple(x) for x in alternatives.order_by(AltJournal.id)],
+    )
+
+
+def warm_journal_tables():
+    """Make sure the shared cache has the current journal tables"""
+    JournalResolver.load(generation=journals_generation())
+
+
+def journals_generation() -> str:
+    token = _generation.get("token")
+    if token is MISSING:
+        token = uuid.uuid4().hex
+        _generation.set("token", token)
+    return token
+
+
+def get_resolver() -> JournalResolver:
+    """The process-wide resolver, reloaded if the journal tables or the
+    Atlas journals have changed since it was built"""
+    global _resolver
+    generation = journals_generation()
+    atlas_generation = atlas_api.cache_generation()
+    with _resolver_lock:
+        if _resolver is None or _resolver.generation != generation:
+            _resolver = JournalResolver.load(generation=generation)
+        if _resolver.atlas_generation != atlas_generation:
+            _resolver._atlas_titles = None
+            _resolver.atlas_generation = atlas_generation
+        return _resolver
+
+
+def invalidate_journals():
+    """Call after changing the journal tables"""
+    _generation.delete("token")
+
+
+def normalize_journal(name: str) -> str:
+    # Compare like the DB collation: ignoring case and trailing whitespace
+    return name.rstrip().lower() if name else ""
+
+
+def normalize_alt(name: str) -> str:
+    return normalize_journal(name).replace(".", "")
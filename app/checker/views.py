@@ -1,5 +1,11 @@
+import json
+import time
+
+from celery import chord
+from celery.signals import worker_ready
 from celery.utils.log import get_task_logger
 from flask import (
+    Response,
     abort,
     current_app,
     flash,
@@ -12,7 +18,7 @@ from flask import (
 from flask_login import login_required
 from requests.exceptions import HTTPError, RequestException
 
-from app import cache, celery, config, db
+from app import celery, config, db
 from app.admin.views import require_admin
 from app.models import (
     AltJournal,
@@ -20,12 +26,15 @@ from app.models import (
     CheckerArticle,
     CheckerCompound,
     CheckerDataset,
+    Compound,
     Dataset,
     Journal,
     Problem,
 )
-from app.utils import atlas_api, oauth_session
-from app.utils.pubchem_smiles_standardizer import get_standardized_smiles
+from app.utils import atlas_api, oauth_session, progress, pubchem_smiles_standardizer
+from app.utils.atlas_snapshot import AtlasSnapshot
+from app.utils.prefix_index import BackgroundRefresh, PrefixIndex
+from app.utils.pubchem_smiles_standardizer import standardize_many
 
 from . import checker
 from .Checker import Checker
@@ -38,10 +47,14 @@ from .forms import (
     SimpleStringForm,
 )
 from .Inserter import Inserter
+from .JournalResolver import get_resolver, invalidate_journals, warm_journal_tables
 from .ResolveEnum import ResolveEnum
 
 logger = get_task_logger(__name__)
 
+# Most results returned by an autocomplete
+AUTOCOMPLETE_LIMIT = 20
+
 
 #####################################################################
 ###                      CELERY TASKS                             ###
@@ -49,44 +62,198 @@ logger = get_task_logger(__name__)
 
 
 @celery.task(bind=True)
-def start_checker_task(self, dataset_id, standardize_compounds=False, restart=False):
+def start_checker_task(
+    self, dataset_id, standardize_compounds=False, restart=False, use_snapshot=False
+):
     print(f"STARTING checker for Dataset {dataset_id}")
+    article_ids = [a.id for a in Dataset.query.get(dataset_id).articles]
+    chunks = chunked(article_ids, config.CHECKER_CHUNK_SIZE)
+    if len(chunks) > 1:
+        # Check the chunks on as many workers as are free, then combine
+        # them in finish_checker, which takes over this task's id
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "current": 0,
+                "total": Checker.STAGES * len(article_ids),
+                "status": f"Checking in {len(chunks)} parts",
+            },
+        )
+        # Chunks report their progress together, as this task
+        progress.start_parts(
+            progress.channel_name("checker", dataset_id),
+            (Checker.STAGES * len(chunk) for chunk in chunks),
+        )
+        options = dict(
+            standardize_compounds=standardize_compounds,
+            restart=restart,
+            use_snapshot=use_snapshot,
+            report_to=self.request.id,
+        )
+        raise self.replace(
+            chord(
+                [
+                    check_chunk.s(dataset_id, ids, part=i, **options)
+                    for i, ids in enumerate(chunks)
+                ],
+                finish_checker.s(dataset_id),
+            )
+        )
+
+    snapshot = AtlasSnapshot() if use_snapshot else None
+    checker = Checker(dataset_id, celery_task=self, logger=logger, snapshot=snapshot)
+    with progress.failures_published(progress.channel_name("checker", dataset_id)):
+        checker.run(standardize_compounds=standardize_compounds, restart=restart)
+    print(f"COMPLETED checker for Dataset {dataset_id}")
+    return checker_completed(dataset_id)
+
+
+@celery.task(bind=True)
+def check_chunk(
+    self,
+    dataset_id,
+    article_ids,
+    standardize_compounds=False,
+    restart=False,
+    use_snapshot=False,
+    report_to=None,
+    part=None,
+):
+    snapshot = AtlasSnapshot() if use_snapshot else None
+    reporter = progress.ProgressReporter(
+        progress.channel_name("checker", dataset_id),
+        task=self,
+        task_id=report_to,
+        logger=logger,
+        part=part,
+    )
+    checker = Checker(
+        dataset_id,
+        celery_task=self,
+        logger=logger,
+        snapshot=snapshot,
+        progress=reporter,
+    )
+    with progress.failures_published(reporter.channel):
+        return checker.run_chunk(
+            article_ids, standardize_compounds=standardize_compounds, restart=restart
+        )
+
+
+@celery.task(bind=True)
+def finish_checker(self, results, dataset_id):
     checker = Checker(dataset_id, celery_task=self, logger=logger)
-    checker.run(standardize_compounds=standardize_compounds, restart=restart)
-    result = "/admin/resolve/dataset{}".format(dataset_id)
+    with progress.failures_published(checker.progress.channel):
+        checker.finish_chunks(results)
     print(f"COMPLETED checker for Dataset {dataset_id}")
+    return checker_completed(dataset_id)
+
+
+def checker_completed(dataset_id):
+    result = "/admin/resolve/dataset{}".format(dataset_id)
     return {"current": 100, "total": 100, "status": "Task completed!", "result": result}
 
 
-@celery.task
-def standardize_dataset(ds_id):
-    dataset = Dataset.query.get(ds_id)
+@celery.task(bind=True)
+def standardize_dataset(self, ds_id):
+    dataset = Dataset.load_full(ds_id)
+    compound_ids = [c.id for c in dataset.get_compounds()]
     if dataset.checker_dataset:
         dataset.checker_dataset.standardized = False
     commit()
-    run_standardization(ds_id)
+    channel = progress.channel_name("standardizer", ds_id)
+    if pubchem_smiles_standardizer.STANDARDIZER == "rdkit":
+        chunks = chunked(compound_ids, config.STANDARDIZE_CHUNK_SIZE)
+    else:
+        # PubChem's rate limit is shared by every worker, more of them
+        # wouldn't get through any faster
+        chunks = [compound_ids]
+    progress.publish(
+        channel,
+        {"state": "PROGRESS", "status": f"Standardizing in {len(chunks)} parts"},
+    )
+    if len(chunks) > 1:
+        raise self.replace(
+            chord(
+                [standardize_chunk.s(ds_id, ids) for ids in chunks],
+                finish_standardization.s(ds_id),
+            )
+        )
+    with progress.failures_published(channel):
+        run_standardization(ds_id)
+    progress.publish(channel, {"state": "SUCCESS", "status": "Standardized"})
+    print(f"Completed standardization for Dataset {ds_id}")
+
+
+@celery.task
+def standardize_chunk(ds_id, compound_ids):
+    channel = progress.channel_name("standardizer", ds_id)
+    with progress.failures_published(channel):
+        compounds = Compound.query.filter(Compound.id.in_(compound_ids)).all()
+        standardize_compounds(compounds)
+        commit()
+
+
+@celery.task
+def finish_standardization(results, ds_id):
+    checker_dataset = CheckerDataset.query.filter_by(dataset_id=ds_id).first()
+    if checker_dataset:
+        checker_dataset.standardized = True
+        commit()
+    channel = progress.channel_name("standardizer", ds_id)
+    progress.publish(channel, {"state": "SUCCESS", "status": "Standardized"})
     print(f"Completed standardization for Dataset {ds_id}")
 
 
 @celery.task(bind=True)
 def insert_dataset(self, dataset_id):
     print(f"STARTING insertion of Dataset {dataset_id}")
-    inserter = Inserter(dataset_id, celery_task=self, logger=logger)
-    result = inserter.run()
+    with progress.failures_published(progress.channel_name("inserter", dataset_id)):
+        inserter = Inserter(dataset_id, celery_task=self, logger=logger)
+        result = inserter.run()
     print(f"COMPLETED insertion of Dataset {dataset_id}")
 
     return {"current": 100, "total": 100, "status": "Task completed!", "result": result}
 
 
+@celery.task(ignore_result=True)
+def warm_caches():
+    """Refresh the expensive shared cache entries before they expire:
+    Atlas taxa for each rank, Atlas journals and the local journal table
+    """
+    changed = atlas_api.get_ranks.refresh()
+    for rank in atlas_api.get_ranks():
+        changed |= atlas_api.get_rank_taxa.refresh(rank)
+    changed |= atlas_api.get_journals.refresh()
+    if changed:
+        # Checker results computed from the old responses may be stale
+        atlas_api.new_cache_generation()
+    warm_journal_tables()
+    logger.info("Warmed caches")
+
+
+@worker_ready.connect
+def warm_caches_on_start(**kwargs):
+    warm_caches.delay()
+
+
 #####################################################################
 ###                      FLASK VIEWS                              ###
 #####################################################################
 
 
+@checker.before_app_first_request
+def start_indexes():
+    # Build autocomplete indexes in the background before they're needed,
+    # taxon_autocomplete rebuilds them once they're stale
+    taxon_indexes.get()
+
+
 @checker.route("/insert/dataset<int:dataset_id>", methods=["POST"])
 @login_required
 @require_admin
 def start_insert_dataset(dataset_id):
+    reset_progress("inserter", dataset_id)
     task = insert_dataset.delay(dataset_id=dataset_id)
 
     return jsonify({"task_id": task.id}), 202
@@ -139,6 +306,7 @@ def inserterstatus():
 @login_required
 @require_admin
 def startstandard(dataset_id):
+    reset_progress("standardizer", dataset_id)
     task = standardize_dataset.delay(ds_id=dataset_id)
     checker_dataset = CheckerDataset.query.filter_by(dataset_id=dataset_id).first()
 
@@ -171,12 +339,17 @@ def standard_status():
 def startchecker(dataset_id):
     standard = bool(request.args.get("standard", False))
     restart = bool(request.args.get("restart", False))
+    use_snapshot = request.args.get("snapshot", "").lower() in ("1", "true", "yes")
 
     current_app.logger.info(
         "Compound standardization is %s", "ON" if standard else "OFF"
     )
+    reset_progress("checker", dataset_id)
     checker_task = start_checker_task.delay(
-        dataset_id=dataset_id, standardize_compounds=standard, restart=restart
+        dataset_id=dataset_id,
+        standardize_compounds=standard,
+        restart=restart,
+        use_snapshot=use_snapshot,
     )
     checker_dataset = CheckerDataset.query.filter_by(dataset_id=dataset_id).first()
 
@@ -247,7 +420,12 @@ def checkerrunning():
     if not ds_id:
         abort(400)
     dataset = Dataset.query.get_or_404(ds_id)
+    return jsonify(dataset_status(dataset))
+
 
+def dataset_status(dataset):
+    """Which of standardization or checking is running on a dataset, as
+    reported by /checkerrunning"""
     if dataset.standard_running():
         response = {
             "standard": True,
@@ -283,7 +461,107 @@ def checkerrunning():
     else:
         response = {}
 
-    return jsonify(response)
+    return response
+
+
+# Seconds between keepalive comments, and before a stream is closed and
+# the browser reconnects
+STREAM_KEEPALIVE = 15
+STREAM_LIFETIME = 300
+PROGRESS_KINDS = ("checker", "standardizer", "inserter")
+
+
+@checker.route("/progress/stream")
+@login_required
+@require_admin
+def progress_stream():
+    """Server-sent events with the progress of tasks on datasets, in
+    place of polling /checkerrunning, /checkerstatus and /insertstatus.
+
+    Takes one or more dsid and, optionally, the kinds of task to follow
+    (checker, standardizer, inserter; by default the first two). Sends a
+    "status" event per dataset, as /checkerrunning would return it, then
+    a "progress" event for each report published by the tasks.
+    """
+    ds_ids = request.args.getlist("dsid", type=int)
+    kinds = request.args.getlist("kind") or ["checker", "standardizer"]
+    if not ds_ids or any(kind not in PROGRESS_KINDS for kind in kinds):
+        abort(400)
+    datasets = (
+        Dataset.query.options(db.joinedload(Dataset.checker_dataset))
+        .filter(Dataset.id.in_(ds_ids))
+        .all()
+    )
+    if not datasets:
+        abort(404)
+
+    channels = [
+        progress.channel_name(kind, dataset.id)
+        for dataset in datasets
+        for kind in kinds
+    ]
+    # Subscribe before reading the current state, so nothing published in
+    # between is missed
+    pubsub = progress.subscribe(channels)
+    initial = []
+    for dataset in datasets:
+        status = dataset_status(dataset)
+        initial.append(sse_event("status", dict(status, dataset_id=dataset.id)))
+        running = status.get("running") or status.get("standard")
+        for kind in kinds:
+            latest = progress.latest(progress.channel_name(kind, dataset.id))
+            if not latest:
+                continue
+            # The inserter is followed from when it's started, and may have
+            # finished already. Otherwise only show a running task, not a
+            # stale report from one that died.
+            if kind == "inserter" or (running and latest["state"] == "PROGRESS"):
+                initial.append(progress_event(kind, dataset.id, latest))
+
+    def stream():
+        yield f"retry: {STREAM_KEEPALIVE * 1000}\n\n"
+        yield from initial
+        if pubsub is None:
+            return
+        try:
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < STREAM_LIFETIME:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    channel = message["channel"].decode()
+                    kind, ds_id = progress.parse_channel(channel)
+                    yield progress_event(kind, ds_id, json.loads(message["data"]))
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= STREAM_KEEPALIVE:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+        except Exception as e:
+            logger.warning("Progress stream stopped: %s", e)
+        finally:
+            pubsub.close()
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def progress_event(kind, ds_id, state):
+    return sse_event("progress", dict(state, dataset_id=ds_id, kind=kind))
+
+
+def reset_progress(kind, dataset_id):
+    """Replace the last run's final report before starting a task, so
+    listeners don't take it for this run's"""
+    progress.publish(
+        progress.channel_name(kind, dataset_id),
+        {"state": "PENDING", "current": 0, "total": 1, "status": "Pending..."},
+    )
 
 
 @checker.route("/admin/resolve/dataset<int:ds_id>")
@@ -305,34 +583,35 @@ def problem_list(ds_id):
 
 @checker.route("/_search_journal")
 def journal_autocomplete():
-    search = request.args.get("search")
+    search = request.args.get("search", "")
+    limit = min(request.args.get("limit", AUTOCOMPLETE_LIMIT, type=int), 100)
     current_app.logger.debug("Search = %s", search)
-    journals = Journal.query.filter(
-        db.or_(Journal.journal.like(search + "%"), Journal.abbrev.like(search + "%"))
-    ).all()
-    current_app.logger.debug(journals)
+    return jsonify(results=get_resolver().search(search, limit=limit))
 
-    return jsonify(results=[x.journal for x in journals])
 
+def load_taxon_indexes():
+    """Prefix index of Atlas taxon names for each rank"""
+    return {
+        rank: PrefixIndex(
+            x.get("original_name").capitalize()
+            for x in atlas_api.get_rank_taxa(rank)
+            if x.get("original_name")
+        )
+        for rank in atlas_api.get_ranks()
+    }
 
-@cache.cached(timeout=120)
-def get_all_taxa():
-    data = {}
-    for rank in atlas_api.get_ranks():
-        data[rank] = [
-            x.get("original_name").lower() for x in atlas_api.get_rank_taxa(rank)
-        ]
-    return data
+
+taxon_indexes = BackgroundRefresh(load_taxon_indexes, config.TAXON_INDEX_MAX_AGE)
 
 
 @checker.route("/_search_taxon")
 def taxon_autocomplete():
-    cached_taxa = get_all_taxa()
-    search = request.args.get("search", "").lower()
+    search = request.args.get("search", "")
     rank = request.args.get("rank")
+    limit = min(request.args.get("limit", AUTOCOMPLETE_LIMIT, type=int), 100)
     current_app.logger.debug("Search = %s", search)
-    rank_data = cached_taxa.get(rank, [])
-    return jsonify(results=[x.capitalize() for x in rank_data if x.startswith(search)])
+    index = taxon_indexes.get(default={}).get(rank)
+    return jsonify(results=index.search(search, limit=limit) if index else [])
 
 
 @checker.route(
@@ -628,6 +907,7 @@ def save_journal(form, article):
             altjournal=form.value.data.lower().replace(".", ""), journal=journal
         )
         db_add_commit(alt)
+        invalidate_journals()
 
     elif option == "new":
         article.journal = form.new_journal_full.data
@@ -635,6 +915,7 @@ def save_journal(form, article):
             journal=form.new_journal_full.data, abbrev=form.new_journal_abbrev.data
         )
         db_add_commit(new)
+        invalidate_journals()
 
     else:
         abort(500)
@@ -662,6 +943,7 @@ def save_atlas_journal(form, article):
         r.raise_for_status()
     except HTTPError:
         abort(500)
+    atlas_api.invalidate_cache("get_journals")
 
 
 def save_taxon(form, compound):
@@ -677,8 +959,8 @@ def save_taxon(form, compound):
             abort(500)
         alt = Taxon.query.filter(Taxon.atlas_taxon_id == tax["id"]).first()
         if not alt:
-            alt = Taxon(taxon=tax["name"], atlas_taxon_id=tax["id"], alternatives="")
-        alt.alternatives += f"@{data['value']}@"
+            alt = Taxon(taxon=tax["name"], atlas_taxon_id=tax["id"])
+        alt.add_alternative(data["value"])
         db_add_commit(alt)
     elif data["select"] == "new":
         post_data = {
@@ -698,6 +980,10 @@ def save_taxon(form, compound):
         except Exception as e:
             flash(e)
             abort(500)
+        atlas_api.invalidate_cache(
+            "search_taxa", "get_ranks", "get_rank_taxa", "get_taxon"
+        )
+        taxon_indexes.refresh()
         compound.atlas_taxon_id = r.json()["id"]
         commit()
     else:
@@ -732,15 +1018,8 @@ def save_compound(form, article, compound):
 
 
 def run_standardization(dataset_id):
-    dataset = Dataset.query.get_or_404(dataset_id)
-    for compound in dataset.get_compounds():
-        smiles = compound.smiles
-        try:
-            compound.smiles = get_standardized_smiles(smiles)
-            db.session.commit()
-        except (ValueError, TypeError, RequestException):
-            print("Error standardizing SMILES %s", smiles)
-            db.session.rollback()
+    dataset = Dataset.load_full(dataset_id)
+    standardize_compounds(dataset.get_compounds())
     dataset.checker_dataset.standardized = True
     try:
         commit()
@@ -749,6 +1028,26 @@ def run_standardization(dataset_id):
         abort(500)
 
 
+def standardize_compounds(compounds):
+    """Replace the compounds' SMILES with standardized SMILES, leaving
+    any that can't be standardized. Not committed."""
+    results = standardize_many(c.smiles for c in compounds)
+    updates = []
+    for compound in compounds:
+        result = results[compound.smiles]
+        if isinstance(result, (ValueError, TypeError, RequestException, TimeoutError)):
+            print("Error standardizing SMILES %s", compound.smiles)
+        elif isinstance(result, Exception):
+            raise result
+        elif result != compound.smiles:
+            updates.append({"id": compound.id, "smiles": result})
+    db.session.bulk_update_mappings(Compound, updates)
+
+
+def chunked(items, size):
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
 def db_add_commit(db_object):
     db.session.add(db_object)
     commit()
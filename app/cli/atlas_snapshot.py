@@ -0,0 +1,39 @@
+"""Build a local snapshot of NP Atlas compounds and taxa for offline checking."""
+import click
+from flask import Blueprint
+
+from ..utils import atlas_snapshot
+from ..utils.atlas_snapshot import AtlasSnapshot
+
+snapshotbp = Blueprint("atlas_snapshot", __name__, cli_group="atlas-snapshot")
+
+
+@snapshotbp.cli.command("build")
+@click.option("--dump", default=None, help="Atlas JSON dump to load instead of the API")
+@click.option("--path", default=atlas_snapshot.SNAPSHOT_PATH, help="Snapshot file")
+def build(dump, path):
+    """Build (or rebuild) the Atlas snapshot index."""
+    if dump:
+        print(f"Loading Atlas dump: {dump}")
+        compounds, taxa = atlas_snapshot.load_dump(dump)
+        source = dump
+    else:
+        print("Downloading compounds and taxa from the Atlas API")
+        compounds = atlas_snapshot.download_compounds()
+        taxa = atlas_snapshot.download_taxa()
+        source = atlas_snapshot.atlas_api.BASE_URL
+    n_compounds, n_taxa = AtlasSnapshot.build(path, compounds, taxa, source=source)
+    print(f"Indexed {n_compounds} compounds and {n_taxa} taxa in {path}")
+
+
+@snapshotbp.cli.command("info")
+@click.option("--path", default=atlas_snapshot.SNAPSHOT_PATH, help="Snapshot file")
+def info(path):
+    """Show when and from where the snapshot was built."""
+    try:
+        snapshot = AtlasSnapshot(path)
+    except FileNotFoundError as e:
+        print(e)
+        return
+    for key, value in snapshot.meta.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,37 @@
+"""Compare local RDKit standardization with stored PubChem results."""
+import click
+from flask import Blueprint
+
+from .. import db
+from ..models import StandardizedSmiles
+from ..utils.rdkit_standardizer import parity
+
+standardizerbp = Blueprint("standardizer", __name__, cli_group="standardizer")
+
+
+@standardizerbp.cli.command("benchmark")
+@click.option("--limit", default=1000, help="Stored PubChem results to compare")
+@click.option("--show", default=10, help="Mismatches to print")
+def benchmark(limit, show):
+    """Standardize inputs PubChem has already standardized, with RDKit,
+    and report how often the two agree and how long RDKit took."""
+    rows = db.session.execute(
+        db.select(StandardizedSmiles.input_smiles, StandardizedSmiles.smiles)
+        .where(StandardizedSmiles.error.is_(None))
+        .order_by(StandardizedSmiles.id.desc())
+        .limit(limit)
+    ).all()
+    if not rows:
+        print("No stored PubChem results to compare against")
+        return
+
+    report = parity(rows)
+    print(f"Compared {report.total} structures")
+    for outcome in ("identical", "inchikey", "connectivity", "different", "error"):
+        print(f"{outcome:>14}: {report.counts[outcome]}")
+    same = report.fraction("identical", "inchikey")
+    print(f"Same structure: {same:.1%}")
+    per_structure = report.seconds / report.total * 1000
+    print(f"RDKit time: {report.seconds:.2f}s ({per_structure:.2f}ms per structure)")
+    for in_smiles, expected, actual in report.mismatches[:show]:
+        print(f"\n  input:   {in_smiles}\n  PubChem: {expected}\n  RDKit:   {actual}")
@@ -59,3 +59,21 @@ API_PASSWORD = os.getenv("API_PASSWORD")
 API_CLIENT_ID = os.getenv("API_CLIENT_ID")
 if not all([API_BASE_URL, API_USERNAME, API_PASSWORD, API_CLIENT_ID]):
     raise ValueError("Missing API configuration")
+# Checker tuning
+CHECKER_PROBLEM_CHUNK_SIZE = int(os.getenv("CHECKER_PROBLEM_CHUNK_SIZE", "500"))
+CHECKER_BATCH_SIZE = int(os.getenv("CHECKER_BATCH_SIZE", "50"))
+# Articles (compounds when standardizing with RDKit) per Celery task,
+# larger datasets are split between workers
+CHECKER_CHUNK_SIZE = int(os.getenv("CHECKER_CHUNK_SIZE", "200"))
+STANDARDIZE_CHUNK_SIZE = int(os.getenv("STANDARDIZE_CHUNK_SIZE", "500"))
+# Concurrent Atlas API writes while inserting a dataset
+INSERTER_WORKERS = int(os.getenv("INSERTER_WORKERS", "8"))
+# Seconds before autocomplete indexes are rebuilt in the background
+TAXON_INDEX_MAX_AGE = int(os.getenv("TAXON_INDEX_MAX_AGE", "600"))
+# Flask-Caching backend, shared by every web and Celery worker by default
+CACHE_TYPE = os.getenv("CACHE_TYPE", "RedisCache")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", f"{REDIS_DATABASE_URI}/2")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "curator:")
+CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", "3600"))
+# Seconds between Celery beat runs of warm_caches
+CACHE_WARM_INTERVAL = int(os.getenv("CACHE_WARM_INTERVAL", "900"))
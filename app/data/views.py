@@ -14,13 +14,13 @@ from flask import (
     url_for,
 )
 from flask_login import current_user, login_required
-from rdkit.Chem import AllChem as Chem
 
 from . import data
 from .. import db
 from ..models import Article, Compound, Curator, Dataset
 from ..utils.NoneDict import NoneDict
 from ..utils import slack_notifier
+from ..utils.Compound import molblock_from_smiles
 from .forms import ArticleForm
 
 slack_notify = os.getenv("SLACK_WEBHOOK_URL")
@@ -429,11 +429,7 @@ def smilesToMolblock():
     data = request.get_json()
     smiles = data.get("smiles")
     try:
-        m = Chem.MolFromSmiles(smiles)
-        Chem.AddHs(m)
-        Chem.Compute2DCoords(m)
-        Chem.RemoveHs(m)
-        molblock = Chem.MolToMolBlock(m)
+        molblock = molblock_from_smiles(smiles)
         current_app.logger.info("Successfully coverted SMILES %s to MOLblock", smiles)
         return jsonify({"molblock": molblock, "success": 1})
     except Exception as e:
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from flask_login import UserMixin
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -99,6 +101,22 @@ class Dataset(db.Model):
     )
     problems = db.relationship("Problem", backref="dataset")
 
+    @classmethod
+    def load_full(cls, ds_id):
+        """Get a dataset with its articles, compounds, checker rows and
+        problems loaded up front, in a fixed number of queries however
+        large the dataset is
+        """
+        articles = db.selectinload(cls.articles)
+        return cls.query.options(
+            db.joinedload(cls.checker_dataset),
+            db.selectinload(cls.problems),
+            articles.selectinload(Article.checker_article),
+            articles.selectinload(Article.compounds).selectinload(
+                Compound.checker_compound
+            ),
+        ).get_or_404(ds_id)
+
     def get_articles(self):
         articles = Article.query.join(dataset_article).filter_by(dataset_id=self.id)
         return articles
@@ -189,6 +207,17 @@ class Article(db.Model):
         "CheckerArticle", uselist=False, backref="article"
     )
 
+    @classmethod
+    def load_many(cls, ids):
+        """Get articles by id, in the order given, with their compounds
+        and checker rows loaded up front"""
+        articles = cls.query.options(
+            db.selectinload(cls.checker_article),
+            db.selectinload(cls.compounds).selectinload(Compound.checker_compound),
+        ).filter(cls.id.in_(ids))
+        by_id = {article.id: article for article in articles}
+        return [by_id[i] for i in ids if i in by_id]
+
 
 class Compound(db.Model):
     """
@@ -247,6 +276,9 @@ class CheckerArticle(db.Model):
     title = db.Column(db.Text)
     abstract = db.Column(db.Text)
     resolved = db.Column(db.Boolean, default=False)
+    # Hash of the curated article and the Atlas version it was checked against
+    fingerprint = db.Column(db.String(64))
+    checked_against = db.Column(db.String(100))
 
 
 class CheckerCompound(db.Model):
@@ -268,6 +300,9 @@ class CheckerCompound(db.Model):
     atlas_taxon_id = db.Column(db.Integer)
     npaid = db.Column(db.Integer)
     resolve = db.Column(db.Integer)
+    # Hash of the curated compound and the Atlas version it was checked against
+    fingerprint = db.Column(db.String(64))
+    checked_against = db.Column(db.String(100))
 
     def get_article_id(self):
         article = self.compound.article[0]
@@ -335,20 +370,49 @@ class Taxon(db.Model):
         Name of taxon
     atlas_taxon_id : int
         Id of known taxon
-    alternatives : str
-        Embedded string of alternatives to certified taxon
+    alternatives : TaxonAlternative
+        Relation to TaxonAlternative table. Alternative names
+        for the certified taxon
     """
 
     __tablename__ = "taxon"
     id = db.Column(db.Integer, primary_key=True)
     taxon = db.Column(db.String(255))
     atlas_taxon_id = db.Column(db.Integer)
-    # Column for holding alternatives, separated by special character @
-    alternatives = db.Column(db.Text)
+    alternatives = db.relationship(
+        "TaxonAlternative", backref="taxon", order_by="TaxonAlternative.id"
+    )
 
     @staticmethod
     def search_alternatives(query):
-        return Taxon.query.filter(Taxon.alternatives.ilike(f"%@{query}@%")).first()
+        return (
+            Taxon.query.join(TaxonAlternative)
+            .filter(TaxonAlternative.name == query)
+            .order_by(Taxon.id)
+            .first()
+        )
+
+    def add_alternative(self, name):
+        """Add an alternative name, unless it is already known"""
+        if not any(alt.name.lower() == name.lower() for alt in self.alternatives):
+            self.alternatives.append(TaxonAlternative(name=name))
+
+
+class TaxonAlternative(db.Model):
+    """Table of alternative names for a Taxon
+
+    Attributes
+    ----------
+    name : str
+        Alternative name of the taxon
+    taxon_id : int
+        Id of the certified taxon
+    """
+
+    __tablename__ = "taxon_alternative"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, index=True)
+    taxon_id = db.Column(db.Integer, db.ForeignKey("taxon.id"), index=True)
 
 
 # Tables for saving info to review
@@ -390,6 +454,67 @@ class Retraction(db.Model):
 
     __tablename__ = "retractions"
     id = db.Column(db.Integer, primary_key=True)
-    article_doi = db.Column(db.String(255))
-    compound_name = db.Column(db.String(255))
-    compound_inchikey = db.Column(db.String(255))
+    article_doi = db.Column(db.String(255), index=True)
+    compound_name = db.Column(db.String(255), index=True)
+    compound_inchikey = db.Column(db.String(255), index=True)
+
+
+class StandardizedSmiles(db.Model):
+    """PubChem standardization results by input SMILES
+
+    Attributes
+    ----------
+    input_hash : str
+        SHA-256 of the input SMILES, which may be too long to index
+    smiles : str
+        Standardized SMILES, None if standardization failed
+    error : str
+        Why standardization failed, retried after a while
+    """
+
+    __tablename__ = "standardized_smiles"
+    id = db.Column(db.Integer, primary_key=True)
+    input_hash = db.Column(db.String(64), nullable=False, unique=True)
+    input_smiles = db.Column(db.Text, nullable=False)
+    smiles = db.Column(db.Text)
+    error = db.Column(db.String(255))
+    created = db.Column(db.DateTime)
+    updated = db.Column(db.DateTime)
+
+
+class AppliedWrite(db.Model):
+    """Atlas API writes the Inserter has made, so a retried insertion
+    skips those that already went through
+
+    Attributes
+    ----------
+    key : str
+        Write key, a SHA-256 of the dataset, action, entity (e.g.
+        "compound:12") and endpoint written
+    payload_hash : str
+        SHA-256 of the data written, to tell if it's changed since
+    """
+
+    __tablename__ = "applied_write"
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False, unique=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey("dataset.id"), index=True)
+    action = db.Column(db.String(16))
+    endpoint = db.Column(db.String(255))
+    payload_hash = db.Column(db.String(64))
+    applied = db.Column(db.DateTime)
+
+
+@contextmanager
+def keep_loaded():
+    """Don't expire loaded objects on commit, so rows eager loaded by
+    e.g. Dataset.load_full aren't lazy loaded again one by one after
+    each commit. Only safe while nothing else writes to those rows.
+    """
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield session
+    finally:
+        session.expire_on_commit = expire_on_commit
@@ -1,7 +1,3 @@
-function timeout(ms) {
-  return new Promise((resolve) => setTimeout(resolve, ms));
-}
-
 async function collectDatasetIds() {
   let datasetIds = [];
   $(".dataset-id").each(function () {
@@ -11,59 +7,110 @@ async function collectDatasetIds() {
   return datasetIds;
 }
 
-async function checkDatasetRunning(datasetId) {
-  let result = await $.getJSON(`/checkerrunning?dsid=${datasetId}`);
-  return result;
+// What each dataset on the page is showing: "standard", "running",
+// "complete" or "idle". Status is sent again whenever the stream
+// reconnects, so only changes are acted on.
+var datasetStates = {};
+
+function showStandardizing(datasetId) {
+  datasetStates[datasetId] = "standard";
+  $(`#dataset-checker-button-${datasetId}`)
+    .attr("disabled", "disabled")
+    .html("Standardization Running");
 }
 
-async function getRunningDatasets(datasetIds) {
-  var standardDatasets = {};
-  var runningDatasets = {};
-  var completeDatasets = [];
-  for (var idx of datasetIds) {
-    const result = await checkDatasetRunning(idx);
-    if (result.standard === true) {
-      standardDatasets[idx] = result.task_id;
-    } else if (result.running === true) {
-      runningDatasets[idx] = result.task_id;
-    } else if (result.complete === true) {
-      completeDatasets.push(idx);
-    }
-  }
-  return [standardDatasets, runningDatasets, completeDatasets];
+function standardizationComplete(datasetId) {
+  datasetStates[datasetId] = "idle";
+  $(`#dataset-checker-button-${datasetId}`)
+    .removeAttr("disabled")
+    .html("Run Checker")
+    .attr("onclick", `startChecker(${datasetId})`);
+
+  markComplete(`#dataset-${datasetId}-completed`);
 }
 
-async function monitorStandardization(datasetId, taskId) {
-  const statusUrl = `/standardstatus?taskid=${taskId}`;
+function standardizationFailed(datasetId) {
+  datasetStates[datasetId] = "idle";
+  alert("Failed to standardize dataset!");
   $(`#dataset-checker-button-${datasetId}`)
-    .attr("disabled", "disabled")
-    .html("Standardization Running");
-  try {
-    result = await $.getJSON(statusUrl);
-    console.log(result);
-  } catch (err) {
-    // console.log(err);
-    throw (
-      "Error, could not get standardization status for Dataset " + datasetId
-    );
+    .removeAttr("disabled")
+    .html("Run Standardization");
+}
+
+function showProgress(datasetId, result) {
+  if (datasetStates[datasetId] !== "running") {
+    datasetStates[datasetId] = "running";
+    initRunningProgress(datasetId);
   }
+  progress = result.total ? parseInt((result.current * 100) / result.total) : 0;
+  $(`#dataset-${datasetId}-progress-bar`).progressbar({ value: progress });
+  $(`#dataset-${datasetId}-progress`).text(`${progress} %`);
+  $(`#dataset-${datasetId}-status`).text(`${result.state} : ${progress} %`);
+}
 
-  if (result.state === "SUCCESS") {
-    $(`#dataset-checker-button-${datasetId}`)
-      .removeAttr("disabled")
-      .html("Run Checker")
-      .attr("onclick", `startChecker(${datasetId})`);
+function onStatus(result) {
+  const datasetId = result.dataset_id;
+  if (result.standard === true) {
+    if (datasetStates[datasetId] !== "standard") {
+      showStandardizing(datasetId);
+    }
+  } else if (result.running === true) {
+    if (datasetStates[datasetId] !== "running") {
+      showProgress(datasetId, { state: "PENDING", current: 0, total: 1 });
+    }
+  } else if (result.complete === true) {
+    if (datasetStates[datasetId] !== "complete") {
+      completeDataset(datasetId, `/admin/resolve/dataset${datasetId}`);
+    }
+  }
+}
 
-    markComplete(`#dataset-${datasetId}-completed`);
+function onCheckerProgress(datasetId, result) {
+  if (result.state === "SUCCESS") {
+    if (datasetStates[datasetId] !== "complete") {
+      completeDataset(datasetId, `/admin/resolve/dataset${datasetId}`);
+    }
   } else if (result.state === "FAILURE") {
-    alert("Failed to standardize dataset!");
-    $(`#dataset-checker-button-${datasetId}`)
-      .removeAttr("disabled")
-      .html("Run Standardization");
+    datasetStates[datasetId] = "idle";
+    $(`#dataset-checker-button-${datasetId}`).removeAttr("disabled");
+    failedDataset(datasetId);
   } else {
-    await timeout(3000);
-    monitorStandardization(datasetId, taskId);
+    showProgress(datasetId, result);
+  }
+}
+
+function onStandardizerProgress(datasetId, result) {
+  if (result.state === "SUCCESS") {
+    standardizationComplete(datasetId);
+  } else if (result.state === "FAILURE") {
+    standardizationFailed(datasetId);
+  } else if (datasetStates[datasetId] !== "standard") {
+    showStandardizing(datasetId);
+  }
+}
+
+// Follow the datasets' status and task progress as server-sent events.
+// EventSource reconnects by itself when the server closes the stream.
+function monitorDatasets(datasetIds) {
+  if (datasetIds.length === 0) {
+    return;
   }
+  const query = datasetIds.map((id) => `dsid=${id}`).join("&");
+  const source = new EventSource(`/progress/stream?${query}`);
+  source.addEventListener("status", (event) => {
+    onStatus(JSON.parse(event.data));
+  });
+  source.addEventListener("progress", (event) => {
+    const result = JSON.parse(event.data);
+    if (result.kind === "checker") {
+      onCheckerProgress(result.dataset_id, result);
+    } else if (result.kind === "standardizer") {
+      onStandardizerProgress(result.dataset_id, result);
+    }
+  });
+  source.onerror = (err) => {
+    console.log("Progress stream interrupted, reconnecting", err);
+  };
 }
 
 function initRunningProgress(datasetId) {
@@ -110,6 +157,7 @@ function completeDataset(datasetId, resolveUrl) {
     </div>
     `);
   newRow.insertAfter(infoRow);
+  datasetStates[datasetId] = "complete";
   // Fix button
   $(`#dataset-checker-button-${datasetId}`)
     .text("Run Checker")
@@ -131,34 +179,6 @@ function failedDataset(datasetId) {
   newRow.insertAfter(infoRow);
 }
 
-async function monitorChecker(datasetId, taskId) {
-  const statusUrl = "/checkerstatus?taskid=" + taskId;
-  try {
-    result = await $.getJSON(statusUrl);
-  } catch (err) {
-    // console.log(err);
-    throw "Error, could not get Checker status for Dataset " + datasetId;
-  }
-
-  if (result.state == "SUCCESS") {
-    resolveUrl = result.result;
-    completeDataset(datasetId, resolveUrl);
-  } else if (result.state == "FAILURE") {
-    $(`#dataset-checker-button-${datasetId}`).removeAttr("disabled");
-    failedDataset(datasetId);
-  } else {
-    progress = parseInt((result.current * 100) / result.total);
-    $(`#dataset-${datasetId}-progress-bar`).progressbar({ value: progress });
-    $(`#dataset-${datasetId}-progress`).text(`${progress} %`);
-    $(`#dataset-${datasetId}-status`).text(`${result.state} : ${progress} %`);
-
-    if (progress < 100) {
-      await timeout(2000);
-      monitorChecker(datasetId, taskId);
-    }
-  }
-}
-
 function startChecker(datasetId) {
   // if dataset already running
   if (
@@ -185,8 +205,8 @@ function startChecker(datasetId) {
 
   $.post(startUrl, {})
     .done(function (retJson) {
-      initRunningProgress(datasetId);
-      monitorChecker(datasetId, retJson.task_id);
+      // Progress follows on the dataset's stream
+      showProgress(datasetId, { state: "PENDING", current: 0, total: 1 });
     })
     .fail(() => {
       alert("Failed to start checker for dataset " + datasetId);
@@ -197,7 +217,7 @@ function startStandardization(datasetId) {
   $.post(`/standardize/dataset${datasetId}`, {})
     .done((retJson) => {
       console.log(retJson);
-      monitorStandardization(datasetId, retJson.task_id);
+      showStandardizing(datasetId);
     })
     .fail(() => {
       alert("Failed to start standardization for dataset " + datasetId);
@@ -217,45 +237,13 @@ function markIncomplete(idString) {
   statusObject.addClass("fa-times-circle").addClass("red");
 }
 
-// First get all the dataset IDs on the page
-// Next check if they are running and get the Celery Task ID if so
-//  -> Store these results in a JSON
-// Finally display results and start monitoring of running tasks
+// First get all the dataset IDs on the page, then follow them on the
+// progress stream, which starts with each one's current status
 async function main() {
   try {
     var datasetIds = await collectDatasetIds();
     console.log("Datasets ids: [" + datasetIds.join(", ") + "]");
-    var [
-      standardDatasets,
-      runningDatasets,
-      completeDatasets,
-    ] = await getRunningDatasets(datasetIds);
-    console.log(
-      "Standardizing Datasets: [" +
-        Object.keys(standardDatasets).join(", ") +
-        "]"
-    );
-    console.log(
-      "Running Datasets: [" + Object.keys(runningDatasets).join(", ") + "]"
-    );
-    console.log("Complete Datasets: [" + completeDatasets.join(", ") + "]");
-
-    for (var idv of completeDatasets) {
-      let resolveUrl = `/admin/resolve/dataset${idv}`;
-      completeDataset(idv, resolveUrl);
-    }
-
-    for (var idw of Object.keys(standardDatasets)) {
-      let taskId = standardDatasets[idw];
-      monitorStandardization(idw, taskId);
-    }
-
-    // Run monitoring of datasets
-    for (var idx of Object.keys(runningDatasets)) {
-      initRunningProgress(idx);
-      let taskId = runningDatasets[idx];
-      monitorChecker(idx, taskId);
-    }
+    monitorDatasets(datasetIds);
   } catch (err) {
     console.log(err);
   }
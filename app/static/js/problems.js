@@ -1,7 +1,3 @@
-function timeout(ms) {
-  return new Promise((resolve) => setTimeout(resolve, ms));
-}
-
 function insertionComplete(datasetId, result) {
   // Temporary function
   alert("Dataset " + datasetId + " complete!");
@@ -15,30 +11,28 @@ function insertionComplete(datasetId, result) {
   finish.insertAfter($(`#dataset-insert-button`).parent());
 }
 
-async function monitorInsertion(datasetId, taskId) {
-  const statusUrl = `/insertstatus?taskid=${taskId}`;
+function monitorInsertion(datasetId) {
   $(`#dataset-insert-button`).attr("disabled", "disabled");
-  try {
-    result = await $.getJSON(statusUrl);
-  } catch (err) {
-    throw "Error, could not insert Dataset " + datasetId;
-  }
-
-  if (result.state === "SUCCESS") {
-    insertionComplete(datasetId, result.result);
-  } else if (result.state === "FAILURE") {
-    alert("Failed to insert dataset!");
-    $(`#dataset-insert-button`).removeAttr("disabled");
-  } else {
-    await timeout(3000);
-    monitorInsertion(datasetId, taskId);
-  }
+  const source = new EventSource(
+    `/progress/stream?dsid=${datasetId}&kind=inserter`
+  );
+  source.addEventListener("progress", (event) => {
+    const result = JSON.parse(event.data);
+    if (result.state === "SUCCESS") {
+      source.close();
+      insertionComplete(datasetId, result.result);
+    } else if (result.state === "FAILURE") {
+      source.close();
+      alert("Failed to insert dataset!");
+      $(`#dataset-insert-button`).removeAttr("disabled");
+    }
+  });
 }
 
 function startInserter(datasetId) {
   $.post("/insert/dataset" + datasetId, {})
     .done((retJson) => {
-      monitorInsertion(datasetId, retJson.task_id);
+      monitorInsertion(datasetId);
     })
     .fail(() => {
       alert("Failed to insert Dataset " + datasetId);
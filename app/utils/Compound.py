@@ -2,40 +2,52 @@
 """Compound object to simplify checking
 """
 import copy
+import hashlib
 import logging
-from rdkit import Chem
-from rdkit.Chem import rdMolDescriptors, rdDepictor, Descriptors, SaltRemover
-from rdkit.Chem.AllChem import ReplaceSubstructs
-
-# Silence RDKit Warning
-from rdkit import rdBase
+from os import getenv
 
+from rdkit import Chem, rdBase
+from rdkit.Chem import Descriptors, SaltRemover, rdDepictor, rdMolDescriptors
+from rdkit.Chem.AllChem import ReplaceSubstructs
 from requests.exceptions import RequestException
 
-from .timeout import exit_after
+from . import pubchem_smiles_standardizer
+from .cache_store import MISSING, CacheStore
 from .pubchem_smiles_standardizer import get_standardized_smiles
 
+# Silence RDKit Warning
 rdBase.DisableLog("rdApp.warning")
 
+# Seconds to wait for PubChem to standardize a structure
+STANDARDIZE_TIMEOUT = float(getenv("STANDARDIZE_TIMEOUT", "5"))
+
+# Computed structure properties keyed by a hash of the input SMILES
+STRUCTURE_CACHE_TTL = int(getenv("STRUCTURE_CACHE_TTL", str(30 * 86400)))
+STRUCTURE_CACHE_MAX_ENTRIES = int(getenv("STRUCTURE_CACHE_MAX_ENTRIES", "200000"))
+structure_cache = CacheStore(
+    "structure", STRUCTURE_CACHE_TTL, STRUCTURE_CACHE_MAX_ENTRIES
+)
+
+
 class Compound(object):
     def __init__(self, smiles, **kwargs):
         """Initialize Compound object
 
-            :smiles (str) - Input smiles string for compound object
+        :smiles (str) - Input smiles string for compound object
 
-            kwargs:
-            :name (str) - Default = "Unknown" - Name of compound, also sets
-                          name in Molblock
-            :standardize (bool) - Default = False - Control whether SMILES is
-                                  subject to PubChem Standardization attempt
+        kwargs:
+        :name (str) - Default = "Unknown" - Name of compound, also sets
+                      name in Molblock
+        :standardize (bool) - Default = False - Control whether SMILES is
+                              subject to PubChem Standardization attempt
         """
 
         # Standardize as a kwarg to allow disabling PubChem Standardization
         # explicitly
         standardize = kwargs.get("standardize", False)
         if standardize:
-            # Try to standardize the smiles, will time out after 5 seconds
-            # and resort to supplied smiles string
+            # Try to standardize the smiles, will time out after
+            # STANDARDIZE_TIMEOUT seconds and resort to supplied smiles string
             self._standardizeSmiles(smiles=smiles)
         else:
             self.smiles = smiles
@@ -54,13 +66,26 @@ class Compound(object):
         self.calcMolprops()
 
     def __repr__(self):
-        """repr for debugging
-        """
+        """repr for debugging"""
         return "<Compound(name='%s', formula='%s')>" % (self.name, self.formula)
 
     def copy(self):
         return copy.deepcopy(self)
 
+    def properties(self):
+        """Plain dict of computed properties, as stored in the structure cache"""
+        return {
+            "smiles": self.smiles,
+            "inchi": self.inchi,
+            "inchikey": self.inchikey,
+            "formula": self.formula,
+            "accurate_mass": self.accurate_mass,
+            "mass": self.mass,
+            "m_plus_h": self.m_plus_h,
+            "m_plus_na": self.m_plus_na,
+            "molblock": self.molblock,
+        }
+
     def calcMolprops(self):
         """Calculate masses for mol using RDKit
 
@@ -133,15 +158,25 @@ class Compound(object):
         return is_fragments
 
     def _standardizeSmiles(self, smiles=None):
-        """Use PubChem webservices to standardize smiles
+        """Use PubChem webservices (or RDKit, with SMILES_STANDARDIZER=rdkit)
+        to standardize smiles
         If the service timesout, or fails for some other reason
         SMILES remains the same
         """
         if not smiles:
             smiles = self.smiles
+        if pubchem_smiles_standardizer.STANDARDIZER == "rdkit":
+            # Local and quick, no need for the timeout
+            try:
+                self.smiles = get_standardized_smiles(smiles)
+            except (TypeError, ValueError) as e:
+                logging.error("Unable to standardize %s", smiles)
+                logging.error(e)
+                self.smiles = smiles
+            return
         try:
             self.smiles = standardize_smiles_wrapper(smiles)
-        except (KeyboardInterrupt, TypeError, ValueError, RequestException) as e:
+        except (TimeoutError, TypeError, ValueError, RequestException) as e:
             logging.error("Unable to standardize %s", smiles)
             logging.error(e)
             self.smiles = smiles
@@ -201,11 +236,58 @@ def calculate_exact_mass(smiles):
     return Descriptors.ExactMolWt(m)
 
 
-@exit_after(5)
 def standardize_smiles_wrapper(smiles):
-    return get_standardized_smiles(smiles)
+    return get_standardized_smiles(smiles, timeout=STANDARDIZE_TIMEOUT)
+
+
+def smiles_key(smiles, *variant):
+    """Cache key for a SMILES string (plus anything else the result depends on)"""
+    data = "\t".join([smiles, *map(str, variant)])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def set_molblock_name(molblock, name):
+    """Replace the title (first) line of a molblock"""
+    return name + "\n" + molblock.split("\n", 1)[1]
+
+
+def cached_properties(smiles, name="Unknown", standardize=False):
+    """Properties of the cleaned structure for a SMILES string (see
+    Compound.properties). Only computed with RDKit on a cache miss.
+    PubChem standardized results aren't cached as PubChem failures fall
+    back to the input SMILES, RDKit standardized results are.
+    """
+    engine = pubchem_smiles_standardizer.STANDARDIZER
+    cacheable = not standardize or engine == "rdkit"
+    key = smiles_key(smiles, f"standard-{engine}" if standardize else "clean")
+    props = structure_cache.get(key) if cacheable else MISSING
+    if props is MISSING:
+        compound = Compound(smiles, standardize=standardize)
+        compound.cleanStructure()
+        props = compound.properties()
+        if cacheable:
+            structure_cache.set(key, props)
+    props["molblock"] = set_molblock_name(props["molblock"], name)
+    return props
 
 
 def inchikey_from_smiles(smiles):
-    m = Chem.MolFromSmiles(smiles)
-    return Chem.InchiToInchiKey(Chem.MolToInchi(m))
+    key = smiles_key(smiles, "inchikey")
+    inchikey = structure_cache.get(key)
+    if inchikey is MISSING:
+        m = Chem.MolFromSmiles(smiles)
+        inchikey = Chem.InchiToInchiKey(Chem.MolToInchi(m))
+        structure_cache.set(key, inchikey)
+    return inchikey
+
+
+def molblock_from_smiles(smiles):
+    """2D molblock for drawing a SMILES string in the structure editor"""
+    key = smiles_key(smiles, "depict")
+    molblock = structure_cache.get(key)
+    if molblock is MISSING:
+        m = Chem.MolFromSmiles(smiles)
+        rdDepictor.Compute2DCoords(m)
+        molblock = Chem.MolToMolBlock(m)
+        structure_cache.set(key, molblock)
+    return molblock
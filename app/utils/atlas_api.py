@@ -1,9 +1,14 @@
 """Utility functions accessing NP Atlas API"""
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from os import getenv
-from typing import Dict, List
+from typing import Callable, Dict, Hashable, Iterable, List
 from urllib.parse import quote
 
-import requests
+from .cache_store import MISSING, CacheStore
+from .http_client import EndpointStats, HttpClient
 
 BASE_URL = getenv("API_BASE_URL", "http://localhost/api/v1")
 APIKEY = getenv("ATLAS_APIKEY")
@@ -11,74 +16,234 @@ if APIKEY:
     headers = {"X-Api-Key": APIKEY}
 else:
     headers = {}
+# Number of concurrent requests allowed when mapping lookups over many keys
+MAX_WORKERS = int(getenv("ATLAS_API_MAX_WORKERS", "8"))
+# Connection pool, timeouts (seconds) and retry policy for API calls
+POOL_SIZE = int(getenv("ATLAS_API_POOL_SIZE", str(max(10, MAX_WORKERS))))
+CONNECT_TIMEOUT = float(getenv("ATLAS_API_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(getenv("ATLAS_API_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(getenv("ATLAS_API_MAX_RETRIES", "3"))
+# Keys resolved per round of a bulk lookup
+BULK_CHUNK_SIZE = int(getenv("ATLAS_API_BULK_CHUNK_SIZE", "200"))
+# Response cache settings, shared by every cached endpoint
+CACHE_TTL = int(getenv("ATLAS_CACHE_TTL", "86400"))
+CACHE_MAX_ENTRIES = int(getenv("ATLAS_CACHE_MAX_ENTRIES", "100000"))
+
+client = HttpClient(
+    pool_size=POOL_SIZE,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    max_retries=MAX_RETRIES,
+    headers=headers,
+)
+# Cache stores by endpoint name, populated by @cached
+caches: Dict[str, CacheStore] = {}
+# Token identifying the current generation of cached responses
+_generation = CacheStore("atlas_api:generation", CACHE_TTL, 1)
+
+
+def cached(ttl: int = CACHE_TTL):
+    """Cache successful responses of an API helper in the shared cache store.
+    Exceptions are not cached.
+    """
+
+    def outer(fn):
+        store = CacheStore(f"atlas_api:{fn.__name__}", ttl, CACHE_MAX_ENTRIES)
+        caches[fn.__name__] = store
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            key = json.dumps([args, kwargs], sort_keys=True)
+            value = store.get(key)
+            if value is MISSING:
+                value = fn(*args, **kwargs)
+                store.set(key, value)
+            return value
+
+        def refresh(*args, **kwargs) -> bool:
+            """Fetch and cache a fresh response, whether cached or not.
+            Returns True if it differs from the one it replaced.
+            """
+            key = json.dumps([args, kwargs], sort_keys=True)
+            value = fn(*args, **kwargs)
+            previous = store.get(key)
+            store.set(key, value)
+            return previous is not MISSING and previous != value
+
+        inner.cache = store
+        inner.refresh = refresh
+        return inner
+
+    return outer
+
+
+def invalidate_cache(*endpoints: str):
+    """Clear cached responses for the given endpoints, or all of them.
+    Call after writing to the Atlas so stale results aren't served.
+    """
+    for endpoint in endpoints or caches.keys():
+        caches[endpoint].clear()
+    new_cache_generation()
+
+
+def new_cache_generation():
+    """Mark results computed from earlier responses as possibly stale"""
+    _generation.delete("token")
+
+
+def cache_generation() -> str:
+    """Token that changes whenever cached responses may have gone stale,
+    i.e. on invalidation or after CACHE_TTL. Results computed from the API
+    under the same token are still current. A fresh token is returned
+    every call if the cache store is unavailable.
+    """
+    token = _generation.get("token")
+    if token is MISSING:
+        token = uuid.uuid4().hex
+        _generation.set("token", token)
+    return token
 
 
 def prefix_url(url):
     return f"{BASE_URL}/{url}"
 
 
+def stats() -> Dict[str, EndpointStats]:
+    """Per-endpoint call, error, retry and latency counters for this process"""
+    return client.stats
+
+
+@cached()
 def get_compound(npaid: int) -> Dict:
-    r = requests.get(prefix_url(f"compound/{npaid}"), headers=headers)
+    r = client.request("GET", prefix_url(f"compound/{npaid}"), "get_compound")
     r.raise_for_status()
     return r.json()
 
 
+@cached()
 def get_compound_molblock(npaid: int) -> str:
-    r = requests.get(prefix_url(f"compound/{npaid}/mol?encode=file"), headers=headers)
+    r = client.request(
+        "GET", prefix_url(f"compound/{npaid}/mol?encode=file"), "get_compound_molblock"
+    )
     r.raise_for_status()
     return r.text
 
 
+@cached()
 def search_inchikey(structure: str) -> List[Dict]:
-    r = requests.post(
+    r = client.request(
+        "POST",
         prefix_url(
             f"compounds/structureSearch?structure={structure}&type=inchikey&method=sim",
         ),
-        headers=headers,
+        "search_inchikey",
     )
+    r.raise_for_status()
     return r.json()
 
 
+def search_inchikeys_bulk(
+    keys: Iterable[str], max_workers: int = MAX_WORKERS, return_exceptions=False
+) -> Dict[str, List[Dict]]:
+    """Structure search many (full or flat) InChIKeys at once.
+    Returns a dict of inchikey -> search_inchikey results.
+
+    The Atlas API has no multi-structure search endpoint, so keys are
+    fanned out in chunks over the connection pool; cached keys never
+    leave the process. If return_exceptions is set, failed keys map to
+    their exception instead of raising.
+    """
+    keys = list(dict.fromkeys(keys))
+    results = {}
+    for i in range(0, len(keys), BULK_CHUNK_SIZE):
+        chunk = keys[i : i + BULK_CHUNK_SIZE]
+        results.update(map_concurrent(search_inchikey, chunk, max_workers=max_workers))
+    if not return_exceptions:
+        for res in results.values():
+            if isinstance(res, Exception):
+                raise res
+    return results
+
+
+@cached()
 def search_name(name: str) -> List[str]:
     url_name = quote(name)
-    r = requests.get(
-        prefix_url(f"compounds/?name={url_name}&limit=10"), headers=headers
+    r = client.request(
+        "GET", prefix_url(f"compounds/?name={url_name}&limit=10"), "search_name"
     )
+    r.raise_for_status()
+    return r.json()
+
+
+def list_compounds(skip: int = 0, limit: int = 1000) -> List[Dict]:
+    r = client.request(
+        "GET", prefix_url(f"compounds/?skip={skip}&limit={limit}"), "list_compounds"
+    )
+    r.raise_for_status()
     return r.json()
 
 
 def get_reference(doi: str) -> Dict:
     url_doi = quote(doi)
-    r = requests.get(prefix_url(f"reference/{url_doi}"), headers=headers)
+    r = client.request("GET", prefix_url(f"reference/{url_doi}"), "get_reference")
     r.raise_for_status()
     return r.json()
 
 
+@cached(ttl=3600)
 def get_journals() -> List[str]:
-    r = requests.get(prefix_url("reference/journals"), headers=headers)
+    r = client.request("GET", prefix_url("reference/journals"), "get_journals")
     r.raise_for_status()
     return r.json()
 
 
+@cached()
 def search_taxa(taxon: str) -> List[Dict]:
     taxon = taxon.strip()
-    r = requests.post(
-        prefix_url("taxon/search") + f"?taxon={taxon}&rank=all", headers=headers
+    r = client.request(
+        "POST", prefix_url("taxon/search") + f"?taxon={taxon}&rank=all", "search_taxa"
     )
+    r.raise_for_status()
     return r.json()
 
 
+@cached()
 def get_ranks() -> List[str]:
-    r = requests.get(prefix_url("taxon/"), headers=headers)
+    r = client.request("GET", prefix_url("taxon/"), "get_ranks")
+    r.raise_for_status()
     return r.json()
 
 
+@cached()
 def get_rank_taxa(rank: str) -> List[str]:
-    r = requests.get(prefix_url(f"taxon/{rank}/"), headers=headers)
+    r = client.request("GET", prefix_url(f"taxon/{rank}/"), "get_rank_taxa")
+    r.raise_for_status()
     return r.json()
 
 
+@cached()
 def get_taxon(taxon: str, rank: str) -> Dict:
-    r = requests.get(prefix_url(f"taxon/{rank}/{taxon}"), headers=headers)
+    r = client.request("GET", prefix_url(f"taxon/{rank}/{taxon}"), "get_taxon")
     r.raise_for_status()
     return r.json()
+
+
+def map_concurrent(
+    fn: Callable, keys: Iterable[Hashable], max_workers: int = MAX_WORKERS
+) -> Dict:
+    """Call fn once for every unique key over a bounded thread pool.
+    Returns a dict of key -> result. Exceptions raised by fn are stored
+    as the result for that key so one bad lookup doesn't sink the batch.
+    """
+
+    def _call(key):
+        try:
+            return fn(key)
+        except Exception as e:
+            return e
+
+    unique_keys = list(dict.fromkeys(keys))
+    if max_workers <= 1 or len(unique_keys) <= 1:
+        return {key: _call(key) for key in unique_keys}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(unique_keys, executor.map(_call, unique_keys)))
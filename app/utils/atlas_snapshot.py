@@ -0,0 +1,175 @@
+"""Local SQLite index of NP Atlas compounds and taxa for offline checking
+
+A snapshot answers the structure, name and taxon searches the checker
+makes against the Atlas API, returning results shaped like the API's
+so the two can be used interchangeably.
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+from os import getenv
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import atlas_api
+
+SNAPSHOT_PATH = getenv("ATLAS_SNAPSHOT_PATH", "atlas_snapshot.sqlite")
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE compound (
+    npaid INTEGER PRIMARY KEY,
+    name TEXT,
+    name_lower TEXT,
+    inchikey TEXT,
+    flat TEXT
+);
+CREATE INDEX ix_compound_inchikey ON compound (inchikey);
+CREATE INDEX ix_compound_flat ON compound (flat);
+CREATE INDEX ix_compound_name_lower ON compound (name_lower);
+CREATE TABLE taxon (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    name_lower TEXT,
+    rank TEXT
+);
+CREATE INDEX ix_taxon_name_lower ON taxon (name_lower);
+"""
+
+
+class AtlasSnapshot:
+    """Read-only view of a snapshot file built by `AtlasSnapshot.build`"""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No Atlas snapshot at {path}")
+        self.path = path
+        self.conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    @property
+    def meta(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT key, value FROM meta"))
+
+    def _compounds(self, where: str, *params) -> List[Dict]:
+        rows = self.conn.execute(
+            f"SELECT npaid, name, inchikey FROM compound WHERE {where}", params
+        )
+        return [
+            {"npaid": npaid, "original_name": name, "inchikey": inchikey}
+            for npaid, name, inchikey in rows
+        ]
+
+    def search_inchikey(self, structure: str) -> List[Dict]:
+        """Full InChIKey or first block (flat) match"""
+        if "-" in structure:
+            return self._compounds("inchikey = ?", structure)
+        return self._compounds("flat = ?", structure)
+
+    def search_name(self, name: str) -> List[Dict]:
+        """Case-insensitive substring name match, capped like the API's"""
+        pattern = "%{}%".format(re.sub(r"([%_\\])", r"\\\1", name.lower()))
+        return self._compounds("name_lower LIKE ? ESCAPE '\\' LIMIT 10", pattern)
+
+    def search_taxa(self, taxon: str) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT id, name, rank FROM taxon WHERE name_lower = ?",
+            (taxon.strip().lower(),),
+        )
+        return [{"id": id_, "name": name, "rank": rank} for id_, name, rank in rows]
+
+    @staticmethod
+    def build(
+        path: str,
+        compounds: Iterable[Dict],
+        taxa: Iterable[Dict],
+        source: str = "",
+    ) -> Tuple[int, int]:
+        """Write a new snapshot atomically, replacing any existing file.
+        Returns the number of compounds and taxa indexed.
+        """
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        conn.executescript(SCHEMA)
+        n_compounds = n_taxa = 0
+        for n_compounds, row in enumerate(_compound_rows(compounds), 1):
+            conn.execute("INSERT OR REPLACE INTO compound VALUES (?, ?, ?, ?, ?)", row)
+        for n_taxa, row in enumerate(_taxon_rows(taxa), 1):
+            conn.execute("INSERT OR REPLACE INTO taxon VALUES (?, ?, ?, ?)", row)
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("built_at", time.strftime("%Y-%m-%d %H:%M:%S")), ("source", source)],
+        )
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+        return n_compounds, n_taxa
+
+
+def _parse_npaid(npaid) -> Optional[int]:
+    """NPAIDs may be ints or strings like NPA012345"""
+    if isinstance(npaid, str):
+        npaid = re.sub(r"\D", "", npaid)
+    return int(npaid) if npaid not in (None, "") else None
+
+
+def _compound_rows(compounds: Iterable[Dict]) -> Iterator[Tuple]:
+    for c in compounds:
+        npaid = _parse_npaid(c.get("npaid"))
+        inchikey = c.get("inchikey") or c.get("compound_inchikey")
+        if npaid is None or not inchikey:
+            continue
+        name = c.get("original_name") or c.get("compound_name") or c.get("name") or ""
+        yield npaid, name, name.lower(), inchikey, inchikey.split("-")[0]
+
+
+def _taxon_rows(taxa: Iterable[Dict]) -> Iterator[Tuple]:
+    for t in taxa:
+        name = t.get("name") or t.get("original_name")
+        if t.get("id") is None or not name:
+            continue
+        yield t["id"], name, name.lower(), t.get("rank")
+
+
+def taxa_from_dump(compounds: Iterable[Dict]) -> Iterator[Dict]:
+    """Taxa referenced by compound origin organisms in an Atlas JSON dump"""
+    for c in compounds:
+        taxon = (c.get("origin_organism") or {}).get("taxon") or {}
+        if taxon:
+            yield taxon
+            yield from taxon.get("ancestors") or []
+
+
+def load_dump(dump_path: str) -> Tuple[List[Dict], List[Dict]]:
+    """Read compounds and taxa from an Atlas JSON dump. The dump is either
+    a list of compounds or an object with "compounds" and "taxa" lists.
+    """
+    with open(dump_path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        compounds = data.get("compounds", [])
+        taxa = data.get("taxa") or list(taxa_from_dump(compounds))
+    else:
+        compounds = data
+        taxa = list(taxa_from_dump(compounds))
+    return compounds, taxa
+
+
+def download_compounds(page_size: int = 1000) -> Iterator[Dict]:
+    skip = 0
+    while True:
+        page = atlas_api.list_compounds(skip=skip, limit=page_size)
+        if not page:
+            return
+        yield from page
+        skip += len(page)
+
+
+def download_taxa() -> Iterator[Dict]:
+    for rank in atlas_api.get_ranks():
+        for taxon in atlas_api.get_rank_taxa(rank):
+            yield dict(taxon, rank=taxon.get("rank", rank))
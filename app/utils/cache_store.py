@@ -0,0 +1,224 @@
+"""Persistent key/value caches with per-namespace TTL and LRU eviction
+
+Backed by Redis when CACHE_STORE_URL is a redis:// URL, or by a local
+SQLite file when it is a path. Set CACHE_STORE_URL=none to disable.
+Values must be JSON serializable.
+
+Cache failures never break callers: if the backend can't be reached
+the store behaves as a miss and backs off for a while before retrying.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from os import getenv
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_STORE_URL = getenv("CACHE_STORE_URL") or "redis://{}:6379/1".format(
+    getenv("REDIS", "127.0.0.1")
+)
+# Seconds to stop using a backend after it fails
+BACKOFF = 60
+
+MISSING = object()
+
+
+class RedisBackend:
+    """Each entry is a string key with a TTL; a sorted set per namespace
+    tracks last access time for LRU eviction."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(
+            url, socket_connect_timeout=1, socket_timeout=2
+        )
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"cache:{namespace}:{key}"
+
+    @staticmethod
+    def _lru(namespace: str) -> str:
+        return f"cache-lru:{namespace}"
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        value = self.client.get(self._key(namespace, key))
+        if value is not None:
+            self.client.zadd(self._lru(namespace), {key: time.time()})
+            return value.decode()
+        return None
+
+    def set(self, namespace: str, key: str, value: str, ttl: int, max_entries: int):
+        lru = self._lru(namespace)
+        pipe = self.client.pipeline()
+        pipe.set(self._key(namespace, key), value, ex=ttl)
+        pipe.zadd(lru, {key: time.time()})
+        pipe.zcard(lru)
+        size = pipe.execute()[-1]
+        if size > max_entries:
+            evicted = self.client.zpopmin(lru, size - max_entries)
+            if evicted:
+                keys = [self._key(namespace, k.decode()) for k, _ in evicted]
+                self.client.delete(*keys)
+
+    def delete(self, namespace: str, key: str):
+        self.client.delete(self._key(namespace, key))
+        self.client.zrem(self._lru(namespace), key)
+
+    def clear(self, namespace: str):
+        keys = list(self.client.scan_iter(match=self._key(namespace, "*")))
+        keys.append(self._lru(namespace))
+        self.client.delete(*keys)
+
+
+class SQLiteBackend:
+    """Single-file local store, safe to share between processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, value TEXT, expires REAL, accessed REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_accessed "
+                "ON cache (namespace, accessed)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads or processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE namespace=? AND key=? AND expires>?",
+                (namespace, key, now),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE cache SET accessed=? WHERE namespace=? AND key=?",
+                    (now, namespace, key),
+                )
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: str, ttl: int, max_entries: int):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, now + ttl, now),
+            )
+            (size,) = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace=?", (namespace,)
+            ).fetchone()
+            if size > max_entries:
+                # Drop expired entries first, then least recently used
+                size -= conn.execute(
+                    "DELETE FROM cache WHERE namespace=? AND expires<=?",
+                    (namespace, now),
+                ).rowcount
+                conn.execute(
+                    "DELETE FROM cache WHERE namespace=? AND key IN ("
+                    "SELECT key FROM cache WHERE namespace=? "
+                    "ORDER BY accessed LIMIT ?)",
+                    (namespace, namespace, max(0, size - max_entries)),
+                )
+
+    def delete(self, namespace: str, key: str):
+        with self._conn() as conn:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace=? AND key=?", (namespace, key)
+            )
+
+    def clear(self, namespace: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache WHERE namespace=?", (namespace,))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_backend_failed_at = 0.0
+
+
+def get_backend():
+    """Return the process-wide cache backend, or None if caching is off"""
+    global _backend
+    if _backend is None and CACHE_STORE_URL.lower() != "none":
+        with _backend_lock:
+            if _backend is None:
+                if CACHE_STORE_URL.startswith("redis://"):
+                    _backend = RedisBackend(CACHE_STORE_URL)
+                else:
+                    _backend = SQLiteBackend(CACHE_STORE_URL)
+    return _backend
+
+
+class CacheStore:
+    """A namespaced view on the shared cache backend
+
+    Parameters
+    ----------
+    namespace : str
+        Prefix separating this cache from others in the backend
+    ttl : int
+        Seconds before an entry expires
+    max_entries : int
+        Least recently used entries are evicted above this size
+    """
+
+    def __init__(self, namespace: str, ttl: int, max_entries: int = 100000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _call(self, method: str, *args):
+        global _backend_failed_at
+        if time.time() - _backend_failed_at < BACKOFF:
+            return None
+        try:
+            backend = get_backend()
+            if backend is None:
+                return None
+            return getattr(backend, method)(self.namespace, *args)
+        except Exception as e:
+            logger.warning("Cache backend unavailable, bypassing cache: %s", e)
+            _backend_failed_at = time.time()
+            return None
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISSING"""
+        raw = self._call("get", key)
+        if raw is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any):
+        self._call("set", key, json.dumps(value), self.ttl, self.max_entries)
+
+    def delete(self, key: str):
+        self._call("delete", key)
+
+    def clear(self):
+        self._call("clear")
@@ -0,0 +1,277 @@
+"""Pooled keep-alive HTTP client with timeouts, retries and call stats
+
+One requests.Session is kept per process (Celery prefork workers each
+get their own after forking) and shared between threads. Responses
+with a retryable status, and connection errors or timeouts, are retried
+with jittered exponential backoff. Requests that mustn't be repeated
+(e.g. inserts) are only retried if they can't have been acted on.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from os import getenv
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Statuses meaning the request was refused without being acted on
+NOT_APPLIED_STATUSES = frozenset({429})
+# Redis shared by SharedRateLimiters, "none" to limit each process alone
+RATE_LIMIT_REDIS_URL = getenv("RATE_LIMIT_REDIS_URL") or "redis://{}:6379/0".format(
+    getenv("REDIS", "127.0.0.1")
+)
+# Seconds to limit each process alone after Redis fails
+BACKOFF = 60
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second, across threads"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Reserves the next free slot (in ms of Redis time) and returns the ms
+# to wait for it. The key outlives every reservation made so far.
+_RESERVE_SLOT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local slot = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0'))
+local interval = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], tostring(slot + interval), 'PX',
+    math.ceil(slot - now + interval) + 1000)
+return slot - now
+"""
+
+
+class SharedRateLimiter(RateLimiter):
+    """Spaces calls out to at most `rate` per second across every
+    process (e.g. Celery workers) using the same name, by reserving
+    slots in Redis. While Redis can't be reached only this process'
+    calls are limited.
+    """
+
+    def __init__(self, name: str, rate: Optional[float], url: str = None):
+        super().__init__(rate)
+        self.key = f"ratelimit:{name}"
+        self.url = url or RATE_LIMIT_REDIS_URL
+        self._script = None
+        self._failed_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        delay = self._reserve()
+        if delay is None:
+            super().wait()
+        elif delay > 0:
+            time.sleep(delay)
+
+    def _reserve(self) -> Optional[float]:
+        """Seconds until this call's slot, or None if Redis is unavailable"""
+        if self.url.lower() == "none" or time.time() - self._failed_at < BACKOFF:
+            return None
+        try:
+            if self._script is None:
+                import redis
+
+                client = redis.Redis.from_url(
+                    self.url, socket_connect_timeout=1, socket_timeout=2
+                )
+                self._script = client.register_script(_RESERVE_SLOT)
+            return self._script(keys=[self.key], args=[self.interval * 1000]) / 1000
+        except Exception as e:
+            logger.warning("Rate limiting %s locally: %s", self.key, e)
+            self._failed_at = time.time()
+            return None
+
+
+@dataclass
+class EndpointStats:
+    """Counters for a single endpoint"""
+
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    total_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+
+class HttpClient:
+    """Thread-safe wrapper around a pooled requests.Session
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of kept-alive connections per host
+    connect_timeout, read_timeout : float
+        Seconds before giving up on connecting or waiting for a response
+    max_retries : int
+        Retries after the first attempt for retryable failures
+    backoff : float
+        Base seconds for exponential backoff, capped at max_backoff
+    headers : dict, optional
+        Headers sent with every request
+    rate_limit : float, optional
+        Most requests per second, including retries
+    rate_limit_name : str, optional
+        Share the rate limit with every process using this name, see
+        SharedRateLimiter
+    session : requests.Session, optional
+        Session to send requests with (e.g. an authenticated one) instead
+        of one made per process, it isn't replaced after a fork
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        headers: Optional[Dict] = None,
+        rate_limit: Optional[float] = None,
+        rate_limit_name: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.headers = headers or {}
+        self.rate_limiter = (
+            SharedRateLimiter(rate_limit_name, rate_limit)
+            if rate_limit_name
+            else RateLimiter(rate_limit)
+        )
+        self.stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+        self._session = session
+        self._given_session = session is not None
+        self._pid = None
+
+    @property
+    def session(self) -> requests.Session:
+        if self._given_session:
+            return self._session
+        # Sessions must not be shared across a fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _record(self, endpoint: str, latency: float, error: bool, retry: bool):
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.calls += 1
+            stats.total_latency += latency
+            stats.errors += error
+            stats.retries += retry
+
+    def _sleep_before_retry(self, attempt: int, response=None):
+        delay = None
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                delay = float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        if delay is None:
+            # Full jitter keeps retrying workers from hitting the API in lockstep
+            delay = random.uniform(0, self.backoff * 2**attempt)
+        time.sleep(min(delay, self.max_backoff))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str = None,
+        idempotent: bool = True,
+        **kwargs,
+    ):
+        """Send a request, retrying 429/5xx responses and network errors.
+        Raises requests.HTTPError if a retryable status persists, and
+        requests.RequestException if the API can't be reached at all.
+        Other status codes are returned for the caller to handle.
+
+        Unless idempotent, the request is only retried if it never reached
+        the server (it couldn't connect) or was refused (429). Otherwise
+        it may have been acted on, so the error is raised straight away.
+        """
+        endpoint = endpoint or url
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.rate_limiter.wait()
+            start = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry = attempt < self.max_retries and (idempotent or never_sent(e))
+                self._record(endpoint, time.perf_counter() - start, True, retry)
+                if not retry:
+                    raise
+                logger.warning("%s %s failed (%s), retrying", method, endpoint, e)
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+
+            failed = r.status_code in RETRY_STATUSES
+            retry = (
+                failed
+                and attempt < self.max_retries
+                and (idempotent or r.status_code in NOT_APPLIED_STATUSES)
+            )
+            self._record(endpoint, time.perf_counter() - start, failed, retry)
+            if not retry:
+                if failed:
+                    r.raise_for_status()
+                return r
+            logger.warning(
+                "%s %s returned %d, retrying", method, endpoint, r.status_code
+            )
+            self._sleep_before_retry(attempt, r)
+            attempt += 1
+
+
+def never_sent(e: requests.RequestException) -> bool:
+    """Whether a failed request can't have reached the server: it timed
+    out or failed while connecting, before anything was sent"""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    # requests wraps urllib3's error in a MaxRetryError
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, ConnectTimeoutError)
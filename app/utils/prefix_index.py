@@ -0,0 +1,142 @@
+"""In-memory prefix search for autocomplete
+
+PrefixIndex keeps its keys in a sorted array, so finding every key with
+a given prefix is a bisect plus a scan of the matches. BackgroundRefresh
+holds an index and rebuilds it in a background thread when it goes
+stale, so requests never wait on the (slow) source of the data.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Seconds before retrying a failed background build
+RETRY_AFTER = 60
+
+T = TypeVar("T")
+
+
+class PrefixIndex:
+    """Case-insensitive prefix search over (value, weight) entries
+
+    Parameters
+    ----------
+    entries : iterable of (str, int) or str
+        Values to search, with an optional weight. Lower weights rank
+        higher, e.g. to prefer full names over abbreviations.
+    keys : callable, optional
+        Given a value, returns the strings it can be found by.
+        Defaults to the value itself.
+    """
+
+    def __init__(
+        self,
+        entries: Iterable,
+        keys: Callable[[str], Iterable[str]] = None,
+    ):
+        rows = []
+        for entry in entries:
+            value, weight = entry if isinstance(entry, tuple) else (entry, 0)
+            for key in keys(value) if keys else (value,):
+                rows.append((key, value, weight))
+        self._build(rows)
+
+    @classmethod
+    def from_keys(cls, rows: Iterable[Tuple[str, str, int]]) -> "PrefixIndex":
+        """Build from (key, value, weight) rows, for when a value's keys
+        don't all have the same weight"""
+        index = cls.__new__(cls)
+        index._build(rows)
+        return index
+
+    def _build(self, rows: Iterable[Tuple[str, str, int]]):
+        rows = sorted((k.lower(), w, v) for k, v, w in rows if k)
+        self._keys = [key for key, _, _ in rows]
+        self._entries: List[Tuple[int, str]] = [(w, v) for _, w, v in rows]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix: str, limit: int = 20) -> List[str]:
+        """Values with a key starting with prefix, best first.
+        Exact matches rank first, then by weight, then shorter keys.
+        Only the first `limit * 10` matches in key order are ranked, so
+        the work done is bounded however common the prefix is.
+        """
+        prefix = prefix.lower()
+        if not prefix or limit <= 0:
+            return []
+        start = bisect_left(self._keys, prefix)
+        candidates = []
+        for i in range(start, min(start + limit * 10, len(self._keys))):
+            key = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            weight, value = self._entries[i]
+            candidates.append((key != prefix, weight, len(key), key, value))
+        candidates.sort()
+
+        results = []
+        seen = set()
+        for *_, value in candidates:
+            if value not in seen:
+                seen.add(value)
+                results.append(value)
+                if len(results) == limit:
+                    break
+        return results
+
+
+class BackgroundRefresh(Generic[T]):
+    """A value built by `load`, rebuilt in a daemon thread when older
+    than max_age seconds. Until the first build finishes `get` returns
+    its default instead of blocking.
+    """
+
+    def __init__(self, load: Callable[[], T], max_age: float):
+        self._load = load
+        self.max_age = max_age
+        self._value: Optional[T] = None
+        self._built_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._pid = os.getpid()
+
+    def get(self, default: T = None) -> T:
+        now = time.monotonic()
+        stale = self._value is None or now - self._built_at > self.max_age
+        if stale and now - self._failed_at > RETRY_AFTER:
+            self.refresh()
+        return self._value if self._value is not None else default
+
+    def refresh(self, wait: bool = False):
+        """Start rebuilding the value, unless a rebuild is running"""
+        with self._lock:
+            # A rebuild thread doesn't survive forking
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._refreshing = False
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._rebuild, daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _rebuild(self):
+        start = time.monotonic()
+        try:
+            self._value = self._load()
+            self._built_at = time.monotonic()
+            logger.info("Rebuilt index in %.2fs", self._built_at - start)
+        except Exception:
+            logger.exception("Failed to build index")
+            self._failed_at = time.monotonic()
+        finally:
+            self._refreshing = False
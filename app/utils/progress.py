@@ -0,0 +1,298 @@
+"""Throttled progress reporting for long running tasks
+
+A ProgressReporter collects progress as often as the task likes, but
+only passes it on when PROGRESS_INTERVAL seconds have passed or the task
+has moved on by PROGRESS_STEP of its total. A report updates the Celery
+task state and is published on a Redis pub/sub channel; the latest
+report is also kept under a key, for anyone who starts listening late.
+
+Reports carry counts (e.g. compounds), Atlas API calls made, the Atlas
+response cache hit rate and an ETA, as well as current/total/status.
+
+A task split over several workers reports as parts of one channel: each
+part keeps its own report in a hash, and what's published is the sum.
+
+Every report has a state: PROGRESS while running, then SUCCESS (from
+`finish`) or FAILURE (from `failures_published`).
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from os import getenv
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from . import atlas_api
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_REDIS_URL = getenv("PROGRESS_REDIS_URL") or "redis://{}:6379/0".format(
+    getenv("REDIS", "127.0.0.1")
+)
+# Least seconds, or fraction of the total, between reports
+PROGRESS_INTERVAL = float(getenv("PROGRESS_INTERVAL", "1"))
+PROGRESS_STEP = float(getenv("PROGRESS_STEP", "0.05"))
+# Seconds the latest report is kept after the last update
+PROGRESS_TTL = 86400
+# Seconds to stop publishing after Redis fails
+BACKOFF = 60
+
+_client = None
+_client_lock = threading.Lock()
+_failed_at = 0.0
+
+
+def get_client():
+    """The process-wide Redis client, or None if publishing is off or
+    Redis has failed recently"""
+    global _client
+    if PROGRESS_REDIS_URL.lower() == "none" or time.time() - _failed_at < BACKOFF:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import redis
+
+                _client = redis.Redis.from_url(
+                    PROGRESS_REDIS_URL, socket_connect_timeout=1, socket_timeout=2
+                )
+    return _client
+
+
+def _redis(method: str, *args, **kwargs):
+    global _failed_at
+    client = get_client()
+    if client is None:
+        return None
+    try:
+        return getattr(client, method)(*args, **kwargs)
+    except Exception as e:
+        logger.warning("Unable to publish progress: %s", e)
+        _failed_at = time.time()
+        return None
+
+
+def channel_name(kind: str, dataset_id: int) -> str:
+    """Channel for a task on a dataset, e.g. channel_name("checker", 1)"""
+    return f"progress:{kind}:{dataset_id}"
+
+
+def parse_channel(channel: str) -> Tuple[str, int]:
+    """(kind, dataset id) of a channel_name"""
+    _, kind, dataset_id = channel.split(":")
+    return kind, int(dataset_id)
+
+
+def publish(channel: str, state: Dict[str, Any]):
+    """Publish a report, and keep it as the channel's latest"""
+    payload = json.dumps(dict(state, updated=time.time()))
+    _redis("set", f"{channel}:latest", payload, PROGRESS_TTL)
+    _redis("publish", channel, payload)
+
+
+@contextmanager
+def failures_published(channel: str):
+    """Publish a FAILURE report if the block raises"""
+    try:
+        yield
+    except Exception as e:
+        publish(channel, {"state": "FAILURE", "status": str(e)})
+        raise
+
+
+def subscribe(channels: Iterable[str]):
+    """A Redis PubSub listening to the channels, or None if progress
+    isn't being published"""
+    if get_client() is None:
+        return None
+    import redis
+
+    # Its own connection, without the client's read timeout
+    client = redis.Redis.from_url(PROGRESS_REDIS_URL, socket_connect_timeout=1)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*channels)
+    return pubsub
+
+
+def latest(channel: str) -> Optional[Dict[str, Any]]:
+    """The last report published on a channel, if any"""
+    raw = _redis("get", f"{channel}:latest")
+    return json.loads(raw) if raw else None
+
+
+def start_parts(channel: str, totals: Iterable[int]):
+    """Register the parts a task is split into, with the total each
+    will report, so the combined total is right from the start"""
+    parts = {
+        str(i): json.dumps({"current": 0, "total": total, "counts": {}})
+        for i, total in enumerate(totals)
+    }
+    _redis("delete", f"{channel}:parts")
+    if parts:
+        _redis("hset", f"{channel}:parts", mapping=parts)
+        _redis("expire", f"{channel}:parts", PROGRESS_TTL)
+
+
+class ProgressReporter:
+    """Collects a task's progress and reports it at most every interval
+    seconds or step of the total
+
+    Parameters
+    ----------
+    channel : str
+        Redis channel to publish on, see channel_name
+    task : celery.Task, optional
+        Task whose state is updated with every report
+    task_id : str, optional
+        Id of the task to update, if not the running one (e.g. the task
+        a chunk of work was split from)
+    part : int, optional
+        Which part of the task this is, see start_parts
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        task=None,
+        task_id: str = None,
+        logger: logging.Logger = None,
+        interval: float = PROGRESS_INTERVAL,
+        step: float = PROGRESS_STEP,
+        part: int = None,
+    ):
+        self.channel = channel
+        self.task = task
+        self.task_id = task_id
+        self.logger = logger or logging.getLogger(__name__)
+        self.interval = interval
+        self.step = step
+        self.part = part
+        self.current = 0
+        self.total = 0
+        self.status = ""
+        self.counts: Dict[str, int] = {}
+        self.started = time.monotonic()
+        self._reported_at = None
+        self._reported_current = 0
+        self._api_calls = self._count_api_calls()
+        self._cache = self._count_cache()
+
+    @staticmethod
+    def _count_api_calls() -> int:
+        return sum(s.calls for s in atlas_api.stats().values())
+
+    @staticmethod
+    def _count_cache():
+        stores = atlas_api.caches.values()
+        return sum(s.hits for s in stores), sum(s.misses for s in stores)
+
+    def add(self, name: str, n: int = 1):
+        """Count n more of something, e.g. add("compounds", 12)"""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def update(self, current: int, total: int, status: str, force: bool = False):
+        self.current = current
+        self.total = total
+        self.status = status
+        if force or self._due():
+            self.report()
+
+    def finish(self, status: str = "Done", **extra):
+        """Report the task done, with anything extra (e.g. a result)"""
+        self.current = self.total
+        self.status = status
+        self.report(state="SUCCESS", **extra)
+
+    def _due(self) -> bool:
+        if self._reported_at is None:
+            return True
+        if time.monotonic() - self._reported_at >= self.interval:
+            return True
+        return abs(self.current - self._reported_current) >= self.step * self.total
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This reporter's own progress"""
+        hits, misses = self._count_cache()
+        return {
+            "current": self.current,
+            "total": self.total,
+            "status": self.status,
+            "counts": dict(self.counts),
+            "api_calls": self._count_api_calls() - self._api_calls,
+            "cache_hits": hits - self._cache[0],
+            "cache_lookups": hits + misses - sum(self._cache),
+            "elapsed": time.monotonic() - self.started,
+        }
+
+    def report(self, state: str = "PROGRESS", **extra):
+        """Pass the current progress on now"""
+        self._reported_at = time.monotonic()
+        self._reported_current = self.current
+        report = self.snapshot()
+        if self.part is not None:
+            report = self._combine_parts(report)
+        report = summarize(report)
+
+        if self.task:
+            # The task's own state changes when it returns
+            self.task.update_state(
+                task_id=self.task_id, state="PROGRESS", meta=dict(report)
+            )
+        publish(self.channel, dict(report, state=state, **extra))
+        eta = report["eta"]
+        self.logger.info(
+            "PROGRESS %s: %d/%d%s - %s",
+            self.channel,
+            report["current"],
+            report["total"],
+            f" (ETA {eta:.0f}s)" if eta is not None else "",
+            self.status,
+        )
+
+    def _combine_parts(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        key = f"{self.channel}:parts"
+        _redis("hset", key, str(self.part), json.dumps(state))
+        parts = _redis("hgetall", key)
+        if not parts:
+            return state
+        return combine([json.loads(x) for x in parts.values()], status=self.status)
+
+
+def combine(parts: Iterable[Dict[str, Any]], status: str = "") -> Dict[str, Any]:
+    """Sum the reports of the parts of a task running side by side"""
+    combined = {
+        "current": 0,
+        "total": 0,
+        "status": status,
+        "counts": {},
+        "api_calls": 0,
+        "cache_hits": 0,
+        "cache_lookups": 0,
+        "elapsed": 0.0,
+    }
+    rate = 0.0
+    for part in parts:
+        for field in ("current", "total", "api_calls", "cache_hits", "cache_lookups"):
+            combined[field] += part.get(field, 0)
+        for name, n in part.get("counts", {}).items():
+            combined["counts"][name] = combined["counts"].get(name, 0) + n
+        elapsed = part.get("elapsed", 0.0)
+        combined["elapsed"] = max(combined["elapsed"], elapsed)
+        if elapsed and part["current"]:
+            rate += part["current"] / elapsed
+    combined["rate"] = rate
+    return combined
+
+
+def summarize(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the cache hit rate and an ETA to a report"""
+    lookups = state["cache_lookups"]
+    state["cache_hit_rate"] = state["cache_hits"] / lookups if lookups else None
+    # Parts report their combined rate, a single task its average one
+    rate = state.pop("rate", None)
+    if rate is None and state["elapsed"] and state["current"]:
+        rate = state["current"] / state["elapsed"]
+    remaining = state["total"] - state["current"]
+    state["eta"] = remaining / rate if rate else None
+    return state
@@ -1,9 +1,39 @@
 import re
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import getenv
+from typing import Dict, Iterable, Union
 
 import requests
 from rdkit import Chem
 
+from . import rdkit_standardizer, smiles_store
+from .http_client import HttpClient
+from .timeout import Deadline
+
+# "pubchem" to standardize with the PUG service, or "rdkit" to do it
+# locally with RDKit's MolStandardize (see rdkit_standardizer)
+STANDARDIZER = getenv("SMILES_STANDARDIZER", "pubchem")
+# Concurrent PUG requests, and the most sent per second (PubChem allows 5)
+# by all processes together
+MAX_WORKERS = int(getenv("PUBCHEM_MAX_WORKERS", "8"))
+RATE_LIMIT = float(getenv("PUBCHEM_RATE_LIMIT", "5"))
+# Seconds between polls of outstanding jobs, and polls before giving up
+POLL_INTERVAL = float(getenv("PUBCHEM_POLL_INTERVAL", "1"))
+MAX_POLLS = int(getenv("PUBCHEM_MAX_POLLS", "10"))
+
+# PUG statuses meaning the structure itself can't be standardized, any
+# other failure may well pass if tried again later
+REJECTED_STATUSES = ("input-error", "data-error")
+
+client = HttpClient(
+    pool_size=MAX_WORKERS, rate_limit=RATE_LIMIT, rate_limit_name="pubchem"
+)
+
+
+class PugServiceError(requests.RequestException):
+    """PUG failed for reasons of its own (e.g. it's overloaded)"""
+
 
 """
 PubChem Smiles Standardization:
@@ -22,6 +52,7 @@ in_smiles - a SMILES string representing a compound to standardize the structure
 OPTIONAL INPUT:
 max_retry - DEFAULT = 3 - Can increase the number of times this function tries to get
                           results from PubChem service
+timeout - DEFAULT = None - Seconds to wait for PubChem in total
 
 OUTPUT:
 out_smiles - A SMILES string representing a standardized compound
@@ -30,27 +61,63 @@ EXCEPTIONS:
 TypeError       - Uses rdkit check if SMILES string is a compound raise TypeError if not
                   rdkit may also raise a C++ exception which can be also be caught with
                   TypeError
-ValueError      - If unable to to reach PubChem for some unknown reason
+ValueError      - If unable to to reach PubChem for some unknown reason, or if
+                  PUG rejects the structure
 ConnectionError - If requests library is unable to reach PubChem
-(Note the last two can be considered as redundant)
+PugServiceError - If PUG fails for some reason of its own
+(Note the last three can be considered as redundant)
+TimeoutError    - If PubChem didn't answer within timeout
 """
 
 
-def get_standardized_smiles(in_smiles, max_retry=3):
+def get_standardized_smiles(in_smiles, max_retry=3, timeout=None):
+    if STANDARDIZER == "rdkit":
+        return rdkit_standardizer.standardize_smiles(in_smiles)
+
+    # Use the stored result if this structure has been seen before
+    stored = smiles_store.lookup(in_smiles)
+    if isinstance(stored, Exception):
+        raise stored
+    if stored is not smiles_store.MISSING:
+        return stored
+
+    try:
+        smiles, finished = _standardize_smiles(in_smiles, max_retry, Deadline(timeout))
+    except (TypeError, ValueError) as e:
+        smiles_store.record(in_smiles, e)
+        raise
+    # Only keep results PUG actually finished with. PugServiceErrors and
+    # other request errors aren't kept, PUG may well manage next time.
+    if finished:
+        smiles_store.record(in_smiles, smiles)
+    return smiles
+
+
+def _standardize_smiles(in_smiles, max_retry=3, deadline=Deadline(None)):
+    """Returns the standardized SMILES (or the input if PUG didn't
+    finish or couldn't be polled), and whether PUG finished with the
+    structure. Raises TimeoutError once the deadline passes, and
+    PCT_failure's error if PUG fails on the structure."""
     print("Input SMILES:\t%s" % in_smiles)
     # Check that smiles is smile string like
     if not is_smiles(in_smiles):
-        raise TypeError
+        raise TypeError(f"Invalid SMILES {in_smiles}")
 
-    request1 = requests.post(
-        url=urlSend, data=pubchem_smile_standarize_string.format(in_smiles)
+    request1 = client.request(
+        "POST",
+        urlSend,
+        "pug_submit",
+        data=pubchem_smile_standarize_string.format(in_smiles),
+        timeout=deadline.timeout(client.timeout),
     )
     if request1.status_code == requests.codes.ok:
         reqid = get_PCT_reqid(request1.text)
         smiles = None
+        finished = False
         counter = 0
         while not smiles and counter < max_retry:
-            request2 = poll_PCT(reqid)
+            deadline.check("Standardizing %s" % in_smiles)
+            request2 = poll_PCT(reqid, timeout=deadline.timeout(client.timeout))
             # Check connection was made
             if request2.status_code != requests.codes.ok:
                 print("There was a failure contacting PUG gateway.")
@@ -60,22 +127,174 @@ def get_standardized_smiles(in_smiles, max_retry=3):
             # This will be "success" if queued or done otherwise break
             if not check_PCT_status(request2.text):
                 print("PUG was unable to standardize the given structure")
-                break
+                raise PCT_failure(request2.text, in_smiles)
 
             # Try and get smiles string from request
             # smiles will either be retrieved or set to None, continuing loop
             smiles = get_PCT_smiles(request2.text)
+            finished = bool(smiles)
 
             # Sleep for a second if didn't get smiles
-            time.sleep(1)
+            if not smiles:
+                time.sleep(deadline.timeout(1))
             counter += 1
         if not smiles:
             smiles = in_smiles
         print("Output SMILES:\t%s" % smiles)
-        return smiles
+        return smiles, finished
     else:
         print("There was a failure contacting PUG gateway.")
-        raise ValueError
+        raise ValueError("Unable to submit structure to PUG")
+
+
+def standardize_many(
+    smiles_list: Iterable[str],
+    max_workers: int = MAX_WORKERS,
+    max_polls: int = MAX_POLLS,
+    poll_interval: float = POLL_INTERVAL,
+) -> Dict[str, Union[str, Exception]]:
+    """Standardize many SMILES at once
+
+    Jobs are submitted to PUG concurrently and, as they are accepted,
+    polled together once per poll_interval, so the total time is bound
+    by PubChem's rate limit rather than one sleep per structure.
+
+    Results already in the standardized SMILES store are reused, and new
+    ones are added to it.
+
+    Returns a dict of input SMILES to standardized SMILES, or to the
+    exception raised for it. A structure PUG rejects gets a ValueError
+    and one PUG fails on for its own reasons a PugServiceError (see
+    PCT_failure), a failed request (e.g. a gateway error) its HTTPError,
+    and a job that doesn't finish within max_polls a TimeoutError.
+
+    With the rdkit standardizer every structure is done locally instead.
+    """
+    smiles_list = list(dict.fromkeys(smiles_list))
+    if STANDARDIZER == "rdkit":
+        return {smiles: _standardize_locally(smiles) for smiles in smiles_list}
+
+    results: Dict[str, Union[str, Exception]] = smiles_store.lookup_many(smiles_list)
+    todo = []
+    for smiles in smiles_list:
+        if smiles in results:
+            continue
+        if is_smiles(smiles):
+            todo.append(smiles)
+        else:
+            results[smiles] = TypeError(f"Invalid SMILES {smiles}")
+    new_results = _standardize_many(todo, max_workers, max_polls, poll_interval)
+    results.update(new_results)
+    # Network errors and timeouts are worth retrying, don't keep them
+    smiles_store.record_many(
+        {
+            smiles: result
+            for smiles, result in new_results.items()
+            if isinstance(result, (str, TypeError, ValueError))
+        }
+    )
+    return results
+
+
+def _standardize_locally(smiles: str) -> Union[str, Exception]:
+    try:
+        return rdkit_standardizer.standardize_smiles(smiles)
+    except (TypeError, ValueError) as e:
+        return e
+
+
+def _standardize_many(todo, max_workers, max_polls, poll_interval):
+    results = {}
+
+    # Polls get their own workers so they don't queue behind submissions
+    with ThreadPoolExecutor(max_workers) as submitter, ThreadPoolExecutor(
+        max_workers
+    ) as poller:
+        submissions = {submitter.submit(submit_PCT, s): s for s in todo}
+        waiting: Dict[str, list] = {}
+        while submissions or waiting:
+            if waiting:
+                time.sleep(poll_interval)
+            else:
+                wait(submissions, return_when=FIRST_COMPLETED)
+
+            for future in [f for f in submissions if f.done()]:
+                smiles = submissions.pop(future)
+                try:
+                    reqid, out_smiles = future.result()
+                except Exception as e:
+                    results[smiles] = e
+                    continue
+                if reqid:
+                    waiting[smiles] = [reqid, 0]
+                else:
+                    results[smiles] = out_smiles
+
+            polls = {
+                poller.submit(poll_PCT_result, reqid): smiles
+                for smiles, (reqid, _) in waiting.items()
+            }
+            for future, smiles in polls.items():
+                waiting[smiles][1] += 1
+                try:
+                    done, out_smiles = future.result()
+                except Exception as e:
+                    results[smiles] = e
+                    del waiting[smiles]
+                    continue
+                if done:
+                    results[smiles] = out_smiles
+                    del waiting[smiles]
+                elif waiting[smiles][1] >= max_polls:
+                    results[smiles] = TimeoutError(f"PUG job for {smiles} timed out")
+                    del waiting[smiles]
+    return results
+
+
+def submit_PCT(in_smiles):
+    """Submit a standardization job. Returns (request id, smiles), the
+    smiles only being set if PUG answered straight away. Raises
+    ValueError if PUG rejects the job."""
+    r = client.request(
+        "POST",
+        urlSend,
+        "pug_submit",
+        data=pubchem_smile_standarize_string.format(in_smiles),
+    )
+    if r.status_code != requests.codes.ok:
+        raise ValueError(f"Unable to submit {in_smiles} to PUG")
+    reqid, smiles = get_PCT_reqid(r.text), get_PCT_smiles(r.text)
+    if not reqid and not smiles:
+        raise PCT_failure(r.text, in_smiles)
+    return reqid, smiles
+
+
+def poll_PCT_result(request_id):
+    """Poll a job once. Returns (finished, smiles), smiles being None
+    while the job is still running. Raises HTTPError if the poll fails
+    and PCT_failure's error if PUG fails on the structure."""
+    r = client.request(
+        "POST", urlSend, "pug_poll", data=pubchem_poll_string.format(request_id)
+    )
+    if r.status_code != requests.codes.ok:
+        raise requests.HTTPError(
+            f"PUG poll failed with status {r.status_code}", response=r
+        )
+    if not check_PCT_status(r.text):
+        raise PCT_failure(r.text, f"job {request_id}")
+    smiles = get_PCT_smiles(r.text)
+    return bool(smiles), smiles
+
+
+def PCT_failure(request_text, what) -> Exception:
+    """The error for a failed PUG job: ValueError if the structure was
+    rejected, which is stored (and retried after the store's RETRY_AFTER),
+    otherwise PugServiceError, which isn't"""
+    match = re.search('<PCT-Status value="([a-z-]+)"/>', request_text)
+    status = match.group(1) if match else "none"
+    if status in REJECTED_STATUSES:
+        return ValueError(f"PUG was unable to standardize {what}: {status}")
+    return PugServiceError(f"PUG failed on {what}: {status}")
 
 
 # DO NOT TOUCH BELOW THIIS
@@ -156,8 +375,14 @@ def get_PCT_smiles(request_text):
     return smiles
 
 
-def poll_PCT(request_id):
-    return requests.post(url=urlSend, data=pubchem_poll_string.format(request_id))
+def poll_PCT(request_id, timeout=None):
+    return client.request(
+        "POST",
+        urlSend,
+        "pug_poll",
+        data=pubchem_poll_string.format(request_id),
+        timeout=timeout or client.timeout,
+    )
 
 
 def is_smiles(smiles):
@@ -0,0 +1,107 @@
+"""Local SMILES standardization with RDKit's MolStandardize
+
+An in-process alternative to the PubChem PUG standardization service:
+normalize functional groups, keep the largest fragment, reionize, and
+pick the canonical tautomer. No network, so it's cheap enough to run
+on every structure in a checker run.
+
+`parity` compares it with standardized SMILES from PubChem, so the two
+engines can be checked against each other before switching.
+"""
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, List, Tuple
+
+from rdkit import Chem
+from rdkit.Chem.MolStandardize import rdMolStandardize
+
+# Standardizers are reused, but kept per thread to be safe
+_local = threading.local()
+
+
+def _standardizers():
+    if not hasattr(_local, "normalizer"):
+        _local.normalizer = rdMolStandardize.Normalizer()
+        _local.fragment_chooser = rdMolStandardize.LargestFragmentChooser()
+        _local.reionizer = rdMolStandardize.Reionizer()
+        _local.tautomers = rdMolStandardize.TautomerEnumerator()
+    return _local
+
+
+def standardize_smiles(smiles: str) -> str:
+    """Standardized, canonical SMILES for a structure
+
+    Raises TypeError for SMILES RDKit can't read, like
+    get_standardized_smiles, and ValueError if standardizing fails.
+    """
+    mol = Chem.MolFromSmiles(smiles) if smiles else None
+    if mol is None:
+        raise TypeError(f"Invalid SMILES {smiles}")
+    std = _standardizers()
+    try:
+        mol = std.normalizer.normalize(mol)
+        mol = std.fragment_chooser.choose(mol)
+        mol = std.reionizer.reionize(mol)
+        mol = std.tautomers.Canonicalize(mol)
+        return Chem.MolToSmiles(mol)
+    except (RuntimeError, ValueError) as e:
+        raise ValueError(f"Unable to standardize {smiles}: {e}") from e
+
+
+def compare(expected: str, actual: str) -> str:
+    """How closely two standardized SMILES agree: "identical" (same
+    canonical SMILES), "inchikey" (same InChIKey), "connectivity" (same
+    first InChIKey block, i.e. differing only in stereo or charge
+    layers), "different", or "invalid" if either can't be read.
+    """
+    mols = [Chem.MolFromSmiles(s) if s else None for s in (expected, actual)]
+    if None in mols:
+        return "invalid"
+    if Chem.MolToSmiles(mols[0]) == Chem.MolToSmiles(mols[1]):
+        return "identical"
+    keys = [Chem.MolToInchiKey(m) for m in mols]
+    if keys[0] == keys[1]:
+        return "inchikey"
+    if keys[0][:14] == keys[1][:14]:
+        return "connectivity"
+    return "different"
+
+
+@dataclass
+class ParityReport:
+    counts: Counter = field(default_factory=Counter)
+    # (input, PubChem SMILES, RDKit SMILES or error) for every mismatch
+    mismatches: List[Tuple[str, str, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def fraction(self, *outcomes: str) -> float:
+        if not self.total:
+            return 0.0
+        return sum(self.counts[x] for x in outcomes) / self.total
+
+
+def parity(pairs: Iterable[Tuple[str, str]]) -> ParityReport:
+    """Standardize each input SMILES locally and compare it with the
+    expected (PubChem) output, from (input, expected) pairs"""
+    report = ParityReport()
+    for in_smiles, expected in pairs:
+        start = time.perf_counter()
+        try:
+            actual = standardize_smiles(in_smiles)
+        except (TypeError, ValueError) as e:
+            report.seconds += time.perf_counter() - start
+            report.counts["error"] += 1
+            report.mismatches.append((in_smiles, expected, repr(e)))
+            continue
+        report.seconds += time.perf_counter() - start
+        outcome = compare(expected, actual)
+        report.counts[outcome] += 1
+        if outcome != "identical":
+            report.mismatches.append((in_smiles, expected, actual))
+    return report
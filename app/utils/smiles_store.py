@@ -0,0 +1,133 @@
+"""Persistent memo of PubChem standardization results
+
+Standardized SMILES are kept in the standardized_smiles table by input,
+so a structure is only ever sent to PubChem once. Failures are kept too,
+and not retried until RETRY_AFTER has passed.
+
+The store is only used inside a Flask app context, and reads and writes
+in its own transactions so callers' sessions are never committed.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Dict, Iterable, Union
+
+import sqlalchemy as sa
+from flask import has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed input is sent to PubChem again
+RETRY_AFTER = int(getenv("SMILES_STORE_RETRY_AFTER", str(7 * 86400)))
+# Inputs per SELECT/INSERT
+CHUNK_SIZE = 500
+
+MISSING = object()
+
+Result = Union[str, Exception]
+
+
+def _table():
+    # Imported late, this module is used outside the app too
+    from app.models import StandardizedSmiles
+
+    return StandardizedSmiles.__table__
+
+
+def _engine():
+    from app import db
+
+    return db.engine
+
+
+def input_hash(smiles: str) -> str:
+    return hashlib.sha256(smiles.encode()).hexdigest()
+
+
+def _as_result(row, now: datetime) -> Result:
+    if row.error is None:
+        return row.smiles
+    if now - row.updated > timedelta(seconds=RETRY_AFTER):
+        return MISSING
+    # Invalid structures raise TypeError, like get_standardized_smiles
+    if row.error.startswith("TypeError"):
+        return TypeError(row.error)
+    return ValueError(row.error)
+
+
+def lookup_many(smiles_list: Iterable[str]) -> Dict[str, Result]:
+    """Stored results for the inputs that have one (and, for failures,
+    that aren't due a retry). Empty if the store can't be used.
+    """
+    if not has_app_context():
+        return {}
+    table = _table()
+    by_hash = {input_hash(s): s for s in smiles_list}
+    hashes = list(by_hash)
+    now = datetime.utcnow()
+    found = {}
+    try:
+        with _engine().connect() as conn:
+            for i in range(0, len(hashes), CHUNK_SIZE):
+                rows = conn.execute(
+                    table.select().where(
+                        table.c.input_hash.in_(hashes[i : i + CHUNK_SIZE])
+                    )
+                )
+                for row in rows:
+                    result = _as_result(row, now)
+                    if result is not MISSING:
+                        found[by_hash[row.input_hash]] = result
+    except Exception as e:
+        logger.warning("Standardized SMILES store unavailable: %s", e)
+    return found
+
+
+def record_many(results: Dict[str, Result]):
+    """Store results, replacing any earlier ones for the same inputs"""
+    if not has_app_context() or not results:
+        return
+    table = _table()
+    now = datetime.utcnow()
+    rows = [
+        dict(
+            input_hash=input_hash(smiles),
+            input_smiles=smiles,
+            smiles=None if isinstance(result, Exception) else result,
+            error=(
+                f"{type(result).__name__}: {result}"[:255]
+                if isinstance(result, Exception)
+                else None
+            ),
+            created=now,
+            updated=now,
+        )
+        for smiles, result in results.items()
+    ]
+    try:
+        with _engine().begin() as conn:
+            for i in range(0, len(rows), CHUNK_SIZE):
+                chunk = rows[i : i + CHUNK_SIZE]
+                hashes = table.c.input_hash.in_([r["input_hash"] for r in chunk])
+                # Keep when an input was first seen
+                created = dict(
+                    conn.execute(
+                        sa.select(table.c.input_hash, table.c.created).where(hashes)
+                    ).all()
+                )
+                for row in chunk:
+                    row["created"] = created.get(row["input_hash"]) or now
+                conn.execute(table.delete().where(hashes))
+                conn.execute(table.insert(), chunk)
+    except Exception as e:
+        logger.warning("Unable to save standardized SMILES: %s", e)
+
+
+def lookup(smiles: str):
+    """Stored result for one input, or MISSING"""
+    return lookup_many([smiles]).get(smiles, MISSING)
+
+
+def record(smiles: str, result: Result):
+    record_many({smiles: result})
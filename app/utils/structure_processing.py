@@ -0,0 +1,138 @@
+"""Parallel RDKit structure processing
+
+Turns SMILES into plain StructureRecords (cleaned smiles, formula,
+InChI, InChIKey and molblock) in worker processes, so the CPU-bound
+RDKit work for a dataset runs on every core instead of inside the DB
+loop.
+
+The workers are billiard (Celery's fork of multiprocessing) processes,
+which unlike multiprocessing's can be started from the daemonic prefork
+Celery worker processes the checker runs in. Workers still busy when a
+batch runs out of time are killed outright, so STRUCTURE_TIMEOUT holds
+however long the structures they were given take.
+"""
+import os
+import queue
+import signal
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+import billiard
+
+from .Compound import cached_properties
+from .timeout import Deadline
+
+MAX_WORKERS = int(os.getenv("STRUCTURE_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a batch of structures may take in total (0 for no limit)
+TIMEOUT = float(os.getenv("STRUCTURE_TIMEOUT", "0")) or None
+
+
+@dataclass
+class StructureRecord:
+    smiles: str
+    formula: str
+    inchi: str
+    inchikey: str
+    molblock: str
+
+
+def process_structure(
+    smiles: str, name: str = "Unknown", standardize: bool = False
+) -> StructureRecord:
+    """Build, clean and describe a single structure"""
+    props = cached_properties(smiles, name=name, standardize=standardize)
+    return StructureRecord(
+        smiles=props["smiles"],
+        formula=props["formula"],
+        inchi=props["inchi"],
+        inchikey=props["inchikey"],
+        molblock=props["molblock"],
+    )
+
+
+def _process(args: Tuple[str, str, bool]) -> Union[StructureRecord, ValueError]:
+    smiles, name, standardize = args
+    try:
+        return process_structure(smiles, name, standardize)
+    except Exception as e:
+        # RDKit exceptions don't always survive pickling back to the parent
+        return ValueError(f"Unable to process structure {smiles}: {e!r}")
+
+
+def _process_chunk(chunk: List[Tuple[str, str, bool]]) -> List:
+    return [_process(x) for x in chunk]
+
+
+def _work(chunks, next_chunk, results):
+    """Worker process: takes the next chunk until there are none left"""
+    while True:
+        with next_chunk.get_lock():
+            index = next_chunk.value
+            next_chunk.value += 1
+        if index >= len(chunks):
+            return
+        results.put((index, _process_chunk(chunks[index])))
+
+
+def _timed_out(args: Tuple[str, str, bool]) -> TimeoutError:
+    return TimeoutError(f"Ran out of time before processing {args[0]}")
+
+
+def _lost(args: Tuple[str, str, bool]) -> ValueError:
+    return ValueError(f"Worker process died while processing {args[0]}")
+
+
+def process_structures(
+    structures: Iterable[Tuple[str, str]],
+    standardize: bool = False,
+    max_workers: int = MAX_WORKERS,
+    timeout: Optional[float] = TIMEOUT,
+) -> List[Union[StructureRecord, Exception]]:
+    """Process (smiles, name) pairs, in parallel where possible.
+    Returns a record, or the error raised, for every input in order.
+    Inputs not processed within timeout seconds get a TimeoutError, and
+    the workers still busy with them are killed.
+    """
+    args = [(smiles, name, standardize) for smiles, name in structures]
+    deadline = Deadline(timeout)
+    if max_workers <= 1 or len(args) <= 1:
+        # Work in progress can't be stopped here, only what's left skipped
+        return [_timed_out(x) if deadline.expired else _process(x) for x in args]
+
+    chunksize = max(1, len(args) // (max_workers * 4))
+    chunks = [args[i : i + chunksize] for i in range(0, len(args), chunksize)]
+    next_chunk = billiard.Value("i", 0)
+    results = billiard.Queue()
+    workers = []
+    done = {}
+    try:
+        for _ in range(min(max_workers, len(chunks))):
+            worker = billiard.Process(target=_work, args=(chunks, next_chunk, results))
+            worker.start()
+            workers.append(worker)
+        while len(done) < len(chunks) and not deadline.expired:
+            remaining = deadline.remaining()
+            try:
+                # Wake up now and then to notice workers that died
+                index, records = results.get(
+                    timeout=1 if remaining is None else min(remaining, 1)
+                )
+            except queue.Empty:
+                if not any(w.is_alive() for w in workers) and results.empty():
+                    break
+                continue
+            done[index] = records
+    finally:
+        for worker in workers:
+            if len(done) < len(chunks) and worker.is_alive():
+                # Still busy with chunks that ran out of time
+                os.kill(worker.pid, signal.SIGKILL)
+            worker.join()
+        results.close()
+
+    missing = _timed_out if deadline.expired else _lost
+    return [
+        record
+        for index, chunk in enumerate(chunks)
+        for record in done.get(index) or [missing(x) for x in chunk]
+    ]
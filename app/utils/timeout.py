@@ -1,6 +1,8 @@
 import logging
 import sys
 import threading
+import time
+from typing import Optional
 
 try:
     import thread
@@ -19,6 +21,9 @@ def exit_after(s):
     """
     use as decorator to exit process if
     function takes longer than s seconds
+
+    Interrupts the main thread whatever it's doing, so it's only safe in
+    single threaded scripts. Use a Deadline elsewhere.
     """
 
     def outer(fn):
@@ -34,3 +39,44 @@ def exit_after(s):
         return inner
 
     return outer
+
+
+class Deadline:
+    """A time some work has to be done by, passed down to the calls
+    doing it so each can bound its own waiting (e.g. as a request
+    timeout) and stop cleanly once it has passed.
+
+    A Deadline of None seconds never expires.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds
+        self.expires = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None if there's no limit"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, what: str = "Operation"):
+        """Raise TimeoutError if the deadline has passed"""
+        if self.expired:
+            raise TimeoutError(f"{what} took longer than {self.seconds}s")
+
+    def timeout(self, default=None):
+        """A timeout for a single blocking call: the time remaining, or
+        the default if that's shorter. The default may be a requests
+        style (connect, read) tuple."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        if isinstance(default, tuple):
+            return tuple(min(x, remaining) for x in default)
+        return min(default, remaining)
@@ -0,0 +1,77 @@
+"""Add taxon alternative table
+
+Revision ID: e81b6d4c2a97
+Revises: 5d2f8a3c91e0
+Create Date: 2026-10-18 11:48:05.227310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b6d4c2a97'
+down_revision = '5d2f8a3c91e0'
+branch_labels = None
+depends_on = None
+
+taxon = sa.table(
+    'taxon',
+    sa.column('id', sa.Integer),
+    sa.column('alternatives', sa.Text),
+)
+taxon_alternative = sa.table(
+    'taxon_alternative',
+    sa.column('name', sa.String),
+    sa.column('taxon_id', sa.Integer),
+)
+
+
+def upgrade():
+    op.create_table('taxon_alternative',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('taxon_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['taxon_id'], ['taxon.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_taxon_alternative_name'), 'taxon_alternative', ['name'], unique=False)
+    op.create_index(op.f('ix_taxon_alternative_taxon_id'), 'taxon_alternative', ['taxon_id'], unique=False)
+
+    # Split the @-delimited alternatives strings into rows
+    conn = op.get_bind()
+    rows = []
+    for taxon_id, alternatives in conn.execute(
+        sa.select(taxon.c.id, taxon.c.alternatives).order_by(taxon.c.id)
+    ):
+        seen = set()
+        for name in (alternatives or '').split('@'):
+            name = name.strip()
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                rows.append({'name': name, 'taxon_id': taxon_id})
+    if rows:
+        op.bulk_insert(taxon_alternative, rows)
+
+    op.drop_column('taxon', 'alternatives')
+
+
+def downgrade():
+    op.add_column('taxon', sa.Column('alternatives', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    alternatives = {}
+    for name, taxon_id in conn.execute(
+        sa.select(taxon_alternative.c.name, taxon_alternative.c.taxon_id)
+    ):
+        alternatives.setdefault(taxon_id, []).append(f'@{name}@')
+    for taxon_id, names in alternatives.items():
+        conn.execute(
+            taxon.update()
+            .where(taxon.c.id == taxon_id)
+            .values(alternatives=''.join(names))
+        )
+
+    op.drop_index(op.f('ix_taxon_alternative_taxon_id'), table_name='taxon_alternative')
+    op.drop_index(op.f('ix_taxon_alternative_name'), table_name='taxon_alternative')
+    op.drop_table('taxon_alternative')
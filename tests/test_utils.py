@@ -3,7 +3,7 @@ import unittest
 from time import sleep
 
 from app.utils.NoneDict import NoneDict
-from app.utils.timeout import exit_after
+from app.utils.timeout import Deadline, exit_after
 from app.utils.pubchem_smiles_standardizer import get_standardized_smiles
 
 import traceback
@@ -73,6 +73,30 @@ class TestTimeout(MyTestCase):
         self.assertNotRaises(KeyboardInterrupt, self.timein, 0.5)
 
 
+class TestDeadline(unittest.TestCase):
+    def test_no_limit(self):
+        deadline = Deadline(None)
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.expired)
+        self.assertEqual(deadline.timeout((5, 30)), (5, 30))
+
+    def test_bounds_timeouts(self):
+        deadline = Deadline(2)
+        self.assertLessEqual(deadline.timeout(10), 2)
+        self.assertEqual(deadline.timeout(1), 1)
+        connect, read = deadline.timeout((1, 30))
+        self.assertEqual(connect, 1)
+        self.assertLessEqual(read, 2)
+
+    def test_expired(self):
+        deadline = Deadline(0.1)
+        deadline.check()
+        sleep(0.2)
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertRaises(TimeoutError, deadline.check)
+
+
 class TestPubChemStandardize(unittest.TestCase):
     def test_invalid_smiles_empty(self):
         smiles = ""
@@ -1,6 +1,18 @@
 # -*- coding: utf-8 -*-
+import tempfile
 import unittest
-from app.utils.Compound import Compound
+from unittest import mock
+
+from app.utils import Compound as compound_module
+from app.utils import cache_store
+from app.utils.Compound import (
+    Compound,
+    cached_properties,
+    inchikey_from_smiles,
+    molblock_from_smiles,
+    set_molblock_name,
+    smiles_key,
+)
 
 
 class TestCompoundMethods(unittest.TestCase):
@@ -49,3 +61,65 @@ class TestCompoundMethods(unittest.TestCase):
             compound.smiles,
             "CC1([C@@H](N2[C@H](S1)[C@@H](C2=O)NC(=O)CC3=CC=CC=C3)C(=O)O)C",
         )
+
+
+class TestStructureCacheHelpers(unittest.TestCase):
+    """Tests for structure cache helpers"""
+
+    def test_smiles_key_variant(self):
+        self.assertEqual(smiles_key("CCO", "clean"), smiles_key("CCO", "clean"))
+        self.assertNotEqual(smiles_key("CCO", "clean"), smiles_key("CCO", "inchikey"))
+
+    def test_set_molblock_name(self):
+        molblock = Compound("CCO", name="Ethanol").molblock
+        renamed = set_molblock_name(molblock, "Alcohol")
+        self.assertTrue(renamed.startswith("Alcohol\n"))
+        self.assertEqual(renamed.split("\n")[1:], molblock.split("\n")[1:])
+
+
+class TestStructureCache(unittest.TestCase):
+    """Tests for the structure cache, backed by a throwaway SQLite file"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        backend = cache_store.SQLiteBackend(tmp.name + "/cache.sqlite")
+        for name, value in [("_backend", backend), ("_backend_failed_at", 0.0)]:
+            patcher = mock.patch.object(cache_store, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cache = compound_module.structure_cache
+
+    def test_properties_miss_populates_cache(self):
+        key = smiles_key("CCO", "clean")
+        self.assertIs(self.cache.get(key), cache_store.MISSING)
+        props = cached_properties("CCO", name="Ethanol")
+        self.assertEqual(self.cache.get(key)["inchikey"], props["inchikey"])
+
+    def test_properties_hit_skips_compound(self):
+        first = cached_properties("CCO", name="Ethanol")
+        with mock.patch.object(compound_module, "Compound") as compound:
+            second = cached_properties("CCO", name="Alcohol")
+        compound.assert_not_called()
+        self.assertEqual(second["inchikey"], first["inchikey"])
+        # The name isn't part of what's cached
+        self.assertTrue(second["molblock"].startswith("Alcohol\n"))
+
+    def test_inchikey_and_molblock_hits_skip_rdkit(self):
+        inchikey = inchikey_from_smiles("CCO")
+        molblock = molblock_from_smiles("CCO")
+        with mock.patch.object(compound_module.Chem, "MolFromSmiles") as parse:
+            self.assertEqual(inchikey_from_smiles("CCO"), inchikey)
+            self.assertEqual(molblock_from_smiles("CCO"), molblock)
+        parse.assert_not_called()
+        self.assertEqual(inchikey, "LFQSCWFLJHTTHZ-UHFFFAOYSA-N")
+
+    def test_pubchem_standardized_not_cached(self):
+        with mock.patch.object(
+            compound_module.pubchem_smiles_standardizer, "STANDARDIZER", "pubchem"
+        ), mock.patch.object(
+            compound_module, "get_standardized_smiles", return_value="OCC"
+        ) as standardize:
+            cached_properties("CCO", standardize=True)
+            cached_properties("CCO", standardize=True)
+        self.assertEqual(standardize.call_count, 2)
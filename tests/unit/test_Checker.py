@@ -0,0 +1,241 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import app.checker.Checker as checker_module
+from app.checker.Checker import Checker, Correction, find_internal_duplicates
+
+# (compound id, inchikey) in dataset order, as two chunks would return them
+CHUNK_1 = [(1, "AAA"), (2, "BBB"), (3, "AAA")]
+CHUNK_2 = [(4, "BBB"), (5, "CCC")]
+
+
+def test_internal_duplicates_within_chunk():
+    candidates = [(1, 10), (3, 10)]
+    assert find_internal_duplicates(CHUNK_1, candidates) == [(3, 10)]
+
+
+def test_internal_duplicates_across_chunks():
+    candidates = [(1, 10), (2, 10), (3, 11), (4, 12), (5, 12)]
+    duplicates = find_internal_duplicates(CHUNK_1 + CHUNK_2, candidates)
+    assert duplicates == [(3, 11), (4, 12)]
+
+
+def test_internal_duplicates_only_candidates():
+    # Resolved compounds aren't flagged, but still count as the first
+    candidates = [(4, 12)]
+    assert find_internal_duplicates(CHUNK_1 + CHUNK_2, candidates) == [(4, 12)]
+
+
+class FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+        self.inserted = []
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def bulk_insert_mappings(self, model, mappings):
+        self.inserted.append([m["article_id"] for m in mappings])
+
+
+@pytest.fixture
+def checker(monkeypatch):
+    session = FakeSession()
+    commits = []
+    monkeypatch.setattr(checker_module.db, "session", session, raising=False)
+    monkeypatch.setattr(checker_module, "commit", lambda: commits.append(1))
+    checker = Checker(1, logger=logging.getLogger(__name__), batch_size=3)
+    checker.session = session
+    checker.commits = commits
+    return checker
+
+
+def flag(checker, bad=()):
+    """Batch function recording a problem per item, failing on bad ones"""
+
+    def fn(item):
+        checker.review_list.append(Correction(item, "doi"))
+        if item in bad:
+            raise ValueError(item)
+        return item * 10
+
+    return fn
+
+
+def test_run_batched_one_commit_per_batch(checker):
+    assert checker._run_batched([1, 2, 3, 4, 5], flag(checker)) == [10, 20, 30, 40, 50]
+    assert len(checker.commits) == 2
+    assert checker.session.rollbacks == 0
+    assert [p.article_id for p in checker.review_list] == [1, 2, 3, 4, 5]
+
+
+def test_run_batched_failed_batch_retried_item_by_item(checker):
+    # Item 2 only fails the first time, as a deadlock or timeout would
+    failures = [2]
+
+    def fn(item):
+        checker.review_list.append(Correction(item, "doi"))
+        if item in failures:
+            failures.remove(item)
+            raise ValueError(item)
+        return item * 10
+
+    assert checker._run_batched([1, 2, 3, 4], fn) == [10, 20, 30, 40]
+    assert checker.session.rollbacks == 1
+    # Retried batch commits each item, then the last batch as one
+    assert len(checker.commits) == 4
+    # Problems from the rolled back attempt aren't kept twice
+    assert [p.article_id for p in checker.review_list] == [1, 2, 3, 4]
+
+
+def test_run_batched_item_failing_alone_raises(checker):
+    with pytest.raises(ValueError):
+        checker._run_batched([1, 2, 3], flag(checker, bad=(2,)))
+    assert checker.session.rollbacks == 2
+    # Item 1 was committed on its own before item 2 failed again
+    assert len(checker.commits) == 1
+    assert [p.article_id for p in checker.review_list] == [1]
+
+
+def test_problems_inserted_in_chunks(checker):
+    checker.problem_chunk_size = 2
+    checker._insert_problems([Correction(i, "doi") for i in range(1, 6)])
+    assert checker.session.inserted == [[1, 2], [3, 4], [5]]
+
+
+def test_streamed_problems_inserted_in_chunks(checker):
+    checker.stream_problems = True
+    checker.problem_chunk_size = 2
+    checker._run_batched([1, 2, 3, 4], flag(checker))
+    # Saved with the first batch, the second is below a chunk
+    assert checker.session.inserted == [[1, 2], [3]]
+    checker.save_review_list()
+    assert checker.session.inserted == [[1, 2], [3], [4]]
+
+
+def test_failed_batch_problems_not_streamed(checker):
+    checker.stream_problems = True
+    checker.problem_chunk_size = 1
+    failures = [3]
+
+    def fn(item):
+        checker.review_list.append(Correction(item, "doi"))
+        if item in failures:
+            failures.remove(item)
+            raise ValueError(item)
+
+    # The failing batch is rolled back before its problems are saved
+    checker._run_batched([1, 2, 3], fn)
+    assert checker.session.inserted == [[1], [2], [3]]
+
+
+def checked_row(row_id, fingerprint, checked_against):
+    return SimpleNamespace(
+        id=row_id,
+        fingerprint=fingerprint,
+        checked_against=checked_against,
+        inchikey="AAA",
+    )
+
+
+def test_unchanged_row(checker):
+    checker.atlas_version = "v1"
+    assert checker.is_unchanged(checked_row(1, "fp", "v1"), "fp")
+    assert not checker.is_unchanged(checked_row(1, "old", "v1"), "fp")
+    assert not checker.is_unchanged(checked_row(1, "fp", None), "fp")
+
+
+def test_new_atlas_version_forces_recheck(checker):
+    row = checked_row(1, "fp", "v1")
+    checker.atlas_version = "v2"
+    assert not checker.is_unchanged(row, "fp")
+
+    checker._fingerprints[("compound", 1)] = "fp"
+    checker.mark_checked(row, "compound")
+    assert row.checked_against == "v2"
+    assert checker.is_unchanged(row, "fp")
+
+
+def test_skip_unchanged_compound(checker):
+    compound = checked_row(1, "fp", "v1")
+    checker.checked_compound_inchikeys = {"AAA": [1]}
+    assert not checker.can_skip_compound(compound)
+
+    checker._unchanged.add(("compound", 1))
+    assert checker.can_skip_compound(compound)
+
+    # A duplicate inchikey elsewhere in the dataset means a re-check
+    checker.checked_compound_inchikeys = {"AAA": [1, 2]}
+    assert not checker.can_skip_compound(compound)
+    checker.defer_duplicates = True
+    assert checker.can_skip_compound(compound)
+
+
+def problem(article_id, name, compound_id=None, resolved=False):
+    return SimpleNamespace(
+        article_id=article_id,
+        problem=name,
+        compound_id=compound_id,
+        resolved=resolved,
+    )
+
+
+def test_open_problems_carried_over(checker):
+    checker._open_problems = Checker.load_open_problems(
+        [
+            problem(10, "doi"),
+            problem(10, "year", resolved=True),
+            problem(10, "name_match", compound_id=1),
+            problem(10, "internal_duplicate", compound_id=1),
+            problem(11, "title"),
+        ]
+    )
+    assert set(checker._open_problems) == {
+        ("article", 10),
+        ("compound", 1),
+        ("article", 11),
+    }
+
+    checker.carry_over_problems("article", 10)
+    checker.carry_over_problems("compound", 1)
+    checker.carry_over_problems("compound", 2)
+    assert [(p.article_id, p.compound_id, p.problem) for p in checker.review_list] == [
+        (10, None, "doi"),
+        (10, 1, "name_match"),
+        (10, 1, "internal_duplicate"),
+    ]
+
+
+def test_deferred_duplicates_not_carried_over(checker):
+    checker._open_problems = Checker.load_open_problems(
+        [
+            problem(10, "name_match", compound_id=1),
+            problem(10, "internal_duplicate", compound_id=1),
+        ]
+    )
+    checker.defer_duplicates = True
+    checker.carry_over_problems("compound", 1)
+    assert [p.problem for p in checker.review_list] == ["name_match"]
+
+
+def test_open_problems_from_loaded_dataset():
+    # dataset.problems is loaded whole, resolved problems included
+    open_problems = Checker.load_open_problems(
+        [problem(10, "doi", resolved=True), problem(10, "year", resolved=None)]
+    )
+    assert [p.problem for p in open_problems[("article", 10)]] == ["year"]
+
+
+def test_article_id_without_lazy_load(checker):
+    def lazy_load():
+        raise AssertionError("lazy loaded")
+
+    checker._compound_articles = {1: 10}
+    compound = SimpleNamespace(id=1, get_article_id=lazy_load)
+    assert checker.article_id(compound) == 10
+
+    # Compounds not prepared by this run fall back to the relationship
+    compound = SimpleNamespace(id=2, get_article_id=lambda: 11)
+    assert checker.article_id(compound) == 11
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from app.checker.Inserter import Action, CompoundWrite, Inserter
+from app.checker.ResolveEnum import ResolveEnum
+from app.utils import progress
+from app.utils.http_client import HttpClient
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "" if status_code == 200 else "Bad request"
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.text, response=self)
+
+
+class FakeSession:
+    """Answers every request with status_code, after raising the given
+    exceptions for the first ones"""
+
+    def __init__(self, status_code=200, failures=()):
+        self.status_code = status_code
+        self.failures = list(failures)
+        self.calls = []
+
+    def request(self, method, url, json=None, timeout=None):
+        self.calls.append((method, url, timeout))
+        if self.failures:
+            raise self.failures.pop(0)
+        return FakeResponse(self.status_code)
+
+
+@pytest.fixture
+def inserter(monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_REDIS_URL", "none")
+    monkeypatch.setattr(Inserter, "_init_api_client", lambda self: None)
+    inserter = Inserter(1, workers=4)
+    use_session(inserter, FakeSession())
+    return inserter
+
+
+def use_session(inserter, session):
+    inserter.http = HttpClient(max_retries=2, backoff=0, session=session)
+    return session
+
+
+def compound(i, name=None):
+    return CompoundWrite(
+        compound_id=i,
+        resolve=ResolveEnum.NEW,
+        name=name or f"Compound {i}",
+        smiles="CCO",
+        npaid=None,
+        atlas_taxon_id=1,
+        origin_species="sp.",
+        origin_doi="10.1000/1",
+    )
+
+
+def test_write_key(inserter):
+    key = inserter.write_key("compound:1", "compound/", Action.INSERT)
+    assert key == inserter.write_key("compound:1", "compound/", Action.INSERT)
+    assert key != inserter.write_key("compound:2", "compound/", Action.INSERT)
+    assert key != Inserter(2).write_key("compound:1", "compound/", Action.INSERT)
+
+
+def test_applied_writes_skipped(inserter):
+    inserter.new_compound(compound(1))
+    session = use_session(inserter, FakeSession())
+    inserter.new_compound(compound(1))
+    assert session.calls == []
+    assert inserter.errors == []
+
+
+def test_changed_insert_not_repeated(inserter):
+    inserter.new_compound(compound(1))
+    session = use_session(inserter, FakeSession())
+    # Edited by a curator before the insertion is run again
+    inserter.new_compound(compound(1, name="Renamed"))
+    assert session.calls == []
+    assert len(inserter.errors) == 1
+
+
+def test_changed_update_repeated(inserter):
+    call = dict(endpoint="compound/5/name", get_data={}, action=Action.UPDATE)
+    inserter._api_call(post_data={"name": "A"}, entity="compound:1", **call)
+    session = use_session(inserter, FakeSession())
+    inserter._api_call(post_data={"name": "A"}, entity="compound:1", **call)
+    assert session.calls == []
+    inserter._api_call(post_data={"name": "B"}, entity="compound:1", **call)
+    assert len(session.calls) == 1
+
+
+def test_failed_write_not_applied(inserter):
+    use_session(inserter, FakeSession(status_code=400))
+    assert not inserter._api_call(
+        "compound/", {"name": "A"}, {}, Action.INSERT, entity="compound:1"
+    )
+    assert len(inserter.errors) == 1
+    assert inserter._newly_applied == {}
+
+
+def test_unsent_insert_retried(inserter):
+    session = use_session(inserter, FakeSession(failures=[requests.ConnectTimeout()]))
+    inserter.new_compound(compound(1))
+    assert len(session.calls) == 2
+    (_, _, timeout), _ = session.calls
+    assert timeout is not None
+    assert len(inserter._newly_applied) == 1
+
+
+@pytest.mark.parametrize(
+    "failure", [requests.ReadTimeout(), requests.ConnectionError("reset")]
+)
+def test_unanswered_insert_not_retried(inserter, failure):
+    # May have been inserted, sending it again could make a duplicate
+    session = use_session(inserter, FakeSession(failures=[failure]))
+    inserter.new_compound(compound(1))
+    assert len(session.calls) == 1
+    assert len(inserter.errors) == 1
+    assert "No response" in inserter.errors[0].api_response
+    assert inserter._newly_applied == {}
+
+
+def test_failed_insert_not_retried(inserter):
+    session = use_session(inserter, FakeSession(status_code=502))
+    inserter.new_compound(compound(1))
+    assert len(session.calls) == 1
+    assert inserter.errors[0].api_response == "Bad request"
+
+
+def test_timed_out_update_retried(inserter):
+    session = use_session(inserter, FakeSession(failures=[requests.ReadTimeout()]))
+    assert inserter._api_call(
+        "compound/5/name", {"name": "A"}, {}, Action.UPDATE, entity="compound:1"
+    )
+    assert len(session.calls) == 2
+
+
+def test_concurrent_writes(inserter):
+    session = use_session(inserter, FakeSession())
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(inserter.new_compound, [compound(i) for i in range(50)]))
+    assert len(session.calls) == 50
+    assert len(inserter._newly_applied) == 50
+    inserter.update_status(50, 50, "Inserting compounds")
+    assert inserter.progress.counts["api_writes"] == 50
@@ -0,0 +1,51 @@
+from app.checker.JournalResolver import JournalResolver
+
+JOURNALS = [
+    (1, "Journal of Natural Products", "J. Nat. Prod."),
+    (2, "Organic Letters", "Org. Lett."),
+    (3, "Journal of Organic Chemistry", "J. Org. Chem."),
+]
+ALTERNATIVES = [("j nat prod", 1), ("journal of nat products", 1), ("orphan", 99)]
+
+
+def make_resolver():
+    return JournalResolver(JOURNALS, ALTERNATIVES)
+
+
+def test_match_full_name():
+    journal = make_resolver().match("journal of natural products ")
+    assert journal.id == 1
+    assert journal.abbrev == "J. Nat. Prod."
+
+
+def test_match_abbreviation():
+    assert make_resolver().match("Org. Lett.").journal == "Organic Letters"
+
+
+def test_match_alternative():
+    assert make_resolver().match("J. Nat. Prod").id == 1
+    assert make_resolver().match("Journal of Nat. Products").id == 1
+
+
+def test_no_match():
+    resolver = make_resolver()
+    assert resolver.match("Nature") is None
+    assert resolver.match("orphan") is None
+    assert resolver.match(None) is None
+    # Leading spaces count, as they do in the database
+    assert resolver.match(" Organic Letters") is None
+
+
+def test_search_prefix():
+    resolver = make_resolver()
+    assert resolver.search("journal of") == [
+        "Journal of Natural Products",
+        "Journal of Organic Chemistry",
+    ]
+    assert resolver.search("org. l") == ["Organic Letters"]
+
+
+def test_search_alternatives_and_limit():
+    resolver = make_resolver()
+    assert resolver.search("j nat") == ["Journal of Natural Products"]
+    assert resolver.search("j", limit=1) == ["Journal of Natural Products"]
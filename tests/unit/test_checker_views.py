@@ -0,0 +1,223 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app.checker import checker as checker_blueprint
+from app.checker import views
+from app.models import Dataset
+from app.utils import progress
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def options(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def filter_by(self, **kwargs):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakePubSub:
+    """Hands out queued messages as Redis would, then nothing"""
+
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.messages = []
+        self.closed = False
+
+    def publish(self, channel, state):
+        assert channel in self.channels
+        self.messages.append(
+            {
+                "type": "message",
+                "channel": channel.encode(),
+                "data": json.dumps(state).encode(),
+            }
+        )
+
+    def get_message(self, timeout=0.0):
+        return self.messages.pop(0) if self.messages else None
+
+    def close(self):
+        self.closed = True
+
+
+def use_datasets(monkeypatch, *datasets):
+    # Dataset.query needs a database, the columns queried on don't
+    fake = SimpleNamespace(
+        id=Dataset.id,
+        checker_dataset=Dataset.checker_dataset,
+        query=FakeQuery(list(datasets)),
+    )
+    monkeypatch.setattr(views, "Dataset", fake)
+
+
+def running_dataset(ds_id):
+    return SimpleNamespace(
+        id=ds_id,
+        standard_running=lambda: False,
+        checker_running=lambda: True,
+        checker_completed=lambda: False,
+        inserted=lambda: False,
+        checker_task_id=lambda: "task-1",
+    )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Don't build the taxon indexes from the Atlas
+    monkeypatch.setattr(views, "taxon_indexes", SimpleNamespace(get=lambda: None))
+    app = Flask(__name__)
+    app.config.update(TESTING=True, LOGIN_DISABLED=True)
+    app.register_blueprint(checker_blueprint)
+    return app.test_client()
+
+
+@pytest.fixture
+def stream_state(monkeypatch):
+    state = SimpleNamespace(pubsub=None, latest={})
+
+    def subscribe(channels):
+        state.pubsub = FakePubSub(channels)
+        return state.pubsub
+
+    use_datasets(monkeypatch, running_dataset(1))
+    monkeypatch.setattr(progress, "subscribe", subscribe)
+    monkeypatch.setattr(progress, "latest", state.latest.get)
+    return state
+
+
+def read_events(response, n):
+    """The first n events of a stream, as (event, data) pairs"""
+    events = []
+    chunks = response.iter_encoded()
+    while len(events) < n:
+        chunk = next(chunks).decode()
+        if chunk.startswith("event: "):
+            event, data = chunk.strip().split("\n")
+            events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_progress_stream(client, stream_state):
+    stream_state.latest["progress:checker:1"] = {
+        "state": "PROGRESS",
+        "current": 2,
+        "total": 10,
+        "status": "Checking",
+    }
+    response = client.get("/progress/stream?dsid=1", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert stream_state.pubsub.channels == [
+        "progress:checker:1",
+        "progress:standardizer:1",
+    ]
+
+    # Published while the stream is open
+    stream_state.pubsub.publish(
+        "progress:checker:1",
+        {"state": "SUCCESS", "current": 10, "total": 10, "status": "Done"},
+    )
+    status, latest, published = read_events(response, 3)
+    response.close()
+
+    assert status == (
+        "status",
+        {
+            "standard": False,
+            "running": True,
+            "complete": False,
+            "task_id": "task-1",
+            "dataset_id": 1,
+        },
+    )
+    assert latest == (
+        "progress",
+        dict(stream_state.latest["progress:checker:1"], dataset_id=1, kind="checker"),
+    )
+    assert published[0] == "progress"
+    assert published[1]["state"] == "SUCCESS"
+    assert published[1]["kind"] == "checker"
+    assert published[1]["dataset_id"] == 1
+    assert stream_state.pubsub.closed
+
+
+def test_progress_stream_skips_stale_report(client, stream_state, monkeypatch):
+    # A checker that isn't running anymore, e.g. its worker died
+    idle = running_dataset(1)
+    idle.checker_running = lambda: False
+    use_datasets(monkeypatch, idle)
+    stream_state.latest["progress:checker:1"] = {"state": "PROGRESS", "current": 2}
+
+    response = client.get("/progress/stream?dsid=1", buffered=False)
+    stream_state.pubsub.publish("progress:checker:1", {"state": "PENDING"})
+    status, published = read_events(response, 2)
+    response.close()
+
+    assert status[0] == "status"
+    assert status[1]["running"] is False
+    assert published[1]["state"] == "PENDING"
+
+
+@pytest.mark.parametrize(
+    "query", ["/progress/stream", "/progress/stream?dsid=1&kind=other"]
+)
+def test_progress_stream_bad_request(client, stream_state, query):
+    assert client.get(query).status_code == 400
+    assert stream_state.pubsub is None
+
+
+def test_progress_stream_redis_failure(client, stream_state):
+    response = client.get("/progress/stream?dsid=1", buffered=False)
+
+    def fail(timeout=0.0):
+        raise ConnectionError("Redis went away")
+
+    stream_state.pubsub.get_message = fail
+    # Logged outside the request context, then the stream ends
+    chunks = [chunk.decode() for chunk in response.iter_encoded()]
+    assert chunks[-1].startswith("event: status")
+    assert stream_state.pubsub.closed
+
+
+@pytest.mark.parametrize(
+    "query, use_snapshot",
+    [("", False), ("?snapshot=0", False), ("?snapshot=false", False)]
+    + [("?snapshot=1", True), ("?snapshot=true", True), ("?snapshot=Yes", True)],
+)
+def test_start_checker_snapshot_flag(client, monkeypatch, query, use_snapshot):
+    started = []
+    monkeypatch.setattr(views, "reset_progress", lambda *args: None)
+    monkeypatch.setattr(
+        views,
+        "start_checker_task",
+        SimpleNamespace(delay=lambda **kwargs: started.append(kwargs)),
+    )
+    # No checker dataset to update, the task has been started by then
+    monkeypatch.setattr(views, "CheckerDataset", SimpleNamespace(query=FakeQuery([])))
+    assert client.post(f"/checkerstart/dataset1{query}").status_code == 404
+    assert started[0]["use_snapshot"] is use_snapshot
+
+
+def test_indexes_started_once(client, monkeypatch):
+    started = []
+    monkeypatch.setattr(
+        views, "taxon_indexes", SimpleNamespace(get=lambda: started.append(1))
+    )
+    client.get("/progress/stream")
+    client.get("/progress/stream")
+    assert started == [1]
@@ -1,7 +1,33 @@
+import pytest
+import requests
+
 from app.utils import atlas_api
+from app.utils.cache_store import MISSING
 
 
 def test_prefix_url():
     url = "compound/1"
     expected = "https://npatlas-dev.chem.sfu.ca/api/v1/compound/1"
     assert atlas_api.prefix_url(url) == expected
+
+
+class FakeResponse:
+    status_code = 422
+
+    def json(self):
+        return {"detail": "Invalid query"}
+
+    def raise_for_status(self):
+        raise requests.HTTPError("422 Client Error", response=self)
+
+
+@pytest.mark.parametrize("endpoint", ["search_inchikey", "search_name", "search_taxa"])
+def test_error_response_not_cached(monkeypatch, endpoint):
+    stored = []
+    fn = getattr(atlas_api, endpoint)
+    monkeypatch.setattr(atlas_api.client, "request", lambda *a, **kw: FakeResponse())
+    monkeypatch.setattr(fn.cache, "get", lambda key: MISSING)
+    monkeypatch.setattr(fn.cache, "set", lambda key, value: stored.append(value))
+    with pytest.raises(requests.HTTPError):
+        fn("query")
+    assert stored == []
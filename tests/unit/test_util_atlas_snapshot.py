@@ -0,0 +1,46 @@
+import pytest
+
+from app.utils.atlas_snapshot import AtlasSnapshot
+
+COMPOUNDS = [
+    {
+        "npaid": "NPA000001",
+        "original_name": "Penicillin G",
+        "inchikey": "JGSARLDLIJGVTE-MBNYWOFBSA-N",
+    },
+    {
+        "npaid": 2,
+        "original_name": "Penicillin_X",
+        "inchikey": "JGSARLDLIJGVTE-UHFFFAOYSA-N",
+    },
+]
+TAXA = [{"id": 10, "name": "Penicillium", "rank": "genus"}]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.sqlite")
+    assert AtlasSnapshot.build(path, COMPOUNDS, TAXA) == (2, 1)
+    return AtlasSnapshot(path)
+
+
+def test_search_inchikey_full(snapshot):
+    res = snapshot.search_inchikey("JGSARLDLIJGVTE-MBNYWOFBSA-N")
+    assert [x["npaid"] for x in res] == [1]
+
+
+def test_search_inchikey_flat(snapshot):
+    assert len(snapshot.search_inchikey("JGSARLDLIJGVTE")) == 2
+
+
+def test_search_name(snapshot):
+    assert len(snapshot.search_name("penicillin")) == 2
+    assert [x["npaid"] for x in snapshot.search_name("n_X")] == [2]
+    assert snapshot.search_name("Not named") == []
+
+
+def test_search_taxa(snapshot):
+    assert snapshot.search_taxa(" penicillium ") == [
+        {"id": 10, "name": "Penicillium", "rank": "genus"}
+    ]
+    assert snapshot.search_taxa("Aspergillus") == []
@@ -0,0 +1,33 @@
+import time
+
+from app.utils.cache_store import SQLiteBackend
+
+
+def test_sqlite_get_set(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite"))
+    backend.set("ns", "key", '"value"', ttl=60, max_entries=10)
+    assert backend.get("ns", "key") == '"value"'
+    assert backend.get("other", "key") is None
+
+
+def test_sqlite_ttl(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite"))
+    backend.set("ns", "key", "1", ttl=0, max_entries=10)
+    assert backend.get("ns", "key") is None
+
+
+def test_sqlite_lru_eviction(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite"))
+    for key in ("a", "b", "c"):
+        backend.set("ns", key, "1", ttl=60, max_entries=2)
+        time.sleep(0.01)
+    assert backend.get("ns", "a") is None
+    assert backend.get("ns", "b") == "1"
+    assert backend.get("ns", "c") == "1"
+
+
+def test_sqlite_clear(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite"))
+    backend.set("ns", "key", "1", ttl=60, max_entries=10)
+    backend.clear("ns")
+    assert backend.get("ns", "key") is None
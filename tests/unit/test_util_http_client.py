@@ -0,0 +1,145 @@
+import socket
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from app.utils import http_client
+from app.utils.http_client import HttpClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class FakeSession:
+    """Returns (or raises) the given outcomes in turn"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def make_client(*outcomes, **kwargs):
+    session = FakeSession(*outcomes)
+    return HttpClient(max_retries=2, session=session, **kwargs), session
+
+
+def test_retry_after(sleeps):
+    client, session = make_client(
+        FakeResponse(429, {"Retry-After": "3"}), FakeResponse(200)
+    )
+    assert client.request("GET", "http://x", "ep").status_code == 200
+    assert sleeps == [3.0]
+    stats = client.stats["ep"]
+    assert (stats.calls, stats.errors, stats.retries) == (2, 1, 1)
+
+
+def test_retry_after_capped(sleeps):
+    client, _ = make_client(
+        FakeResponse(429, {"Retry-After": "600"}), FakeResponse(200), max_backoff=5
+    )
+    client.request("GET", "http://x")
+    assert sleeps == [5]
+
+
+def test_retry_server_error(sleeps):
+    client, session = make_client(
+        FakeResponse(502), FakeResponse(503), FakeResponse(200), backoff=0.5
+    )
+    assert client.request("GET", "http://x").status_code == 200
+    assert session.calls == 3
+    # Jittered exponential backoff
+    assert 0 <= sleeps[0] <= 0.5
+    assert 0 <= sleeps[1] <= 1.0
+
+
+def test_retry_connection_error(sleeps):
+    client, session = make_client(
+        requests.ConnectionError("refused"), requests.Timeout("slow"), FakeResponse(200)
+    )
+    assert client.request("GET", "http://x", "ep").status_code == 200
+    assert session.calls == 3
+    assert client.stats["ep"].errors == 2
+
+
+def test_out_of_attempts_status(sleeps):
+    client, session = make_client(*(FakeResponse(503) for _ in range(3)))
+    with pytest.raises(requests.HTTPError):
+        client.request("GET", "http://x", "ep")
+    assert session.calls == 3
+    stats = client.stats["ep"]
+    assert (stats.calls, stats.errors, stats.retries) == (3, 3, 2)
+
+
+def test_out_of_attempts_connection_error(sleeps):
+    client, session = make_client(*(requests.ConnectionError() for _ in range(3)))
+    with pytest.raises(requests.ConnectionError):
+        client.request("GET", "http://x")
+    assert session.calls == 3
+
+
+def test_other_status_not_retried(sleeps):
+    client, session = make_client(FakeResponse(404))
+    assert client.request("GET", "http://x", "ep").status_code == 404
+    assert session.calls == 1
+    assert sleeps == []
+    assert client.stats["ep"].errors == 0
+
+
+def refused():
+    """The error requests raises when nothing listens on the port"""
+    return requests.ConnectionError(
+        MaxRetryError(None, "/", NewConnectionError(None, "Connection refused"))
+    )
+
+
+@pytest.mark.parametrize(
+    "failure", [FakeResponse(502), requests.ReadTimeout(), requests.ConnectionError()]
+)
+def test_write_not_retried_once_sent(sleeps, failure):
+    client, session = make_client(failure, FakeResponse(200))
+    with pytest.raises(requests.RequestException):
+        client.request("POST", "http://x", idempotent=False)
+    assert session.calls == 1
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [FakeResponse(429), requests.ConnectTimeout(), refused()],
+)
+def test_write_retried_when_never_applied(sleeps, failure):
+    client, session = make_client(failure, FakeResponse(200))
+    assert client.request("POST", "http://x", idempotent=False).status_code == 200
+    assert session.calls == 2
+
+
+def test_never_sent_connection_refused():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # Nothing listens on the port any more
+    with pytest.raises(requests.ConnectionError) as e:
+        requests.post(f"http://127.0.0.1:{port}", timeout=1)
+    assert http_client.never_sent(e.value)
+    assert not http_client.never_sent(requests.ConnectionError("reset"))
@@ -0,0 +1,46 @@
+from app.utils.prefix_index import BackgroundRefresh, PrefixIndex
+
+TAXA = ["Streptomyces", "Streptococcus", "Strepto", "Aspergillus", "Penicillium"]
+
+
+def test_prefix_search():
+    index = PrefixIndex(TAXA)
+    assert index.search("asp") == ["Aspergillus"]
+    assert index.search("xyz") == []
+    assert index.search("") == []
+
+
+def test_prefix_search_ranking():
+    index = PrefixIndex(TAXA)
+    # Exact match first, then shorter names
+    assert index.search("strepto") == ["Strepto", "Streptomyces", "Streptococcus"]
+
+
+def test_prefix_search_limit():
+    index = PrefixIndex(TAXA)
+    assert index.search("s", limit=2) == ["Strepto", "Streptomyces"]
+
+
+def test_prefix_search_weights_and_keys():
+    index = PrefixIndex(
+        [("Journal of Natural Products", 0), ("Natural Product Reports", 1)],
+        keys=lambda value: (value, value.replace("Journal of ", "")),
+    )
+    assert index.search("natural") == [
+        "Journal of Natural Products",
+        "Natural Product Reports",
+    ]
+
+
+def test_background_refresh():
+    calls = []
+
+    def load():
+        calls.append(1)
+        return len(calls)
+
+    value = BackgroundRefresh(load, max_age=3600)
+    value.refresh(wait=True)
+    assert value.get() == 1
+    assert value.get() == 1
+    assert len(calls) == 1
@@ -0,0 +1,119 @@
+import pytest
+
+from app.utils import progress
+from app.utils.progress import ProgressReporter, combine, summarize
+
+
+class FakeTask:
+    def __init__(self):
+        self.states = []
+
+    def update_state(self, task_id=None, state=None, meta=None):
+        self.states.append((task_id, state, meta))
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_REDIS_URL", "none")
+
+
+def test_reports_are_throttled():
+    task = FakeTask()
+    reporter = ProgressReporter("progress:test:1", task=task, interval=60, step=0.1)
+    for i in range(100):
+        reporter.update(i, 100, f"Item {i}")
+    # The first update, then one per 10% of the total
+    assert [meta["current"] for _, _, meta in task.states] == list(range(0, 100, 10))
+    reporter.finish()
+    _, state, meta = task.states[-1]
+    assert state == "PROGRESS"
+    assert meta["current"] == meta["total"] == 100
+    assert meta["status"] == "Done"
+
+
+def test_reports_on_interval():
+    task = FakeTask()
+    reporter = ProgressReporter("progress:test:1", task=task, interval=0, step=1)
+    for i in range(5):
+        reporter.update(i, 100, "Working")
+    assert len(task.states) == 5
+
+
+def test_report_to_other_task():
+    task = FakeTask()
+    reporter = ProgressReporter("progress:test:1", task=task, task_id="parent")
+    reporter.update(1, 2, "Working")
+    assert task.states[0][0] == "parent"
+
+
+def test_counts():
+    task = FakeTask()
+    reporter = ProgressReporter("progress:test:1", task=task)
+    reporter.add("compounds", 3)
+    reporter.add("compounds", 2)
+    reporter.finish()
+    assert task.states[-1][2]["counts"] == {"compounds": 5}
+
+
+def test_summarize():
+    state = summarize(
+        {
+            "current": 25,
+            "total": 100,
+            "cache_hits": 3,
+            "cache_lookups": 4,
+            "elapsed": 10.0,
+        }
+    )
+    assert state["cache_hit_rate"] == 0.75
+    assert state["eta"] == pytest.approx(30.0)
+
+
+def test_summarize_nothing_done():
+    state = summarize(
+        {"current": 0, "total": 10, "cache_hits": 0, "cache_lookups": 0, "elapsed": 0}
+    )
+    assert state["cache_hit_rate"] is None
+    assert state["eta"] is None
+
+
+def test_combine_parts():
+    parts = [
+        {"current": 10, "total": 20, "counts": {"compounds": 30}, "elapsed": 10.0},
+        {"current": 5, "total": 20, "counts": {"compounds": 10}, "elapsed": 5.0},
+        # Not started yet
+        {"current": 0, "total": 20, "counts": {}},
+    ]
+    state = summarize(combine(parts, status="Checking"))
+    assert state["current"] == 15
+    assert state["total"] == 60
+    assert state["counts"] == {"compounds": 40}
+    assert state["status"] == "Checking"
+    # Two parts each doing one a second
+    assert state["eta"] == pytest.approx(22.5)
+
+
+def test_parse_channel():
+    channel = progress.channel_name("checker", 12)
+    assert progress.parse_channel(channel) == ("checker", 12)
+
+
+def test_finish_reports_success(monkeypatch):
+    published = []
+    monkeypatch.setattr(progress, "publish", lambda c, s: published.append(s))
+    reporter = ProgressReporter("progress:test:1")
+    reporter.update(1, 2, "Working", force=True)
+    reporter.finish("Inserted", result="No errors")
+    assert [s["state"] for s in published] == ["PROGRESS", "SUCCESS"]
+    assert published[-1]["result"] == "No errors"
+
+
+def test_failures_published(monkeypatch):
+    published = []
+    monkeypatch.setattr(progress, "publish", lambda c, s: published.append((c, s)))
+    with pytest.raises(ValueError):
+        with progress.failures_published("progress:test:1"):
+            raise ValueError("Bad dataset")
+    assert published == [
+        ("progress:test:1", {"state": "FAILURE", "status": "Bad dataset"})
+    ]
@@ -0,0 +1,185 @@
+import time
+
+import pytest
+import requests
+
+from app.utils import pubchem_smiles_standardizer as pubchem
+from app.utils.Compound import Compound
+from app.utils.http_client import RateLimiter, SharedRateLimiter
+
+
+def fake_pug(monkeypatch, polls_needed):
+    polls = {}
+
+    def submit(smiles):
+        return f"req-{smiles}", None
+
+    def poll(reqid):
+        polls[reqid] = polls.get(reqid, 0) + 1
+        smiles = reqid[len("req-") :]
+        if polls[reqid] < polls_needed.get(smiles, 1):
+            return False, None
+        return True, smiles.lower()
+
+    monkeypatch.setattr(pubchem, "submit_PCT", submit)
+    monkeypatch.setattr(pubchem, "poll_PCT_result", poll)
+    return polls
+
+
+def test_standardize_many(monkeypatch):
+    polls = fake_pug(monkeypatch, {"CCO": 2})
+    res = pubchem.standardize_many(["CCO", "CCN", "CCO"], poll_interval=0)
+    assert res == {"CCO": "cco", "CCN": "ccn"}
+    assert polls == {"req-CCO": 2, "req-CCN": 1}
+
+
+def test_standardize_many_gives_up(monkeypatch):
+    fake_pug(monkeypatch, {"CCO": 10})
+    res = pubchem.standardize_many(["CCO"], max_polls=3, poll_interval=0)
+    assert isinstance(res["CCO"], TimeoutError)
+
+
+def test_standardize_many_invalid(monkeypatch):
+    fake_pug(monkeypatch, {})
+    res = pubchem.standardize_many(["not a smiles"], poll_interval=0)
+    assert isinstance(res["not a smiles"], TypeError)
+
+
+class PugResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+
+def fake_pug_requests(monkeypatch, poll_response):
+    """PUG accepting every job, and answering polls with poll_response"""
+
+    def request(method, url, endpoint=None, data=None, **kwargs):
+        if endpoint == "pug_submit":
+            return PugResponse("<PCT-Waiting_reqid>123</PCT-Waiting_reqid>")
+        return poll_response
+
+    monkeypatch.setattr(pubchem.client, "request", request)
+
+
+def test_standardize_many_failed_poll(monkeypatch):
+    fake_pug_requests(monkeypatch, PugResponse("Bad gateway", status_code=502))
+    res = pubchem.standardize_many(["CCO"], poll_interval=0)
+    assert isinstance(res["CCO"], requests.HTTPError)
+
+
+def test_standardize_many_pug_failure(monkeypatch):
+    fake_pug_requests(monkeypatch, PugResponse('<PCT-Status value="input-error"/>'))
+    res = pubchem.standardize_many(["CCO"], poll_interval=0)
+    assert isinstance(res["CCO"], ValueError)
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """Results the standardized SMILES store would keep"""
+    recorded = {}
+    monkeypatch.setattr(pubchem.smiles_store, "record_many", recorded.update)
+    return recorded
+
+
+@pytest.mark.parametrize(
+    "poll_response",
+    [
+        PugResponse("Bad gateway", status_code=502),
+        PugResponse('<PCT-Status value="server-error"/>'),
+    ],
+)
+def test_failed_poll_not_recorded(monkeypatch, recorded, poll_response):
+    fake_pug_requests(monkeypatch, poll_response)
+    res = pubchem.standardize_many(["CCO"], poll_interval=0)
+    assert isinstance(res["CCO"], requests.RequestException)
+    assert recorded == {}
+
+
+def test_rejected_structure_recorded_as_error(monkeypatch, recorded):
+    fake_pug_requests(monkeypatch, PugResponse('<PCT-Status value="input-error"/>'))
+    pubchem.standardize_many(["CCO"], poll_interval=0)
+    assert isinstance(recorded["CCO"], ValueError)
+
+
+def test_get_standardized_smiles_failed_poll(monkeypatch, recorded):
+    fake_pug_requests(monkeypatch, PugResponse('<PCT-Status value="server-error"/>'))
+    with pytest.raises(pubchem.PugServiceError):
+        pubchem.get_standardized_smiles("CCO")
+    assert recorded == {}
+
+
+def test_get_standardized_smiles_timeout(monkeypatch):
+    class Response:
+        status_code = 200
+        # Queued jobs have a success status but no structure yet
+        text = (
+            "<PCT-Waiting_reqid>123</PCT-Waiting_reqid>\n"
+            '<PCT-Status value="success"/>'
+        )
+
+    timeouts = []
+
+    def request(method, url, endpoint=None, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        return Response()
+
+    monkeypatch.setattr(pubchem.client, "request", request)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pubchem.get_standardized_smiles("CCO", max_retry=100, timeout=0.5)
+    assert time.monotonic() - start < 2
+    # Every request is bounded by what's left of the deadline
+    assert all(max(t) <= 0.5 for t in timeouts)
+
+
+@pytest.mark.parametrize(
+    "stored, smiles", [("OCC", "OCC"), (TypeError("TypeError: bad"), "CCO")]
+)
+def test_compound_uses_stored_result(monkeypatch, stored, smiles):
+    lookups = []
+
+    def lookup(in_smiles):
+        lookups.append(in_smiles)
+        return stored
+
+    def request(*args, **kwargs):
+        raise AssertionError("Stored structures aren't sent to PubChem")
+
+    monkeypatch.setattr(pubchem, "STANDARDIZER", "pubchem")
+    monkeypatch.setattr(pubchem.smiles_store, "lookup", lookup)
+    monkeypatch.setattr(pubchem.client, "request", request)
+    assert Compound("CCO", standardize=True).smiles == smiles
+    assert lookups == ["CCO"]
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(100)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_shared_rate_limiter_waits_for_slot(monkeypatch):
+    limiter = SharedRateLimiter("test", 5)
+    reserved = []
+
+    def reserve_slot(keys, args):
+        reserved.append((keys, args))
+        return 150  # ms until this call's slot
+
+    limiter._script = reserve_slot
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    limiter.wait()
+    assert reserved == [(["ratelimit:test"], [200.0])]
+    assert sleeps == [0.15]
+
+
+def test_shared_rate_limiter_without_redis():
+    limiter = SharedRateLimiter("test", 100, url="none")
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.04
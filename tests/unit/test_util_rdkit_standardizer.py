@@ -0,0 +1,41 @@
+import pytest
+
+from app.utils.rdkit_standardizer import compare, parity, standardize_smiles
+
+
+def test_standardize_canonical():
+    assert standardize_smiles("OCC") == standardize_smiles("CCO")
+
+
+def test_standardize_largest_fragment():
+    assert "." not in standardize_smiles("CC(=O)O.Cl")
+
+
+def test_standardize_nitro():
+    assert standardize_smiles("CN(=O)=O") == standardize_smiles("C[N+](=O)[O-]")
+
+
+def test_standardize_tautomer():
+    assert standardize_smiles("Oc1ccccn1") == standardize_smiles("O=c1cccc[nH]1")
+
+
+def test_standardize_invalid():
+    with pytest.raises(TypeError):
+        standardize_smiles("not a smiles")
+
+
+def test_compare():
+    assert compare("CCO", "OCC") == "identical"
+    assert compare("CCO", "CCN") == "different"
+    assert compare("C[C@H](N)O", "C[C@@H](N)O") == "connectivity"
+    assert compare("CCO", "not a smiles") == "invalid"
+
+
+def test_parity():
+    report = parity([("OCC", "CCO"), ("CCN", "CCO"), ("xyz", "CCO")])
+    assert report.total == 3
+    assert report.counts["identical"] == 1
+    assert report.counts["different"] == 1
+    assert report.counts["error"] == 1
+    assert len(report.mismatches) == 2
+    assert report.fraction("identical") == pytest.approx(1 / 3)
@@ -0,0 +1,82 @@
+import os
+import time
+
+import billiard
+import pytest
+
+from app.utils import structure_processing
+from app.utils.structure_processing import process_structure, process_structures
+
+SMILES = ["CCO", "c1ccccc1", "CC(=O)O", "CCN", "OC1CCCCC1", "CC#N"]
+
+
+def worker_pid(args):
+    return os.getpid()
+
+
+def test_parallel_matches_serial():
+    structures = [(smiles, "Test") for smiles in SMILES]
+    records = process_structures(structures, max_workers=2)
+    assert records == [process_structure(smiles, "Test") for smiles in SMILES]
+
+
+def test_parallel_in_worker_pid(monkeypatch):
+    monkeypatch.setattr(structure_processing, "_process", worker_pid)
+    pids = process_structures([(s, "Test") for s in SMILES], max_workers=2)
+    assert os.getpid() not in pids
+
+
+def _run_in_daemon(queue):
+    structure_processing._process = worker_pid
+    pids = process_structures([(s, "Test") for s in SMILES], max_workers=2)
+    queue.put((os.getpid(), pids))
+
+
+def test_parallel_in_daemon_process():
+    # Like a Celery prefork worker process
+    queue = billiard.Queue()
+    daemon = billiard.Process(target=_run_in_daemon, args=(queue,), daemon=True)
+    daemon.start()
+    daemon_pid, pids = queue.get(timeout=30)
+    daemon.join()
+    assert len(pids) == len(SMILES)
+    assert daemon_pid not in pids
+
+
+def slow(args):
+    # Leaves its pid behind, to check it's been killed
+    open(os.path.join(os.environ["SLOW_PIDS"], str(os.getpid())), "w").close()
+    time.sleep(60)
+
+
+def test_parallel_timeout(monkeypatch, tmp_path):
+    monkeypatch.setattr(structure_processing, "_process", slow)
+    monkeypatch.setenv("SLOW_PIDS", str(tmp_path))
+    start = time.monotonic()
+    records = process_structures(
+        [(s, "Test") for s in SMILES], max_workers=2, timeout=0.5
+    )
+    # Not left to finish the structures they were given
+    assert time.monotonic() - start < 60
+    assert all(isinstance(r, TimeoutError) for r in records)
+    pids = [int(pid) for pid in os.listdir(tmp_path)]
+    assert len(pids) == 2
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def crash(args):
+    if args[0] == "CCN":
+        os._exit(1)
+    return args[0]
+
+
+def test_parallel_worker_died(monkeypatch):
+    monkeypatch.setattr(structure_processing, "_process", crash)
+    records = process_structures([(s, "Test") for s in SMILES], max_workers=2)
+    assert len(records) == len(SMILES)
+    lost = [s for s, r in zip(SMILES, records) if isinstance(r, ValueError)]
+    assert "CCN" in lost
+    # Other chunks are still processed
+    assert [r for r in records if not isinstance(r, ValueError)]